@@ -0,0 +1,283 @@
+"""
+Служебные команды администраторов: текущие показатели бота, самые большие
+диалоги, рост памяти за интервал (tracemalloc) и выборочное профилирование CPU
+
+Команды доступны только пользователям из ADMIN_USER_IDS; сообщения остальных
+пользователей обрабатываются как обычный текст. Показатели собираются из
+счетчиков, которые модули уже поддерживают инкрементально, поэтому команды
+можно выполнять в рабочем окружении. Снимок памяти и профилирование ограничены
+по времени (ADMIN_PROFILE_MAX_SECONDS) и не выполняются одновременно.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from aiogram import Dispatcher
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from bot.idempotency import get_idempotency_stats
+from bot.prefetch import get_warmup_stats
+from bot.runtime import get_runtime_info
+from bot.sender import get_send_queue_stats, send_text
+from bot.shutdown import get_in_flight_count
+from bot.throttling import get_throttle_stats
+from bot.typing_indicator import get_typing_stats
+from config import get_admin_user_ids, get_admin_profile_max_seconds, get_loop_lag_interval
+from llm.budget import get_budget_stats
+from llm.client import get_circuit_state, get_llm_in_flight
+from llm.leads import get_lead_stats
+from llm.memory import get_dialog_bytes_by_length, get_dialog_stats, get_history_length_histogram, get_largest_dialogs
+
+logger = logging.getLogger(__name__)
+
+# Количество последних измерений задержки цикла событий
+LAG_WINDOW = 300
+
+# Интервал выборки стеков при профилировании (секунды)
+PROFILE_SAMPLE_INTERVAL = 0.005
+
+_started_at = time.monotonic()
+_loop_lag: Deque[float] = deque(maxlen=LAG_WINDOW)
+_loop_lag_max = 0.0
+
+# Снимок памяти и профилирование выполняются по одному
+_profiling_lock = asyncio.Lock()
+
+def is_admin(message: Message) -> bool:
+    """Фильтр служебных команд: отправитель входит в ADMIN_USER_IDS"""
+    return message.from_user is not None and message.from_user.id in get_admin_user_ids()
+
+async def monitor_loop_lag(interval: Optional[float] = None) -> None:
+    """
+    Фоновая задача: измерять задержку цикла событий — насколько позже
+    запланированного просыпается задача, ожидающая interval секунд
+
+    Args:
+        interval: Интервал измерения в секундах (по умолчанию LOOP_LAG_INTERVAL)
+    """
+    global _loop_lag_max
+    if interval is None:
+        interval = get_loop_lag_interval()
+    loop = asyncio.get_running_loop()
+
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - scheduled)
+        _loop_lag.append(lag)
+        _loop_lag_max = max(_loop_lag_max, lag)
+
+def get_loop_lag_stats() -> Dict[str, float]:
+    """
+    Получить задержку цикла событий за последние LAG_WINDOW измерений
+
+    Returns:
+        Словарь с last, p50, p99 и max (секунды); max — за все время работы
+    """
+    lags = sorted(_loop_lag)
+    if not lags:
+        return {"last": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "last": round(_loop_lag[-1], 4),
+        "p50": round(lags[len(lags) // 2], 4),
+        "p99": round(lags[min(len(lags) - 1, int(len(lags) * 0.99))], 4),
+        "max": round(_loop_lag_max, 4),
+    }
+
+def _rate(hits: int, total: int) -> Optional[float]:
+    """Доля попаданий или None, если обращений не было"""
+    return round(hits / total, 3) if total else None
+
+def collect_runtime_stats() -> Dict[str, Any]:
+    """
+    Собрать текущие показатели бота
+
+    Returns:
+        Словарь показателей по подсистемам
+    """
+    dialog_stats = get_dialog_stats()
+    idempotency = get_idempotency_stats()
+    typing = get_typing_stats()
+    warmup = get_warmup_stats()
+    duplicates = idempotency["duplicates_skipped"] + idempotency["duplicates_attached"]
+    typing_actions = typing["actions_sent"] + typing["actions_coalesced"]
+
+    return {
+        "runtime": {
+            "uptime": round(time.monotonic() - _started_at),
+            "tasks": len(asyncio.all_tasks()),
+            "loop_lag": get_loop_lag_stats(),
+            **get_runtime_info(),
+        },
+        "updates_in_flight": get_in_flight_count(),
+        "llm": {
+            "in_flight": get_llm_in_flight(),
+            "circuit": get_circuit_state(),
+            "warmup": warmup,
+        },
+        "send_queue": get_send_queue_stats(),
+        "throttling": get_throttle_stats(),
+        "dialogs": dialog_stats,
+        "dialog_memory": {
+            "chats_by_length": get_history_length_histogram(),
+            "bytes_by_length": get_dialog_bytes_by_length(),
+        },
+        # Доли повторного использования: общие тексты сообщений, повторные доставки
+        # обновлений, объединенные статусы "печатает", успешные прогревы LLM
+        "caches": {
+            "blob_reuse": _rate(dialog_stats["blob_refs"] - dialog_stats["unique_blobs"], dialog_stats["blob_refs"]),
+            "duplicate_updates": _rate(duplicates, idempotency["processed"] + duplicates),
+            "typing_coalesced": _rate(typing["actions_coalesced"], typing_actions),
+            "llm_warmup": _rate(warmup["completed"], warmup["started"]),
+        },
+        "budget": get_budget_stats(),
+        "leads": get_lead_stats(),
+    }
+
+async def trace_memory_growth(seconds: float, limit: int = 10) -> str:
+    """
+    Сравнить снимки tracemalloc в начале и в конце интервала
+
+    Если трассировка не была включена, она включается на время интервала,
+    поэтому учитываются только выделения памяти внутри интервала.
+
+    Args:
+        seconds: Длительность интервала
+        limit: Количество строк кода с наибольшим ростом
+
+    Returns:
+        Текстовая сводка
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+    differences = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+    growth = sum(stat.size_diff for stat in differences)
+
+    lines = [f"🧠 Memory growth over {seconds:g}s: {growth / 1024:+.1f} KiB"]
+    for stat in differences[:limit]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d}) "
+                     f"{os.path.basename(frame.filename)}:{frame.lineno}")
+    return "\n".join(lines)
+
+def _frame_label(frame: Any) -> str:
+    """Подпись функции кадра стека"""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _sample_stacks(thread_id: int, seconds: float, interval: float) -> Tuple[int, Counter, Counter]:
+    """
+    Периодически снимать стек потока через sys._current_frames()
+
+    Returns:
+        (число выборок, выборки по функции на вершине стека, выборки по функции в любом месте стека)
+    """
+    own: Counter = Counter()
+    total: Counter = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            samples += 1
+            own[_frame_label(frame)] += 1
+            seen = set()
+            while frame is not None:
+                label = _frame_label(frame)
+                if label not in seen:
+                    seen.add(label)
+                    total[label] += 1
+                frame = frame.f_back
+        time.sleep(interval)
+    return samples, own, total
+
+async def profile_cpu(seconds: float, limit: int = 10, interval: float = PROFILE_SAMPLE_INTERVAL) -> str:
+    """
+    Выборочное профилирование потока цикла событий: стек снимается из
+    отдельного потока, поэтому профилируемый код не замедляется трассировкой
+
+    Args:
+        seconds: Длительность профилирования
+        limit: Количество функций в сводке
+        interval: Интервал выборки (секунды)
+
+    Returns:
+        Текстовая сводка; ожидание в select() означает простой цикла событий
+    """
+    thread_id = threading.get_ident()
+    samples, own, total = await asyncio.to_thread(_sample_stacks, thread_id, seconds, interval)
+    if not samples:
+        return "🔬 No samples collected"
+
+    lines = [f"🔬 CPU profile over {seconds:g}s: {samples} samples", "Self:"]
+    lines += [f"{count / samples:6.1%} {label}" for label, count in own.most_common(limit)]
+    lines.append("Total:")
+    lines += [f"{count / samples:6.1%} {label}" for label, count in total.most_common(limit)]
+    return "\n".join(lines)
+
+def _parse_seconds(command: CommandObject, default: float) -> float:
+    """Разобрать длительность из аргумента команды, ограничив ADMIN_PROFILE_MAX_SECONDS"""
+    try:
+        seconds = float(command.args) if command.args else default
+    except ValueError:
+        seconds = default
+    return min(max(seconds, 0.1), get_admin_profile_max_seconds())
+
+async def cmd_admin_stats(message: Message):
+    """Обработчик команды /admin_stats: текущие показатели"""
+    logger.info(f"🛠 ADMIN STATS | User: {message.from_user.id}")
+    stats = collect_runtime_stats()
+    await send_text(message, json.dumps(stats, ensure_ascii=False, indent=1, default=str))
+
+async def cmd_admin_top(message: Message, command: CommandObject):
+    """Обработчик команды /admin_top [N]: самые большие диалоги"""
+    limit = int(command.args) if command.args and command.args.isdigit() else 10
+    logger.info(f"🛠 ADMIN TOP | User: {message.from_user.id} | Limit: {limit}")
+    largest = get_largest_dialogs(limit)
+    if not largest:
+        await send_text(message, "Диалогов в памяти нет.")
+        return
+    lines = [f"{chat_id}: {messages} messages, {size / 1024:.1f} KiB" for chat_id, messages, size in largest]
+    await send_text(message, "\n".join(lines))
+
+async def _run_exclusive(message: Message, action: str, job: Any) -> None:
+    """Выполнить снимок памяти или профилирование, если другое такое действие не выполняется"""
+    if _profiling_lock.locked():
+        job.close()
+        await send_text(message, "Уже выполняется другой снимок или профилирование, попробуйте позже.")
+        return
+    async with _profiling_lock:
+        logger.info(f"🛠 ADMIN {action} | User: {message.from_user.id}")
+        await send_text(message, await job)
+
+async def cmd_admin_memory(message: Message, command: CommandObject):
+    """Обработчик команды /admin_memory [секунды]: рост памяти за интервал"""
+    await _run_exclusive(message, "MEMORY", trace_memory_growth(_parse_seconds(command, 10)))
+
+async def cmd_admin_profile(message: Message, command: CommandObject):
+    """Обработчик команды /admin_profile [секунды]: выборочное профилирование CPU"""
+    await _run_exclusive(message, "PROFILE", profile_cpu(_parse_seconds(command, 5)))
+
+def setup_admin(dp: Dispatcher) -> None:
+    """Зарегистрировать служебные команды (до обработчика обычных сообщений)"""
+    dp.message.register(cmd_admin_stats, Command("admin_stats"), is_admin)
+    dp.message.register(cmd_admin_top, Command("admin_top"), is_admin)
+    dp.message.register(cmd_admin_memory, Command("admin_memory"), is_admin)
+    dp.message.register(cmd_admin_profile, Command("admin_profile"), is_admin)
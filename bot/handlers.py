@@ -1,11 +1,28 @@
 import logging
+import time
 from aiogram import Dispatcher
 from aiogram.types import Message
 from aiogram.filters import Command
-from llm.client import get_llm_response
+from llm.client import fit_messages_to_budget, get_llm_response, validate_messages
 from llm.prompts import get_system_prompt, get_base_system_prompt
-from llm.memory import add_message_to_dialog, get_dialog_history, clear_dialog_history
-from llm.services import get_all_services, get_company_info
+from llm.memory import (
+    add_message_to_dialog_async,
+    add_message_and_get_history_async,
+    clear_dialog_history_async,
+    update_service_relevance,
+)
+from llm.services import find_relevant_service_scores
+from llm.budget import get_budget_action, record_usage
+from llm.leads import submit_lead
+from llm.logging_utils import metrics_logger, log_user_interaction, log_content
+from bot.responses import get_command_response, get_history_entry
+from bot.throttling import ThrottlingMiddleware
+from bot.idempotency import IdempotencyMiddleware
+from bot.admin import setup_admin
+from bot.sender import send_text
+from bot.prefetch import cancel_llm_warmup, schedule_llm_warmup
+from bot.typing_indicator import typing_indicator
+from config import get_llm_max_message_chars, get_budget_fallback_model, get_budget_shrink_messages
 
 logger = logging.getLogger(__name__)
 
@@ -15,28 +32,20 @@ async def cmd_start(message: Message):
     user_id = message.from_user.id if message.from_user else "unknown"
     user_name = message.from_user.full_name if message.from_user else "Unknown"
     logger.info(f"🚀 START COMMAND | Chat: {chat_id} | User: {user_name} ({user_id})")
+    metrics_logger.log_command_usage("start", str(user_id), chat_id)
     
     # Очищаем историю диалога при старте
-    clear_dialog_history(chat_id)
+    await clear_dialog_history_async(chat_id)
     
-    company_info = get_company_info()
-    company_name = company_info.get('name', 'Sign Language Interface')
-    
-    welcome_message = "👋 Добро пожаловать в " + company_name + "!\n\n"
-    welcome_message += "Я — ваш консультант по решениям в области жестового языка и распознавания жестов. "
-    welcome_message += "Наша компания специализируется на создании доступных технологий для людей, использующих жестовые языки.\n\n"
-    welcome_message += "🔧 **Доступные команды:**\n"
-    welcome_message += "/services — Посмотреть все наши услуги\n"
-    welcome_message += "/help — Справка по использованию бота\n"
-    welcome_message += "/contact — Контактная информация\n\n"
-    welcome_message += "💬 **Как начать:**\n"
-    welcome_message += "Просто опишите вашу задачу или проект, и я помогу подобрать подходящие решения из нашего портфеля услуг.\n\n"
-    welcome_message += "Расскажите, что вас интересует в области жестовых технологий?"
+    welcome_message = get_command_response("start")
     
     # Сохраняем приветственное сообщение в историю
-    add_message_to_dialog(chat_id, "assistant", welcome_message)
+    await add_message_to_dialog_async(chat_id, "assistant", get_history_entry("start"))
+    
+    await send_text(message, welcome_message)
     
-    await message.answer(welcome_message)
+    # Пока пользователь читает приветствие, прогреваем LLM для следующего запроса
+    schedule_llm_warmup(chat_id, message.from_user.id if message.from_user else None)
 
 async def cmd_services(message: Message):
     """Обработчик команды /services"""
@@ -44,28 +53,16 @@ async def cmd_services(message: Message):
     user_id = message.from_user.id if message.from_user else "unknown"
     user_name = message.from_user.full_name if message.from_user else "Unknown"
     logger.info(f"🔧 SERVICES COMMAND | Chat: {chat_id} | User: {user_name} ({user_id})")
+    metrics_logger.log_command_usage("services", str(user_id), chat_id)
     
-    services = get_all_services()
-    company_info = get_company_info()
-    company_name = company_info.get('name', 'Sign Language Interface')
-    
-    services_message = "🚀 **Услуги " + company_name + "**\n\n"
-    
-    for service_key, service_info in services.items():
-        services_message += "**" + service_info['name'] + "** (" + service_info['type'] + ")\n"
-        services_message += "📝 " + service_info['description'] + "\n"
-        services_message += "👥 Для: " + service_info['target_audience'] + "\n\n"
-    
-    website = company_info.get('website', '')
-    services_message += "💡 Подробнее: " + website + "\n"
-    services_message += "💬 Напишите мне о вашем проекте, и я подберу подходящие решения!"
+    services_message = get_command_response("services")
     
     # Сохраняем в историю
-    add_message_to_dialog(chat_id, "user", "/services")
-    add_message_to_dialog(chat_id, "assistant", services_message)
+    await add_message_to_dialog_async(chat_id, "user", "/services")
+    await add_message_to_dialog_async(chat_id, "assistant", get_history_entry("services"))
     
     logger.info(f"📤 SERVICES RESPONSE | Chat: {chat_id} | Length: {len(services_message)} chars")
-    await message.answer(services_message)
+    await send_text(message, services_message)
 
 async def cmd_help(message: Message):
     """Обработчик команды /help"""
@@ -73,31 +70,16 @@ async def cmd_help(message: Message):
     user_id = message.from_user.id if message.from_user else "unknown"
     user_name = message.from_user.full_name if message.from_user else "Unknown"
     logger.info(f"❓ HELP COMMAND | Chat: {chat_id} | User: {user_name} ({user_id})")
+    metrics_logger.log_command_usage("help", str(user_id), chat_id)
     
-    help_message = "📖 **Справка по использованию бота**\n\n"
-    help_message += "🤖 **Что я умею:**\n"
-    help_message += "• Консультировать по услугам в области жестовых технологий\n"
-    help_message += "• Подбирать подходящие решения под ваш проект\n"
-    help_message += "• Отвечать на вопросы о наших продуктах\n"
-    help_message += "• Помогать с техническими вопросами\n\n"
-    help_message += "📋 **Доступные команды:**\n"
-    help_message += "/start — Начать сначала\n"
-    help_message += "/services — Показать все услуги\n"
-    help_message += "/help — Эта справка\n"
-    help_message += "/contact — Контактная информация\n\n"
-    help_message += "💡 **Как общаться:**\n"
-    help_message += "Просто задавайте вопросы обычным языком! Например:\n"
-    help_message += "• \"Нужна система для распознавания жестов\"\n"
-    help_message += "• \"Хочу обучить команду жестовому языку\"\n"
-    help_message += "• \"Интересует перевод с жестового на устный язык\"\n\n"
-    help_message += "Я запоминаю контекст нашего разговора и могу отвечать на уточняющие вопросы."
+    help_message = get_command_response("help")
     
     # Сохраняем в историю
-    add_message_to_dialog(chat_id, "user", "/help")
-    add_message_to_dialog(chat_id, "assistant", help_message)
+    await add_message_to_dialog_async(chat_id, "user", "/help")
+    await add_message_to_dialog_async(chat_id, "assistant", get_history_entry("help"))
     
     logger.info(f"📤 HELP RESPONSE | Chat: {chat_id} | Length: {len(help_message)} chars")
-    await message.answer(help_message)
+    await send_text(message, help_message)
 
 async def cmd_contact(message: Message):
     """Обработчик команды /contact"""
@@ -105,84 +87,132 @@ async def cmd_contact(message: Message):
     user_id = message.from_user.id if message.from_user else "unknown"
     user_name = message.from_user.full_name if message.from_user else "Unknown"
     logger.info(f"📞 CONTACT COMMAND | Chat: {chat_id} | User: {user_name} ({user_id})")
+    metrics_logger.log_command_usage("contact", str(user_id), chat_id)
     
-    company_info = get_company_info()
-    company_name = company_info.get('name', 'Sign Language Interface')
-    website = company_info.get('website', '')
-    mission = company_info.get('mission', '')
-    
-    contact_message = "📞 **Контактная информация**\n\n"
-    contact_message += "🏢 **" + company_name + "**\n"
-    contact_message += "🌐 Веб-сайт: " + website + "\n\n"
-    contact_message += "🎯 **Наша миссия:**\n"
-    contact_message += mission + "\n\n"
-    contact_message += "📧 **Для деловых предложений:**\n"
-    contact_message += "Если вы хотите обсудить проект детально или получить коммерческое предложение, "
-    contact_message += "рекомендую связаться с нашей командой через официальный сайт.\n\n"
-    contact_message += "💬 **Продолжить в чате:**\n"
-    contact_message += "Я всегда готов ответить на ваши вопросы прямо здесь!"
+    contact_message = get_command_response("contact")
     
     # Сохраняем в историю
-    add_message_to_dialog(chat_id, "user", "/contact")
-    add_message_to_dialog(chat_id, "assistant", contact_message)
+    await add_message_to_dialog_async(chat_id, "user", "/contact")
+    await add_message_to_dialog_async(chat_id, "assistant", get_history_entry("contact"))
     
     logger.info(f"📤 CONTACT RESPONSE | Chat: {chat_id} | Length: {len(contact_message)} chars")
-    await message.answer(contact_message)
+    await send_text(message, contact_message)
 
 async def handle_message(message: Message):
     """Обработчик текстовых сообщений через LLM с сохранением контекста"""
+    start_time = time.time()
     try:
         chat_id = message.chat.id
         user_id = message.from_user.id if message.from_user else "unknown"
         user_name = message.from_user.full_name if message.from_user else "Unknown"
         user_message = message.text or ""
         
+        # Прогрев после /start больше не нужен: пришел реальный запрос
+        cancel_llm_warmup(chat_id)
+        
         # Проверяем, что сообщение не пустое
         if not user_message.strip():
             logger.warning(f"⚠️ EMPTY MESSAGE | Chat: {chat_id} | User: {user_name} ({user_id})")
-            await message.answer("Пожалуйста, отправьте текстовое сообщение.")
+            await send_text(message, "Пожалуйста, отправьте текстовое сообщение.")
+            return
+        
+        # Слишком длинное сообщение не сохраняем в историю, чтобы не ломать последующие запросы
+        max_message_chars = get_llm_max_message_chars()
+        if len(user_message) > max_message_chars:
+            logger.warning(f"⚠️ MESSAGE TOO LONG | Chat: {chat_id} | Length: {len(user_message)} chars")
+            await send_text(message, f"Сообщение слишком длинное. Пожалуйста, сократите его до {max_message_chars} символов.")
             return
         
         # Детальное логирование входящего сообщения
         logger.info(f"📨 USER MESSAGE | Chat: {chat_id} | User: {user_name} ({user_id})")
-        logger.info(f"📝 Content: {user_message}")
+        log_content(logger, "user_message", "📝 Content", user_message)
+        
+        # Проверяем дневной бюджет токенов: при превышении отвечаем отказом,
+        # переключаемся на более дешевую модель или сокращаем контекст
+        budget_action = get_budget_action(str(user_id))
+        if budget_action == "refuse":
+            logger.warning(f"💰 BUDGET EXCEEDED | Chat: {chat_id} | User: {user_id} | Request refused")
+            await send_text(message, "Извините, дневной лимит консультаций исчерпан. Пожалуйста, продолжите завтра "
+                                     "или свяжитесь с нами напрямую: /contact")
+            return
+        model = get_budget_fallback_model() if budget_action == "downgrade" else None
+        max_messages = get_budget_shrink_messages() if budget_action == "shrink" else 10
+        if budget_action:
+            logger.info(f"💰 BUDGET EXCEEDED | Chat: {chat_id} | User: {user_id} | Action: {budget_action}")
         
-        # Добавляем сообщение пользователя в историю
-        add_message_to_dialog(chat_id, "user", user_message)
+        # Добавляем сообщение пользователя в историю и получаем последние сообщения
+        # (в общем хранилище — за один сетевой обмен)
+        history = await add_message_and_get_history_async(chat_id, "user", user_message, max_messages=max_messages)
         
-        # Получаем историю диалога (последние 10 сообщений)
-        history = get_dialog_history(chat_id, max_messages=10)
+        # Учитываем услуги из сообщения в релевантности диалога: упомянутая ранее услуга
+        # остается в промпте несколько ходов ("а сколько стоит?" после вопроса о переводе)
+        service_scores = find_relevant_service_scores(user_message)
+        update_service_relevance(chat_id, service_scores)
         
-        # Формируем динамический системный промпт с учетом сообщения пользователя
-        system_prompt = get_system_prompt(user_message)
+        # Формируем динамический системный промпт с учетом релевантности услуг в диалоге
+        system_prompt = get_system_prompt(user_message, chat_id=chat_id)
         
         # Формируем запрос к LLM с динамическим системным промптом и историей
-        messages = [{"role": "system", "content": system_prompt}] + history
+        # Самые старые сообщения истории убираются, если запрос не укладывается в LLM_MAX_TOTAL_CHARS
+        messages = fit_messages_to_budget([{"role": "system", "content": system_prompt}] + history)
         
-        logger.info(f"🧠 LLM REQUEST | Chat: {chat_id} | Messages: {len(messages)} (system + {len(history)} history)")
+        logger.info(f"🧠 LLM REQUEST | Chat: {chat_id} | Messages: {len(messages)} (system + {len(messages) - 1} history)")
         
-        # Получаем ответ от LLM
-        response = await get_llm_response(messages)
+        # Проверяем запрос до обращения к API, чтобы не платить за заведомо ошибочный вызов
+        if not validate_messages(messages):
+            logger.error(f"❌ INVALID LLM REQUEST | Chat: {chat_id}")
+            await send_text(message, "Извините, не удалось обработать запрос. Попробуйте начать заново командой /start.")
+            return
+        
+        # Получаем ответ от LLM, показывая пользователю статус "печатает"
+        llm_start_time = time.time()
+        llm_stats = {}
+        async with typing_indicator(message):
+            response = await get_llm_response(messages, stats=llm_stats, model=model)
+        if llm_stats.get("success"):
+            record_usage(str(user_id), llm_stats["model"], llm_stats.get("prompt_tokens"), llm_stats.get("completion_tokens"))
+        metrics_logger.log_llm_request(
+            user_id=str(user_id),
+            chat_id=chat_id,
+            messages_count=len(messages),
+            model=llm_stats.get("model"),
+            start_time=llm_start_time,
+            end_time=time.time(),
+            success=llm_stats.get("success", False),
+            error=llm_stats.get("error"),
+            response_length=len(response),
+            prompt_tokens=llm_stats.get("prompt_tokens"),
+            completion_tokens=llm_stats.get("completion_tokens")
+        )
         
         # Сохраняем ответ в историю
-        add_message_to_dialog(chat_id, "assistant", response)
+        await add_message_to_dialog_async(chat_id, "assistant", response)
+        
+        # Отправляем ответ пользователю через очередь (длинные ответы разбиваются на части)
+        await send_text(message, response)
         
-        # Отправляем ответ пользователю
-        await message.answer(response)
+        # Заявка (услуги, бюджет, контакты) выделяется и записывается в фоне — здесь только постановка в очередь
+        submit_lead(chat_id, user_id, user_message, service_scores)
         
         # Детальное логирование ответа
         logger.info(f"🤖 BOT RESPONSE | Chat: {chat_id} | Length: {len(response)} chars")
-        logger.info(f"📤 Content: {response}")
+        log_content(logger, "bot_response", "📤 Content", response)
+        log_user_interaction(str(user_id), chat_id, "text", len(user_message), time.time() - start_time)
         
     except Exception as e:
         error_msg = f"❌ ERROR | Chat: {chat_id} | Error: {str(e)}"
         logger.error(error_msg)
-        await message.answer("Извините, произошла ошибка. Попробуйте еще раз.")
+        await send_text(message, "Извините, произошла ошибка. Попробуйте еще раз.")
 
 def setup_handlers(dp: Dispatcher):
     """Настройка обработчиков сообщений"""
+    # Повторно доставленные обновления отсекаются до лимитов и обработчиков
+    dp.update.outer_middleware(IdempotencyMiddleware())
+    # Ограничение частоты применяется ко всем сообщениям, включая команды
+    dp.message.outer_middleware(ThrottlingMiddleware())
     dp.message.register(cmd_start, Command("start"))
     dp.message.register(cmd_services, Command("services"))
     dp.message.register(cmd_help, Command("help"))
     dp.message.register(cmd_contact, Command("contact"))
+    setup_admin(dp)
     dp.message.register(handle_message) 
\ No newline at end of file
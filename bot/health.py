@@ -0,0 +1,190 @@
+"""
+HTTP-эндпоинты проверки состояния для платформы развертывания
+
+/healthz — процесс жив: цикл событий отвечает и фоновые проверки выполняются.
+/readyz — бот может обслуживать запросы: сессия Telegram работает, цепь LLM
+не разомкнута, очередь отправки и число обрабатываемых обновлений не превышают
+порогов, бот не останавливается.
+
+Проверки выполняются фоновой задачей раз в HEALTH_PROBE_INTERVAL и кэшируются;
+эндпоинты только читают результаты, поэтому запрос проверки не обращается
+к Telegram или LLM и не блокирует цикл событий. Результат старше
+HEALTH_PROBE_TTL считается неизвестным (не готов).
+"""
+import asyncio
+import logging
+import socket
+import time
+from typing import Any, Dict, Optional, Tuple
+from aiohttp import web
+from aiogram import Bot
+from bot.sender import get_send_queue_stats
+from bot.shutdown import get_in_flight_count, is_accepting_updates
+from config import (
+    get_health_port,
+    get_health_probe_interval,
+    get_health_probe_timeout,
+    get_health_probe_ttl,
+    get_health_max_send_queue,
+    get_health_max_in_flight,
+)
+from llm.client import get_circuit_state
+
+logger = logging.getLogger(__name__)
+
+# Результаты проверок: {имя: {"ok": bool, "detail": ..., "checked_at": monotonic}}
+_probes: Dict[str, Dict[str, Any]] = {}
+# Время завершения последнего цикла проверок (monotonic)
+_last_cycle: Optional[float] = None
+
+_runner: Optional[web.AppRunner] = None
+_prober: Optional[asyncio.Task] = None
+
+def _record(name: str, ok: bool, detail: Any, now: float) -> None:
+    """Сохранить результат проверки"""
+    previous = _probes.get(name)
+    if previous is not None and previous["ok"] != ok:
+        log = logger.info if ok else logger.warning
+        log(f"{'🟢' if ok else '🔴'} HEALTH PROBE {name.upper()} | {detail}")
+    _probes[name] = {"ok": ok, "detail": detail, "checked_at": now}
+
+async def run_probes(bot: Bot) -> None:
+    """Выполнить все проверки и обновить кэш результатов"""
+    global _last_cycle
+    try:
+        me = await asyncio.wait_for(bot.get_me(), timeout=get_health_probe_timeout())
+        _record("telegram", True, f"@{me.username}", time.monotonic())
+    except Exception as e:
+        _record("telegram", False, f"{type(e).__name__}: {e}", time.monotonic())
+
+    now = time.monotonic()
+    circuit = get_circuit_state(now)
+    _record("llm", circuit != "open", f"circuit {circuit}", now)
+
+    queued = get_send_queue_stats()["queued"]
+    in_flight = get_in_flight_count()
+    saturated = queued > get_health_max_send_queue() or in_flight > get_health_max_in_flight()
+    _record("capacity", not saturated, f"send queue {queued}, in flight {in_flight}", now)
+    _last_cycle = now
+
+async def probe_periodically(bot: Bot, interval: Optional[float] = None) -> None:
+    """
+    Фоновая задача: периодически выполнять проверки
+
+    Args:
+        bot: Экземпляр бота для проверки сессии Telegram
+        interval: Интервал проверок в секундах (по умолчанию HEALTH_PROBE_INTERVAL)
+    """
+    if interval is None:
+        interval = get_health_probe_interval()
+    while True:
+        try:
+            await run_probes(bot)
+        except Exception as e:
+            logger.error(f"Health probes failed: {e}")
+        await asyncio.sleep(interval)
+
+def get_liveness(now: Optional[float] = None) -> Tuple[bool, Dict[str, Any]]:
+    """
+    Проверить, что процесс жив: фоновые проверки выполнялись не позже HEALTH_PROBE_TTL назад
+
+    Returns:
+        (жив ли процесс, тело ответа)
+    """
+    if now is None:
+        now = time.monotonic()
+    age = None if _last_cycle is None else round(now - _last_cycle, 1)
+    # До первого цикла проверок процесс считается живым (идет запуск)
+    alive = age is None or age <= get_health_probe_ttl()
+    return alive, {"status": "ok" if alive else "stale", "last_probe_age": age}
+
+def get_readiness(now: Optional[float] = None) -> Tuple[bool, Dict[str, Any]]:
+    """
+    Проверить готовность обслуживать запросы по кэшированным результатам проверок
+
+    Returns:
+        (готов ли бот, тело ответа с результатами проверок)
+    """
+    if now is None:
+        now = time.monotonic()
+    ttl = get_health_probe_ttl()
+    checks = {}
+    for name in ("telegram", "llm", "capacity"):
+        probe = _probes.get(name)
+        if probe is None:
+            checks[name] = {"ok": False, "detail": "not checked yet", "age": None}
+            continue
+        age = now - probe["checked_at"]
+        fresh = age <= ttl
+        checks[name] = {"ok": probe["ok"] and fresh,
+                        "detail": probe["detail"] if fresh else f"stale: {probe['detail']}",
+                        "age": round(age, 1)}
+    accepting = is_accepting_updates()
+    checks["accepting"] = {"ok": accepting, "detail": "accepting updates" if accepting else "shutting down",
+                           "age": 0.0}
+
+    ready = all(check["ok"] for check in checks.values())
+    return ready, {"status": "ready" if ready else "not_ready", "checks": checks}
+
+async def _healthz(request: web.Request) -> web.Response:
+    alive, body = get_liveness()
+    return web.json_response(body, status=200 if alive else 503)
+
+async def _readyz(request: web.Request) -> web.Response:
+    ready, body = get_readiness()
+    return web.json_response(body, status=200 if ready else 503)
+
+def create_health_app() -> web.Application:
+    """Создать приложение aiohttp с эндпоинтами /healthz и /readyz"""
+    app = web.Application()
+    app.router.add_get("/healthz", _healthz)
+    app.router.add_get("/readyz", _readyz)
+    return app
+
+async def start_health_server(bot: Bot, port: Optional[int] = None, host: str = "0.0.0.0") -> Optional[int]:
+    """
+    Запустить HTTP-сервер проверок и фоновые проверки
+
+    Args:
+        bot: Экземпляр бота
+        port: Порт (по умолчанию HEALTH_PORT; 0 — сервер не запускается)
+        host: Адрес прослушивания
+
+    Returns:
+        Фактический порт сервера или None, если сервер отключен
+    """
+    global _runner, _prober
+    if port is None:
+        port = get_health_port()
+    if not port:
+        return None
+
+    await stop_health_server()
+    runner = web.AppRunner(create_health_app(), access_log=None)
+    await runner.setup()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    await web.SockSite(runner, sock).start()
+    _runner = runner
+    _prober = asyncio.create_task(probe_periodically(bot))
+
+    actual_port = sock.getsockname()[1]
+    logger.info(f"🩺 Health endpoints on {host}:{actual_port} (/healthz, /readyz)")
+    return actual_port
+
+async def stop_health_server() -> None:
+    """Остановить фоновые проверки и HTTP-сервер"""
+    global _runner, _prober
+    prober, _prober = _prober, None
+    if prober is not None:
+        prober.cancel()
+    runner, _runner = _runner, None
+    if runner is not None:
+        await runner.cleanup()
+
+def reset_health() -> None:
+    """Сбросить результаты проверок (для тестов)"""
+    global _last_cycle
+    _probes.clear()
+    _last_cycle = None
@@ -0,0 +1,192 @@
+"""
+Идемпотентная обработка обновлений: повторно доставленные Telegram обновления
+не обрабатываются второй раз
+
+Ключи обработанных обновлений (update_id и пара chat_id/message_id) хранятся
+в окне IDEMPOTENCY_WINDOW секунд, но не более IDEMPOTENCY_MAX_KEYS штук.
+Повтор обновления, которое еще обрабатывается, дожидается результата первой обработки.
+При заданном REDIS_URL ключи дополнительно занимаются в общем хранилище (SET NX EX),
+поэтому обновление, доставленное разным репликам, обрабатывается один раз.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from config import get_idempotency_window, get_idempotency_max_keys
+from llm.state_backend import RespError, get_state_backend
+
+logger = logging.getLogger(__name__)
+
+# Ключи обработанных обновлений: {key: время обработки (monotonic)}
+# OrderedDict упорядочен по времени, поэтому устаревшие ключи вытесняются из начала за O(1)
+_processed: "OrderedDict[Hashable, float]" = OrderedDict()
+
+# Обновления в процессе обработки: {key: future с результатом обработчика}
+_in_progress: Dict[Hashable, asyncio.Future] = {}
+
+_idempotency_stats: Dict[str, int] = {
+    "processed": 0,
+    "duplicates_skipped": 0,
+    "duplicates_attached": 0,
+    "evicted": 0,
+}
+
+def _update_keys(update: Update) -> List[Hashable]:
+    """
+    Ключи обновления: update_id (int) и (chat_id, message_id) для нового сообщения.
+    Ключи разных типов не пересекаются, поэтому хранятся в одном словаре.
+    """
+    keys: List[Hashable] = [update.update_id]
+    if update.message is not None:
+        keys.append((update.message.chat.id, update.message.message_id))
+    return keys
+
+def _shared_key(key: Hashable) -> str:
+    """Имя ключа обновления в общем хранилище"""
+    if isinstance(key, tuple):
+        return "message:" + ":".join(str(part) for part in key)
+    return str(key)
+
+async def _claim_shared(keys: List[Hashable]) -> bool:
+    """
+    Занять ключи обновления в общем хранилище
+
+    Returns:
+        False если обновление уже обработано (или обрабатывается) другой репликой;
+        True если хранилище не задано или недоступно — тогда действует только окно в памяти
+    """
+    backend = get_state_backend()
+    if backend is None:
+        return True
+    try:
+        return await backend.claim_updates([_shared_key(key) for key in keys], get_idempotency_window())
+    except (OSError, RespError) as e:
+        logger.warning(f"⚠️ Shared idempotency keys unavailable, using local window: {e}")
+        return True
+
+async def _release_shared(keys: List[Hashable]) -> None:
+    """Освободить ключи в общем хранилище, чтобы повторная доставка обработала обновление"""
+    backend = get_state_backend()
+    if backend is None:
+        return
+    try:
+        await backend.release_updates([_shared_key(key) for key in keys])
+    except (OSError, RespError) as e:
+        logger.warning(f"⚠️ Failed to release shared idempotency keys: {e}")
+
+def _evict_expired(now: float) -> None:
+    """Удалить ключи старше окна и ключи сверх лимита"""
+    window = get_idempotency_window()
+    max_keys = get_idempotency_max_keys()
+    while _processed:
+        key, processed_at = next(iter(_processed.items()))
+        if now - processed_at < window and len(_processed) <= max_keys:
+            break
+        _processed.popitem(last=False)
+        _idempotency_stats["evicted"] += 1
+
+def _remember(keys: List[Hashable], now: float) -> None:
+    """Отметить ключи как обработанные"""
+    for key in keys:
+        _processed[key] = now
+        _processed.move_to_end(key)
+    _evict_expired(now)
+
+def _consume_exception(future: asyncio.Future) -> None:
+    """Забрать исключение future, чтобы оно не попало в лог как необработанное"""
+    if not future.cancelled():
+        future.exception()
+
+def find_duplicate(keys: List[Hashable], now: Optional[float] = None) -> Optional[Any]:
+    """
+    Найти повтор среди обработанных и обрабатываемых обновлений
+
+    Args:
+        keys: Ключи обновления
+        now: Текущее время (monotonic), для тестов
+
+    Returns:
+        True если обновление уже обработано, future если оно еще обрабатывается, иначе None
+    """
+    if now is None:
+        now = time.monotonic()
+    _evict_expired(now)
+    for key in keys:
+        future = _in_progress.get(key)
+        if future is not None:
+            return future
+        if key in _processed:
+            return True
+    return None
+
+def get_idempotency_stats() -> Dict[str, int]:
+    """Получить счетчики обработки повторных обновлений"""
+    return {
+        **_idempotency_stats,
+        "tracked_keys": len(_processed),
+        "in_progress": len(_in_progress),
+    }
+
+def reset_idempotency() -> None:
+    """Забыть обработанные обновления и сбросить счетчики"""
+    _processed.clear()
+    _in_progress.clear()
+    for key in _idempotency_stats:
+        _idempotency_stats[key] = 0
+
+class IdempotencyMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений aiogram: пропускает повторно доставленные обновления"""
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        keys = _update_keys(event)
+        duplicate = find_duplicate(keys)
+        if duplicate is True:
+            _idempotency_stats["duplicates_skipped"] += 1
+            logger.info(f"🔁 DUPLICATE UPDATE skipped | Update: {event.update_id}")
+            return None
+        if duplicate is not None:
+            _idempotency_stats["duplicates_attached"] += 1
+            logger.info(f"🔁 DUPLICATE UPDATE attached to in-flight processing | Update: {event.update_id}")
+            return await asyncio.shield(duplicate)
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        for key in keys:
+            _in_progress[key] = future
+        try:
+            if not await _claim_shared(keys):
+                _idempotency_stats["duplicates_skipped"] += 1
+                logger.info(f"🔁 DUPLICATE UPDATE skipped (shared) | Update: {event.update_id}")
+                _remember(keys, time.monotonic())
+                future.set_result(None)
+                return None
+            try:
+                result = await handler(event, data)
+            except BaseException:
+                await asyncio.shield(_release_shared(keys))
+                raise
+        except BaseException as e:
+            # Необработанное обновление не запоминается: повторная доставка обработает его снова
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            _remember(keys, time.monotonic())
+            _idempotency_stats["processed"] += 1
+            return result
+        finally:
+            for key in keys:
+                if _in_progress.get(key) is future:
+                    del _in_progress[key]
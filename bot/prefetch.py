@@ -0,0 +1,82 @@
+"""
+Упреждающий прогрев LLM после /start
+
+Запрос после /start почти полностью предсказуем: базовый системный промпт и
+приветствие. Пока пользователь читает приветствие и набирает первый вопрос,
+в фоне устанавливается соединение с API и прогревается кэш этого префикса.
+Прогрев ограничен таймаутом запроса LLM_WARMUP_REQUEST_TIMEOUT и отменяется,
+как только приходит первое сообщение пользователя (см. cancel_llm_warmup).
+Расход токенов прогрева учитывается в дневном бюджете пользователя; пользователю,
+исчерпавшему бюджет, прогрев не выполняется.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from bot.responses import get_history_entry
+from config import get_llm_warmup_enabled
+from llm.budget import get_budget_action, record_usage
+from llm.client import warm_up_llm
+from llm.prompts import get_base_system_prompt
+
+logger = logging.getLogger(__name__)
+
+# Активные задачи прогрева: {chat_id: task}
+_warmups: Dict[int, asyncio.Task] = {}
+
+_warmup_stats: Dict[str, int] = {
+    "started": 0,
+    "completed": 0,
+    "failed": 0,
+    "cancelled": 0,
+}
+
+async def _run_warmup(chat_id: int, user_id: Optional[Any] = None) -> None:
+    """Выполнить прогрев и учесть его расход в бюджете пользователя"""
+    messages = [
+        {"role": "system", "content": get_base_system_prompt()},
+        {"role": "assistant", "content": get_history_entry("start")},
+    ]
+    stats: Dict[str, Any] = {}
+    try:
+        success = await warm_up_llm(messages, stats=stats)
+        _warmup_stats["completed" if success else "failed"] += 1
+        if success and user_id is not None:
+            record_usage(str(user_id), stats["model"], stats.get("prompt_tokens"), stats.get("completion_tokens"))
+    except asyncio.CancelledError:
+        logger.info(f"LLM warm-up cancelled for chat {chat_id}")
+        _warmup_stats["cancelled"] += 1
+        raise
+    finally:
+        if _warmups.get(chat_id) is asyncio.current_task():
+            del _warmups[chat_id]
+
+def schedule_llm_warmup(chat_id: int, user_id: Optional[Any] = None) -> bool:
+    """
+    Запустить фоновый прогрев LLM для чата (если включен LLM_WARMUP_ENABLED)
+
+    Args:
+        chat_id: ID чата
+        user_id: ID пользователя, в бюджете которого учитывается расход прогрева
+
+    Returns:
+        True если прогрев запущен
+    """
+    if not get_llm_warmup_enabled():
+        return False
+    if user_id is not None and get_budget_action(str(user_id)) is not None:
+        return False
+
+    cancel_llm_warmup(chat_id)
+    _warmups[chat_id] = asyncio.create_task(_run_warmup(chat_id, user_id))
+    _warmup_stats["started"] += 1
+    return True
+
+def cancel_llm_warmup(chat_id: int) -> None:
+    """Отменить прогрев для чата, если он еще выполняется"""
+    task = _warmups.pop(chat_id, None)
+    if task is not None and not task.done():
+        task.cancel()
+
+def get_warmup_stats() -> Dict[str, int]:
+    """Получить счетчики прогрева"""
+    return {**_warmup_stats, "active": len(_warmups)}
@@ -0,0 +1,86 @@
+"""
+Запись входящих сообщений для воспроизведения (python -m bot.replay)
+
+Сообщения пишутся в NDJSON в обезличенном виде: ID чатов и пользователей
+заменяются псевдонимами (хеш с солью, случайной для каждого запуска), имена
+не сохраняются, телефоны и почта в тексте маскируются.
+"""
+import hashlib
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import Message, TelegramObject, Update
+from config import get_record_updates_path, get_event_log_max_bytes, get_event_log_backups
+from llm.logging_utils import EventSink, redact_pii
+
+logger = logging.getLogger(__name__)
+
+_recorder: Optional[EventSink] = None
+
+def pseudonymize(value: int, salt: bytes) -> int:
+    """Заменить ID стабильным в пределах записи псевдонимом"""
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=6, key=salt).digest()
+    return int.from_bytes(digest, "big")
+
+def anonymize_message(message: Message, salt: bytes) -> Dict[str, Any]:
+    """
+    Получить обезличенную запись сообщения
+
+    Args:
+        message: Входящее сообщение
+        salt: Соль псевдонимов
+
+    Returns:
+        Запись {"chat", "chat_type", "user", "message_id", "t", "text"}
+    """
+    return {
+        "chat": pseudonymize(message.chat.id, salt),
+        "chat_type": message.chat.type,
+        "user": pseudonymize(message.from_user.id, salt) if message.from_user else None,
+        "message_id": message.message_id,
+        "t": message.date.timestamp(),
+        "text": redact_pii(message.text or ""),
+    }
+
+class UpdateRecorderMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений aiogram: записывает входящие текстовые сообщения"""
+
+    def __init__(self, sink: EventSink):
+        self.sink = sink
+        self.salt = os.urandom(16)
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if isinstance(event, Update) and event.message is not None and event.message.text is not None:
+            self.sink.put(anonymize_message(event.message, self.salt))
+        return await handler(event, data)
+
+def setup_recording(dp: Dispatcher) -> Optional[EventSink]:
+    """
+    Включить запись входящих сообщений, если задан RECORD_UPDATES_PATH
+
+    Returns:
+        Журнал записи или None, если запись отключена
+    """
+    global _recorder
+    path = get_record_updates_path()
+    if not path:
+        return None
+
+    stop_recording()
+    sink = EventSink(path, get_event_log_max_bytes(), get_event_log_backups())
+    sink.start()
+    _recorder = sink
+    dp.update.outer_middleware(UpdateRecorderMiddleware(sink))
+    logger.info(f"📼 Recording updates to {path}")
+    return sink
+
+def stop_recording() -> None:
+    """Записать оставшиеся сообщения и остановить запись"""
+    global _recorder
+    sink, _recorder = _recorder, None
+    if sink is not None:
+        sink.close()
@@ -0,0 +1,419 @@
+"""
+Воспроизведение записанных диалогов (см. bot/recorder.py) для сравнения метрик
+до и после изменений промптов, памяти или повторных попыток
+
+Сообщения проходят через обработчики setup_handlers. Telegram заменяется
+сессией-заглушкой, LLM — локальным OpenAI-совместимым сервером-заглушкой.
+Отчет: число запросов к LLM, токены промпта по ходам диалога, распределение
+задержки обработки и рост памяти на чат; с --baseline — разница с сохраненным отчетом.
+
+Использование:
+    python -m bot.replay recordings.ndjson --speed 0 --save-baseline baseline.json
+    python -m bot.replay recordings.ndjson --speed 0 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from itertools import count
+from typing import Any, AsyncGenerator, Dict, Iterator, List, Optional, Tuple
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from bot.handlers import setup_handlers
+from bot.idempotency import reset_idempotency
+from bot.sender import stop_send_queue
+from bot.throttling import reset_throttling
+from config import reload_settings
+from llm.analyze_events import LatencyHistogram, read_events
+from llm.budget import reset_budgets
+from llm.client import reset_circuit_breaker
+from llm.logging_utils import start_event_sink, stop_event_sink
+from llm.memory import get_dialog_stats, reset_dialogs
+
+# Переменные окружения на время воспроизведения: состояние только в памяти,
+# без журналов и записи, лимиты Telegram и частоты сообщений не ограничивают ускоренный прогон
+REPLAY_ENVIRONMENT = {
+    "REDIS_URL": "",
+    "RECORD_UPDATES_PATH": "",
+    "DIALOG_SNAPSHOT_PATH": "",
+    "BUDGET_STATE_PATH": "",
+    "LEADS_DB_PATH": "",
+    "OPENROUTER_API_KEY": "replay",
+}
+UNLIMITED_ENVIRONMENT = {
+    "THROTTLE_USER_BURST": "1000000",
+    "THROTTLE_CHAT_BURST": "1000000",
+    "SEND_GLOBAL_RATE": "1000000",
+    "SEND_CHAT_RATE": "1000000",
+    "SEND_CHAT_BURST": "1000000",
+    "BUDGET_USER_DAILY_TOKENS": "0",
+    "BUDGET_USER_DAILY_COST": "0",
+    "BUDGET_GLOBAL_DAILY_TOKENS": "0",
+    "BUDGET_GLOBAL_DAILY_COST": "0",
+}
+
+# Чат прогревочного сообщения, не входящий в отчет
+WARMUP_CHAT_ID = 0
+
+def estimate_tokens(text: str) -> int:
+    """Оценить число токенов текста (около 4 символов на токен)"""
+    return (len(text) + 3) // 4
+
+class StubLLMServer:
+    """OpenAI-совместимый сервер-заглушка: /chat/completions с детерминированным ответом"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, reply_chars: int = 400, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reply_chars = reply_chars
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    async def _chat_completions(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": {"message": "stub failure", "type": "server_error"}}, status=500)
+
+        messages = payload.get("messages", [])
+        prompt_tokens = sum(estimate_tokens(message.get("content") or "") + 4 for message in messages)
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        reply = (f"Ответ на «{last_user[:80]}». " * (self.reply_chars // 40 + 1))[:self.reply_chars]
+        completion_tokens = estimate_tokens(reply)
+        return web.json_response({
+            "id": f"stub-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    async def start(self) -> str:
+        """Запустить сервер на свободном порту и вернуть базовый адрес API"""
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        await web.SockSite(self._runner, sock).start()
+        self.base_url = f"http://127.0.0.1:{sock.getsockname()[1]}/v1"
+        return self.base_url
+
+    async def close(self) -> None:
+        """Остановить сервер"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+class ReplaySession(BaseSession):
+    """Сессия Bot API без сети: отправленные сообщения только подсчитываются"""
+
+    def __init__(self):
+        super().__init__()
+        self.requests: Dict[str, int] = {}
+        self._message_ids = count(1)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        name = type(method).__name__
+        self.requests[name] = self.requests.get(name, 0) + 1
+        chat_id = getattr(method, "chat_id", None)
+        if name.startswith("Send") and name != "SendChatAction" and chat_id is not None:
+            return method.__returning__.model_validate({
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": getattr(method, "text", None),
+            }, context={"bot": bot})
+        return True
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        """Файлы при воспроизведении не загружаются: поток содержимого пустой"""
+        return
+        yield  # делает метод асинхронным генератором, как в BaseSession
+
+    async def close(self) -> None:
+        pass
+
+@contextmanager
+def _replay_environment(overrides: Dict[str, str]) -> Iterator[None]:
+    """Временно подменить переменные окружения и перечитать настройки"""
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    reload_settings()
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        reload_settings()
+
+def _make_update(update_id: int, record: Dict[str, Any]) -> Update:
+    """Собрать обновление Telegram из записи"""
+    chat_id = record["chat"]
+    user_id = record.get("user") or chat_id
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": record.get("message_id", update_id),
+            "date": int(record.get("t", 0)),
+            "chat": {"id": chat_id, "type": record.get("chat_type", "private")},
+            "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+            "text": record["text"],
+        },
+    })
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    """Сводка распределения значений"""
+    if not values:
+        return {"total": 0, "mean": 0.0, "p50": 0, "p90": 0, "max": 0}
+    ordered = sorted(values)
+    return {
+        "total": sum(ordered),
+        "mean": round(sum(ordered) / len(ordered), 1),
+        "p50": ordered[(len(ordered) - 1) // 2],
+        "p90": ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+        "max": ordered[-1],
+    }
+
+async def replay(records: List[Dict[str, Any]],
+                 speed: float = 1.0,
+                 llm: Optional[StubLLMServer] = None,
+                 keep_limits: bool = False,
+                 trace_memory: bool = True) -> Dict[str, Any]:
+    """
+    Воспроизвести записанные сообщения через обработчики бота
+
+    Args:
+        records: Записи сообщений (см. bot/recorder.py)
+        speed: Ускорение относительно исходного темпа (1 — исходный, 0 — без пауз)
+        llm: Сервер-заглушка LLM (по умолчанию без задержки и ошибок)
+        keep_limits: Не снимать лимиты частоты сообщений и отправки
+        trace_memory: Измерять рост памяти через tracemalloc (замедляет прогон;
+            отключается при измерении пропускной способности)
+
+    Returns:
+        Отчет с метриками прогона
+    """
+    llm = llm or StubLLMServer()
+    base_url = await llm.start()
+    overrides = {**REPLAY_ENVIRONMENT, "OPENROUTER_BASE_URL": base_url}
+    if not keep_limits:
+        overrides.update(UNLIMITED_ENVIRONMENT)
+
+    chats: Dict[int, List[Tuple[int, Dict[str, Any]]]] = {}
+    for update_id, record in enumerate(records, start=1):
+        chats.setdefault(record["chat"], []).append((update_id, record))
+    start_t = min((record.get("t", 0) for record in records), default=0)
+
+    latency = LatencyHistogram()
+    session = ReplaySession()
+    with tempfile.TemporaryDirectory() as tmp_dir, _replay_environment(overrides):
+        reset_dialogs()
+        reset_throttling()
+        reset_idempotency()
+        reset_circuit_breaker()
+        reset_budgets()
+        events_path = os.path.join(tmp_dir, "events.ndjson")
+        start_event_sink(events_path)
+
+        bot = Bot(token="123456:REPLAY", session=session)
+        dp = Dispatcher()
+        setup_handlers(dp)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def replay_chat(chat_records: List[Tuple[int, Dict[str, Any]]]) -> None:
+            for update_id, record in chat_records:
+                if speed > 0:
+                    delay = started + (record.get("t", 0) - start_t) / speed - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                update = _make_update(update_id, record)
+                handle_start = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latency.add(time.perf_counter() - handle_start)
+
+        # Прогревочное сообщение: ленивый импорт SDK, создание клиента и первые разборы
+        # моделей aiogram не попадают в задержку, память и счетчики прогона
+        await dp.feed_update(bot, _make_update(0, {"chat": WARMUP_CHAT_ID, "text": "warm-up"}))
+        reset_dialogs()
+        reset_budgets()
+        warmup_calls = llm.calls
+        session.requests.clear()
+
+        if trace_memory:
+            tracemalloc.start()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        try:
+            replay_start = time.perf_counter()
+            await asyncio.gather(*(replay_chat(chat_records) for chat_records in chats.values()))
+            elapsed = time.perf_counter() - replay_start
+            traced_growth = tracemalloc.get_traced_memory()[0] - traced_before
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+            await stop_send_queue()
+            stop_event_sink()
+            await llm.close()
+
+        dialog_stats = get_dialog_stats()
+        events = [event for event in read_events([events_path])
+                  if event.get("event_type") == "llm_request" and event.get("chat_id") != WARMUP_CHAT_ID]
+        reset_dialogs()
+
+    # Номер хода — порядковый номер запроса к LLM в чате
+    prompt_tokens = []
+    by_turn: Dict[int, List[int]] = {}
+    turns: Dict[Any, int] = {}
+    for event in events:
+        tokens = event.get("prompt_tokens")
+        if tokens is None:
+            continue
+        turn = turns[event.get("chat_id")] = turns.get(event.get("chat_id"), 0) + 1
+        prompt_tokens.append(tokens)
+        by_turn.setdefault(turn, []).append(tokens)
+
+    chat_count = max(len(chats), 1)
+    return {
+        "updates": len(records),
+        "chats": len(chats),
+        "elapsed": round(elapsed, 3),
+        "updates_per_sec": round(len(records) / elapsed, 1) if elapsed else 0.0,
+        "llm_calls": llm.calls - warmup_calls,
+        "llm_requests": len(events),
+        "llm_failed": sum(1 for event in events if not event.get("success")),
+        "prompt_tokens": _percentiles(prompt_tokens),
+        "prompt_tokens_by_turn": {str(turn): round(sum(values) / len(values), 1)
+                                  for turn, values in sorted(by_turn.items())},
+        "latency": {
+            "p50": round(latency.percentile(50), 3),
+            "p90": round(latency.percentile(90), 3),
+            "p99": round(latency.percentile(99), 3),
+            "max": round(latency.max, 3),
+            "mean": round(latency.sum / latency.total, 3) if latency.total else 0.0,
+        },
+        "memory": {
+            "dialog_bytes_per_chat": round(dialog_stats["total_bytes"] / chat_count, 1),
+            "traced_bytes_per_chat": round(traced_growth / chat_count, 1),
+        },
+        "telegram_requests": session.requests,
+    }
+
+def _flatten(report: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """Числовые значения отчета с путями вида "latency.p50" """
+    values = {}
+    for key, value in report.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(_flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+def diff_reports(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Сравнить отчет с сохраненным
+
+    Returns:
+        Строки {"metric", "baseline", "current", "delta", "change"} по всем числовым метрикам;
+        change — относительное изменение или None, если в базовом отчете 0 или метрики нет
+    """
+    base_values = _flatten(baseline)
+    current_values = _flatten(current)
+    rows = []
+    for metric in sorted(set(base_values) | set(current_values)):
+        before = base_values.get(metric)
+        after = current_values.get(metric)
+        delta = round(after - before, 3) if before is not None and after is not None else None
+        change = round(delta / before, 4) if delta is not None and before else None
+        rows.append({"metric": metric, "baseline": before, "current": after, "delta": delta, "change": change})
+    return rows
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Оформить отчет в виде текста"""
+    latency = report["latency"]
+    tokens = report["prompt_tokens"]
+    lines = [
+        f"Updates: {report['updates']} | Chats: {report['chats']} | Elapsed: {report['elapsed']}s "
+        f"({report['updates_per_sec']}/s) | LLM calls: {report['llm_calls']} | "
+        f"LLM requests: {report['llm_requests']} (failed {report['llm_failed']})",
+        f"Prompt tokens: total {tokens['total']} | mean {tokens['mean']} | p50 {tokens['p50']} | "
+        f"p90 {tokens['p90']} | max {tokens['max']}",
+        "Prompt tokens by turn: " + ", ".join(f"{turn}={value}" for turn, value in
+                                              report["prompt_tokens_by_turn"].items()),
+        f"Latency: p50 {latency['p50']}s | p90 {latency['p90']}s | p99 {latency['p99']}s | "
+        f"max {latency['max']}s | mean {latency['mean']}s",
+        f"Memory per chat: dialogs {report['memory']['dialog_bytes_per_chat']} bytes | "
+        f"traced {report['memory']['traced_bytes_per_chat']} bytes",
+    ]
+    return "\n".join(lines)
+
+def format_diff(rows: List[Dict[str, Any]]) -> str:
+    """Оформить сравнение с базовым отчетом в виде текста"""
+    lines = [f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>9}"]
+    for row in rows:
+        if row["delta"] == 0:
+            continue
+        change = f"{row['change']:+.1%}" if row["change"] is not None else "n/a"
+        lines.append(f"{row['metric']:<40} {str(row['baseline']):>12} {str(row['current']):>12} {change:>9}")
+    if len(lines) == 1:
+        lines.append("No changes")
+    return "\n".join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных диалогов бота")
+    parser.add_argument("paths", nargs="+", help="Файлы записи сообщений (NDJSON)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Ускорение относительно исходного темпа (0 — без пауз)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Задержка ответа заглушки LLM (секунды)")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Доля ответов заглушки LLM с ошибкой 500")
+    parser.add_argument("--reply-chars", type=int, default=400, help="Длина ответа заглушки LLM")
+    parser.add_argument("--seed", type=int, default=0, help="Зерно генератора ошибок заглушки")
+    parser.add_argument("--keep-limits", action="store_true", help="Не снимать лимиты частоты и отправки")
+    parser.add_argument("--baseline", help="Сравнить с сохраненным отчетом")
+    parser.add_argument("--save-baseline", help="Сохранить отчет как базовый")
+    parser.add_argument("--json", action="store_true", help="Вывести отчет в формате JSON")
+    args = parser.parse_args(argv)
+
+    records = [record for record in read_events(args.paths) if "chat" in record and "text" in record]
+    llm = StubLLMServer(args.llm_latency, args.llm_error_rate, args.reply_chars, args.seed)
+    report = asyncio.run(replay(records, speed=args.speed, llm=llm, keep_limits=args.keep_limits))
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(format_diff(diff_reports(baseline, report)))
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Предварительно отрисованные ответы команд /start, /services, /help, /contact
+"""
+from types import MappingProxyType
+from typing import Any, Mapping
+from config import get_compact_command_history
+from llm.catalog import CatalogSnapshot, get_catalog, register_derived
+
+DEFAULT_COMPANY_NAME = "Sign Language Interface"
+
+def render_start_message(company_info: Mapping[str, str]) -> str:
+    """Сформировать приветственное сообщение"""
+    company_name = company_info.get('name', DEFAULT_COMPANY_NAME)
+    return "".join([
+        "👋 Добро пожаловать в ", company_name, "!\n\n",
+        "Я — ваш консультант по решениям в области жестового языка и распознавания жестов. ",
+        "Наша компания специализируется на создании доступных технологий для людей, использующих жестовые языки.\n\n",
+        "🔧 **Доступные команды:**\n",
+        "/services — Посмотреть все наши услуги\n",
+        "/help — Справка по использованию бота\n",
+        "/contact — Контактная информация\n\n",
+        "💬 **Как начать:**\n",
+        "Просто опишите вашу задачу или проект, и я помогу подобрать подходящие решения из нашего портфеля услуг.\n\n",
+        "Расскажите, что вас интересует в области жестовых технологий?",
+    ])
+
+def render_services_message(company_info: Mapping[str, str], services: Mapping[str, Mapping[str, Any]]) -> str:
+    """Сформировать список услуг компании"""
+    company_name = company_info.get('name', DEFAULT_COMPANY_NAME)
+    parts = ["🚀 **Услуги ", company_name, "**\n\n"]
+
+    for service_info in services.values():
+        parts += [
+            "**", service_info['name'], "** (", service_info['type'], ")\n",
+            "📝 ", service_info['description'], "\n",
+            "👥 Для: ", service_info['target_audience'], "\n\n",
+        ]
+
+    parts += [
+        "💡 Подробнее: ", company_info.get('website', ''), "\n",
+        "💬 Напишите мне о вашем проекте, и я подберу подходящие решения!",
+    ]
+    return "".join(parts)
+
+def render_help_message() -> str:
+    """Сформировать справку по использованию бота"""
+    return "".join([
+        "📖 **Справка по использованию бота**\n\n",
+        "🤖 **Что я умею:**\n",
+        "• Консультировать по услугам в области жестовых технологий\n",
+        "• Подбирать подходящие решения под ваш проект\n",
+        "• Отвечать на вопросы о наших продуктах\n",
+        "• Помогать с техническими вопросами\n\n",
+        "📋 **Доступные команды:**\n",
+        "/start — Начать сначала\n",
+        "/services — Показать все услуги\n",
+        "/help — Эта справка\n",
+        "/contact — Контактная информация\n\n",
+        "💡 **Как общаться:**\n",
+        "Просто задавайте вопросы обычным языком! Например:\n",
+        "• \"Нужна система для распознавания жестов\"\n",
+        "• \"Хочу обучить команду жестовому языку\"\n",
+        "• \"Интересует перевод с жестового на устный язык\"\n\n",
+        "Я запоминаю контекст нашего разговора и могу отвечать на уточняющие вопросы.",
+    ])
+
+def render_contact_message(company_info: Mapping[str, str]) -> str:
+    """Сформировать контактную информацию"""
+    return "".join([
+        "📞 **Контактная информация**\n\n",
+        "🏢 **", company_info.get('name', DEFAULT_COMPANY_NAME), "**\n",
+        "🌐 Веб-сайт: ", company_info.get('website', ''), "\n\n",
+        "🎯 **Наша миссия:**\n",
+        company_info.get('mission', ''), "\n\n",
+        "📧 **Для деловых предложений:**\n",
+        "Если вы хотите обсудить проект детально или получить коммерческое предложение, ",
+        "рекомендую связаться с нашей командой через официальный сайт.\n\n",
+        "💬 **Продолжить в чате:**\n",
+        "Я всегда готов ответить на ваши вопросы прямо здесь!",
+    ])
+
+def render_history_references(company_info: Mapping[str, str], services: Mapping[str, Mapping[str, Any]]) -> Mapping[str, str]:
+    """
+    Сформировать краткие ссылки на ответы команд для хранения в истории диалога
+
+    Args:
+        company_info: Информация о компании
+        services: Каталог услуг
+
+    Returns:
+        Неизменяемая таблица {команда: краткая ссылка}
+    """
+    service_names = ", ".join(service['name'] for service in services.values())
+    return MappingProxyType({
+        "start": "[Показано приветствие и список команд: /services, /help, /contact]",
+        "services": f"[Показан каталог услуг: {service_names}]",
+        "help": "[Показана справка по использованию бота]",
+        "contact": f"[Показаны контакты: {company_info.get('website', '')}]",
+    })
+
+def render_command_responses(company_info: Mapping[str, str], services: Mapping[str, Mapping[str, Any]]) -> Mapping[str, str]:
+    """
+    Отрисовать ответы всех команд
+
+    Args:
+        company_info: Информация о компании
+        services: Каталог услуг
+
+    Returns:
+        Неизменяемая таблица {команда: текст ответа}
+    """
+    return MappingProxyType({
+        "start": render_start_message(company_info),
+        "services": render_services_message(company_info, services),
+        "help": render_help_message(),
+        "contact": render_contact_message(company_info),
+    })
+
+def _build_responses(catalog: CatalogSnapshot) -> Mapping[str, str]:
+    """Построить таблицу ответов команд для снимка каталога"""
+    return render_command_responses(catalog.company_info, catalog.services)
+
+def _build_history_references(catalog: CatalogSnapshot) -> Mapping[str, str]:
+    """Построить таблицу кратких ссылок для снимка каталога"""
+    return render_history_references(catalog.company_info, catalog.services)
+
+# Таблицы строятся вместе со снимком каталога: при старте и при каждой его перезагрузке
+register_derived("command_responses", _build_responses)
+register_derived("command_history_references", _build_history_references)
+
+def get_command_response(command: str) -> str:
+    """
+    Получить готовый текст ответа команды
+
+    Args:
+        command: Имя команды без слэша (start/services/help/contact)
+
+    Returns:
+        Текст ответа
+    """
+    return get_catalog().derived["command_responses"][command]
+
+def get_history_entry(command: str) -> str:
+    """
+    Получить текст ответа команды для сохранения в историю диалога.
+    При COMPACT_COMMAND_HISTORY=true возвращается краткая ссылка вместо полного текста,
+    чтобы ответы команд не занимали контекстное окно LLM.
+
+    Args:
+        command: Имя команды без слэша
+
+    Returns:
+        Текст для истории диалога
+    """
+    derived = get_catalog().derived
+    if get_compact_command_history():
+        return derived["command_history_references"][command]
+    return derived["command_responses"][command]
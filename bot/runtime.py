@@ -0,0 +1,124 @@
+"""
+Выбор реализации цикла событий: стандартный asyncio или uvloop, а также
+"жадная" фабрика задач (asyncio.eager_task_factory, Python 3.12+), при которой
+задача выполняется синхронно до первого ожидания и не проходит через очередь цикла
+
+Если выбранный режим недоступен (uvloop не установлен, версия Python не
+поддерживает нужную возможность), используется стандартный режим, а причина
+записывается в сведения о среде выполнения.
+"""
+import asyncio
+import logging
+import platform
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Coroutine, Dict, Optional, Tuple
+from config import get_runtime_mode, get_eager_tasks
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_MODES = ("asyncio", "uvloop", "auto")
+
+@dataclass(frozen=True)
+class RuntimeInfo:
+    """Фактически используемая среда выполнения"""
+    mode: str
+    loop: str
+    eager_tasks: bool
+    python: str
+    fallback: Optional[str] = None
+
+# Среда выполнения текущего процесса (после запуска через run)
+_runtime: Optional[RuntimeInfo] = None
+
+def _uvloop_factory() -> Tuple[Optional[Callable[[], asyncio.AbstractEventLoop]], Optional[str]]:
+    """Получить фабрику цикла uvloop или причину, по которой он недоступен"""
+    if not hasattr(asyncio, "Runner"):
+        return None, "uvloop loop factory requires Python 3.11+"
+    try:
+        import uvloop
+    except ImportError:
+        return None, "uvloop is not installed"
+    return uvloop.new_event_loop, None
+
+def resolve_runtime(mode: Optional[str] = None,
+                    eager_tasks: Optional[bool] = None) -> Tuple[Optional[Callable[[], asyncio.AbstractEventLoop]], RuntimeInfo]:
+    """
+    Определить среду выполнения с учетом доступности uvloop и версии Python
+
+    Args:
+        mode: "asyncio", "uvloop" или "auto" — uvloop, если он доступен (по умолчанию RUNTIME_MODE)
+        eager_tasks: Включить жадную фабрику задач (по умолчанию EAGER_TASKS)
+
+    Returns:
+        (фабрика цикла событий или None для стандартного цикла, сведения о среде выполнения)
+    """
+    if mode is None:
+        mode = get_runtime_mode()
+    if eager_tasks is None:
+        eager_tasks = get_eager_tasks()
+    if mode not in RUNTIME_MODES:
+        raise ValueError(f"Unknown runtime mode: {mode!r}")
+
+    reasons = []
+    loop_factory = None
+    if mode in ("uvloop", "auto"):
+        loop_factory, reason = _uvloop_factory()
+        # В режиме auto отсутствие uvloop — ожидаемый случай, а не откат
+        if reason and mode == "uvloop":
+            reasons.append(reason)
+    if eager_tasks and not hasattr(asyncio, "eager_task_factory"):
+        reasons.append("eager task factory requires Python 3.12+")
+        eager_tasks = False
+
+    return loop_factory, RuntimeInfo(
+        mode=mode,
+        loop="uvloop" if loop_factory is not None else "asyncio",
+        eager_tasks=eager_tasks,
+        python=platform.python_version(),
+        fallback="; ".join(reasons) or None,
+    )
+
+async def _run_with_task_factory(main: Callable[[], Coroutine[Any, Any, Any]], eager_tasks: bool) -> Any:
+    """Установить фабрику задач в запущенном цикле и выполнить основную корутину"""
+    if eager_tasks:
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+    return await main()
+
+def run(main: Callable[[], Coroutine[Any, Any, Any]],
+        mode: Optional[str] = None,
+        eager_tasks: Optional[bool] = None) -> Any:
+    """
+    Выполнить корутину в выбранной среде выполнения (замена asyncio.run)
+
+    Args:
+        main: Функция, возвращающая основную корутину
+        mode: Режим цикла событий (по умолчанию RUNTIME_MODE)
+        eager_tasks: Жадная фабрика задач (по умолчанию EAGER_TASKS)
+
+    Returns:
+        Результат корутины
+    """
+    global _runtime
+    loop_factory, info = resolve_runtime(mode, eager_tasks)
+    if info.fallback:
+        logger.warning(f"⚠️ Runtime fallback: {info.fallback}")
+    _runtime = info
+
+    coroutine = _run_with_task_factory(main, info.eager_tasks)
+    if loop_factory is None:
+        return asyncio.run(coroutine)
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        return runner.run(coroutine)
+
+def get_runtime_info() -> Dict[str, Any]:
+    """
+    Получить сведения о среде выполнения для логов и метрик
+
+    Returns:
+        Словарь с mode, loop, eager_tasks, python, fallback; до запуска через run —
+        сведения о стандартном цикле
+    """
+    if _runtime is None:
+        return asdict(RuntimeInfo(mode="asyncio", loop="asyncio", eager_tasks=False,
+                                  python=platform.python_version()))
+    return asdict(_runtime)
@@ -0,0 +1,137 @@
+"""
+Сравнение режимов цикла событий (см. bot/runtime.py) на воспроизведении диалогов
+
+Каждый режим запускается в отдельном процессе: сообщения проходят через
+обработчики бота (bot/replay.py), LLM заменяется сервером-заглушкой с заданной
+задержкой. Отчет: обработанных сообщений в секунду и задержка обработки
+сообщения (p50/p99) для каждого режима. Недоступные режимы (нет uvloop, версия
+Python без жадной фабрики задач) отмечаются и не измеряются.
+
+Использование:
+    python -m bot.runtime_benchmark --chats 200 --turns 5 --llm-latency 0.05
+    python -m bot.runtime_benchmark recordings.ndjson --repeat 3
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+from bot.replay import StubLLMServer, replay
+from bot.runtime import get_runtime_info, resolve_runtime, run
+from llm.analyze_events import read_events
+
+# Сравниваемые режимы: (RUNTIME_MODE, EAGER_TASKS)
+MODES: Tuple[Tuple[str, bool], ...] = (
+    ("asyncio", False),
+    ("asyncio", True),
+    ("uvloop", False),
+    ("uvloop", True),
+)
+
+def synthetic_records(chats: int, turns: int) -> List[Dict[str, Any]]:
+    """
+    Сгенерировать записи диалогов: /start и turns вопросов в каждом чате
+
+    Returns:
+        Записи в формате bot/recorder.py
+    """
+    records = []
+    for chat in range(chats):
+        chat_id = 10_000 + chat
+        records.append({"chat": chat_id, "chat_type": "private", "user": chat_id,
+                        "message_id": 1, "t": 0.0, "text": "/start"})
+        for turn in range(turns):
+            records.append({"chat": chat_id, "chat_type": "private", "user": chat_id,
+                            "message_id": turn + 2, "t": float(turn + 1),
+                            "text": f"Сколько стоит перевод жестового языка для проекта {turn}?"})
+    return records
+
+def measure_mode(records: List[Dict[str, Any]],
+                 mode: str,
+                 eager_tasks: bool,
+                 llm_latency: float = 0.0,
+                 repeat: int = 1) -> Dict[str, Any]:
+    """
+    Воспроизвести записи в заданном режиме в текущем процессе
+
+    Args:
+        records: Записи сообщений
+        mode: RUNTIME_MODE
+        eager_tasks: EAGER_TASKS
+        llm_latency: Задержка ответа заглушки LLM (секунды)
+        repeat: Количество прогонов; в отчет попадает прогон с наибольшей пропускной способностью
+
+    Returns:
+        Сведения о режиме и метрики лучшего прогона; unavailable — причина, если режим недоступен
+    """
+    _, info = resolve_runtime(mode, eager_tasks)
+    if info.fallback:
+        return {"mode": mode, "eager_tasks": eager_tasks, "unavailable": info.fallback}
+
+    best: Optional[Dict[str, Any]] = None
+    for _ in range(repeat):
+        report = run(lambda: replay(records, speed=0, llm=StubLLMServer(latency=llm_latency), trace_memory=False),
+                     mode, eager_tasks)
+        if best is None or report["updates_per_sec"] > best["updates_per_sec"]:
+            best = report
+    return {
+        **get_runtime_info(),
+        "updates": best["updates"],
+        "updates_per_sec": best["updates_per_sec"],
+        "latency_p50": best["latency"]["p50"],
+        "latency_p99": best["latency"]["p99"],
+    }
+
+def _measure_in_subprocess(paths: List[str], args: argparse.Namespace, mode: str, eager_tasks: bool) -> Dict[str, Any]:
+    """Измерить режим в отдельном процессе, чтобы режимы не влияли друг на друга"""
+    command = [sys.executable, "-m", "bot.runtime_benchmark", *paths,
+               "--chats", str(args.chats), "--turns", str(args.turns),
+               "--llm-latency", str(args.llm_latency), "--repeat", str(args.repeat),
+               "--single", mode, *(["--eager"] if eager_tasks else [])]
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """Оформить сравнение режимов в виде текста; изменение — относительно первого режима"""
+    lines = [f"{'loop':<8} {'eager':<6} {'msg/s':>9} {'p50, s':>8} {'p99, s':>8} {'vs base':>8}"]
+    base = next((row["updates_per_sec"] for row in results if "unavailable" not in row), None)
+    for row in results:
+        eager = "yes" if row["eager_tasks"] else "no"
+        if "unavailable" in row:
+            lines.append(f"{row['mode']:<8} {eager:<6} unavailable: {row['unavailable']}")
+            continue
+        change = f"{row['updates_per_sec'] / base - 1:+.1%}" if base else "n/a"
+        lines.append(f"{row['loop']:<8} {eager:<6} {row['updates_per_sec']:>9} "
+                     f"{row['latency_p50']:>8} {row['latency_p99']:>8} {change:>8}")
+    return "\n".join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Сравнение режимов цикла событий бота")
+    parser.add_argument("paths", nargs="*", help="Файлы записи сообщений (по умолчанию — синтетические диалоги)")
+    parser.add_argument("--chats", type=int, default=200, help="Количество синтетических чатов")
+    parser.add_argument("--turns", type=int, default=5, help="Вопросов в каждом синтетическом чате")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Задержка ответа заглушки LLM (секунды)")
+    parser.add_argument("--repeat", type=int, default=3, help="Прогонов на режим (берется лучший)")
+    parser.add_argument("--single", choices=("asyncio", "uvloop"), help=argparse.SUPPRESS)
+    parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help="Вывести результаты в формате JSON")
+    args = parser.parse_args(argv)
+
+    if args.single:
+        if args.paths:
+            records = [record for record in read_events(args.paths) if "chat" in record and "text" in record]
+        else:
+            records = synthetic_records(args.chats, args.turns)
+        print(json.dumps(measure_mode(records, args.single, args.eager, args.llm_latency, args.repeat)))
+        return 0
+
+    results = [_measure_in_subprocess(args.paths, args, mode, eager_tasks) for mode, eager_tasks in MODES]
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(format_results(results))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,353 @@
+"""
+Отправка ответов в Telegram: разбиение длинных текстов и общая очередь отправки
+с лимитами Bot API (общим и на чат), приоритетами и обработкой retry_after
+"""
+import asyncio
+import itertools
+import logging
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+from config import (
+    get_send_max_retries,
+    get_send_global_rate,
+    get_send_chat_rate,
+    get_send_chat_burst,
+    get_send_short_reply_chars,
+)
+
+logger = logging.getLogger(__name__)
+
+# Лимит Telegram на длину текста сообщения (в UTF-16 code units)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Разделители в порядке предпочтения: абзац, строка, конец предложения, пробел
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_LINE_BREAK = re.compile(r"\n")
+_SENTENCE_END = re.compile(r"[.!?…](?=\s)")
+_WORD_BREAK = re.compile(r"\s")
+_BOUNDARIES = (_PARAGRAPH_BREAK, _LINE_BREAK, _SENTENCE_END, _WORD_BREAK)
+
+def _utf16_len(text: str) -> int:
+    """Длина строки в UTF-16 code units, как ее считает Telegram"""
+    return len(text.encode("utf-16-le")) // 2
+
+def _is_inside_entity(text: str, position: int) -> bool:
+    """Находится ли позиция внутри незакрытой Markdown-разметки (```блок```, `код`, **жирный**)"""
+    prefix = text[:position]
+    code_blocks = prefix.count("```")
+    if code_blocks % 2:
+        return True
+    if (prefix.count("`") - 3 * code_blocks) % 2:
+        return True
+    return prefix.count("**") % 2 == 1
+
+def _find_split_position(text: str, limit: int) -> int:
+    """Найти позицию разреза не дальше limit символов от начала"""
+    window = text[:limit]
+    # Символы вне BMP (эмодзи) занимают две единицы UTF-16
+    while _utf16_len(window) > limit:
+        window = window[:limit - (_utf16_len(window) - len(window))]
+
+    for boundary in _BOUNDARIES:
+        positions = [match.end() for match in boundary.finditer(window)]
+        for position in reversed(positions):
+            # Разрез в самом начале окна дал бы слишком короткую часть
+            if position < len(window) // 4:
+                break
+            if not _is_inside_entity(text, position):
+                return position
+
+    return len(window)
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """
+    Разбить текст на части, укладывающиеся в лимит Telegram.
+    Разрез выполняется по абзацам, затем по строкам, предложениям и словам,
+    не разрывая Markdown-разметку (**жирный**, `код`, ```блоки```).
+
+    Args:
+        text: Текст сообщения
+        limit: Максимальная длина части
+
+    Returns:
+        Список частей в исходном порядке
+    """
+    chunks = []
+    rest = text
+    while _utf16_len(rest) > limit:
+        position = _find_split_position(rest, limit)
+        chunk = rest[:position].rstrip()
+        if chunk:
+            chunks.append(chunk)
+        rest = rest[position:].lstrip()
+    if rest.strip():
+        chunks.append(rest)
+    return chunks
+
+# Приоритеты очереди отправки: короткие ответы раньше длинных текстов,
+# служебные действия (статус "печатает") — только при свободной пропускной способности
+PRIORITY_SHORT = 0
+PRIORITY_BULK = 1
+PRIORITY_BACKGROUND = 2
+
+# Максимум одновременно выполняемых запросов к Bot API
+MAX_CONCURRENT_SENDS = 16
+
+# Сколько последних значений задержки в очереди хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+# Время простоя, после которого корзина чата удаляется (секунды)
+CHAT_BUCKET_IDLE_TTL = 600
+
+class _SendItem:
+    """Элемент очереди отправки"""
+    __slots__ = ("chat_id", "send", "future", "submitted_at", "attempt")
+
+    def __init__(self, chat_id: int, send: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.chat_id = chat_id
+        self.send = send
+        self.future = future
+        self.submitted_at = time.monotonic()
+        self.attempt = 0
+
+# Состояние очереди привязано к циклу событий, в котором запущен обработчик
+_queue: Optional[asyncio.PriorityQueue] = None
+_worker: Optional[asyncio.Task] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_sequence = itertools.count()
+_active_sends: Set[asyncio.Task] = set()
+# Отложенные элементы (ждут лимита чата или retry_after вне очереди): {номер: (таймер, элемент)}
+_deferred: Dict[int, Tuple[asyncio.TimerHandle, _SendItem]] = {}
+
+# Общая корзина токенов [tokens, last_update] и корзины чатов {chat_id: [tokens, last_update]}
+_global_bucket: List[float] = [0.0, 0.0]
+_chat_buckets: "OrderedDict[int, List[float]]" = OrderedDict()
+
+_latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+_send_stats: Dict[str, int] = {
+    "submitted": 0,
+    "sent": 0,
+    "failed": 0,
+    "retry_after": 0,
+    "deferred": 0,
+}
+
+def _reserve_chat_slot(chat_id: int, now: float) -> float:
+    """
+    Списать токен из корзины чата
+
+    Returns:
+        0 если токен списан, иначе время ожидания до появления токена
+    """
+    burst = float(get_send_chat_burst())
+    rate = get_send_chat_rate()
+
+    # Вытесняем простаивающие корзины из начала OrderedDict
+    while _chat_buckets:
+        oldest_id, oldest = next(iter(_chat_buckets.items()))
+        if now - oldest[1] < CHAT_BUCKET_IDLE_TTL:
+            break
+        _chat_buckets.popitem(last=False)
+
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = [burst, now]
+        _chat_buckets[chat_id] = bucket
+    else:
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        _chat_buckets.move_to_end(chat_id)
+
+    if bucket[0] >= 1:
+        bucket[0] -= 1
+        return 0.0
+    return (1 - bucket[0]) / rate
+
+def _block_chat(chat_id: int, seconds: float, now: float) -> None:
+    """Запретить отправку в чат на время retry_after"""
+    _chat_buckets[chat_id] = [-seconds * get_send_chat_rate(), now]
+
+async def _acquire_global_slot() -> None:
+    """Дождаться токена общей корзины"""
+    rate = get_send_global_rate()
+    while True:
+        now = time.monotonic()
+        _global_bucket[0] = min(rate, _global_bucket[0] + (now - _global_bucket[1]) * rate)
+        _global_bucket[1] = now
+        if _global_bucket[0] >= 1:
+            _global_bucket[0] -= 1
+            return
+        await asyncio.sleep((1 - _global_bucket[0]) / rate)
+
+def _requeue(item: _SendItem, priority: int, delay: float) -> None:
+    """Вернуть элемент в очередь через delay секунд"""
+    queue = _queue
+    sequence = next(_sequence)
+
+    def release() -> None:
+        _deferred.pop(sequence, None)
+        queue.put_nowait((priority, sequence, item))
+
+    _deferred[sequence] = (_loop.call_later(delay, release), item)
+
+async def _perform_send(item: _SendItem, priority: int) -> None:
+    """Выполнить отправку и передать результат ожидающему обработчику"""
+    try:
+        result = await item.send()
+    except TelegramRetryAfter as e:
+        _send_stats["retry_after"] += 1
+        _block_chat(item.chat_id, e.retry_after, time.monotonic())
+        item.attempt += 1
+        if item.attempt > get_send_max_retries():
+            _send_stats["failed"] += 1
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        logger.warning(f"⏳ TELEGRAM FLOOD CONTROL | Chat: {item.chat_id} | Retry after {e.retry_after}s | "
+                       f"Attempt: {item.attempt}")
+        _requeue(item, priority, e.retry_after)
+    except Exception as e:
+        _send_stats["failed"] += 1
+        if not item.future.done():
+            item.future.set_exception(e)
+    else:
+        _send_stats["sent"] += 1
+        if not item.future.done():
+            item.future.set_result(result)
+
+async def _send_worker(queue: asyncio.PriorityQueue) -> None:
+    """Фоновая задача: выбирает сообщения из очереди с учетом лимитов Bot API"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+    while True:
+        priority, _, item = await queue.get()
+        if item.future.done():
+            continue
+
+        wait = _reserve_chat_slot(item.chat_id, time.monotonic())
+        if wait > 0:
+            # Чат исчерпал лимит: откладываем его сообщение, не блокируя остальные чаты
+            _send_stats["deferred"] += 1
+            _requeue(item, priority, wait)
+            continue
+
+        await _acquire_global_slot()
+        if item.attempt == 0:
+            _latencies.append(time.monotonic() - item.submitted_at)
+
+        await semaphore.acquire()
+        task = asyncio.create_task(_perform_send(item, priority))
+        _active_sends.add(task)
+        task.add_done_callback(_active_sends.discard)
+        task.add_done_callback(lambda _: semaphore.release())
+
+def _ensure_worker() -> asyncio.PriorityQueue:
+    """Запустить обработчик очереди в текущем цикле событий"""
+    global _queue, _worker, _loop
+    loop = asyncio.get_running_loop()
+    if _worker is None or _worker.done() or _loop is not loop:
+        _queue = asyncio.PriorityQueue()
+        _loop = loop
+        _global_bucket[:] = [get_send_global_rate(), time.monotonic()]
+        _chat_buckets.clear()
+        _deferred.clear()
+        _worker = loop.create_task(_send_worker(_queue))
+    return _queue
+
+def enqueue_send(chat_id: int, send: Callable[[], Awaitable[Any]], priority: int = PRIORITY_SHORT) -> asyncio.Future:
+    """
+    Поставить отправку в очередь, не дожидаясь ее выполнения
+
+    Args:
+        chat_id: ID чата-получателя
+        send: Функция, создающая корутину отправки
+        priority: PRIORITY_SHORT, PRIORITY_BULK или PRIORITY_BACKGROUND
+
+    Returns:
+        Future с результатом отправки
+    """
+    queue = _ensure_worker()
+    future = asyncio.get_running_loop().create_future()
+    _send_stats["submitted"] += 1
+    queue.put_nowait((priority, next(_sequence), _SendItem(chat_id, send, future)))
+    return future
+
+async def submit_send(chat_id: int, send: Callable[[], Awaitable[Any]], priority: int = PRIORITY_SHORT) -> Any:
+    """
+    Поставить отправку в очередь и дождаться ее выполнения
+
+    Args:
+        chat_id: ID чата-получателя
+        send: Функция, создающая корутину отправки (например, lambda: message.answer(text))
+        priority: PRIORITY_SHORT или PRIORITY_BULK
+
+    Returns:
+        Результат отправки
+
+    Raises:
+        Исключение Bot API, если отправка не удалась
+    """
+    return await enqueue_send(chat_id, send, priority)
+
+async def send_text(message: Message, text: str) -> None:
+    """
+    Отправить ответ через очередь отправки, разбив его на части при превышении лимита Telegram.
+    Части отправляются по порядку: следующая ставится в очередь после отправки предыдущей.
+
+    Args:
+        message: Входящее сообщение, на которое отвечаем
+        text: Текст ответа
+    """
+    chunks = split_message(text)
+    if len(chunks) > 1:
+        logger.info(f"✂️ LONG RESPONSE | Chat: {message.chat.id} | Length: {len(text)} chars | Parts: {len(chunks)}")
+
+    priority = PRIORITY_SHORT if len(text) <= get_send_short_reply_chars() else PRIORITY_BULK
+    for chunk in chunks:
+        await submit_send(message.chat.id, lambda: message.answer(chunk), priority)
+
+def get_send_queue_stats() -> Dict[str, Any]:
+    """
+    Получить метрики очереди отправки
+
+    Returns:
+        Счетчики, глубина очереди и задержка в очереди (секунды)
+    """
+    latencies = sorted(_latencies)
+    stats: Dict[str, Any] = dict(_send_stats)
+    stats["queued"] = _queue.qsize() if _queue is not None else 0
+    stats["in_flight"] = len(_active_sends)
+    stats["deferred_waiting"] = len(_deferred)
+    stats["latency_p50"] = latencies[len(latencies) // 2] if latencies else 0.0
+    stats["latency_p99"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+    stats["latency_max"] = latencies[-1] if latencies else 0.0
+    return stats
+
+async def stop_send_queue(timeout: float = 5.0) -> None:
+    """
+    Дождаться отправки поставленных и отложенных сообщений и остановить обработчик очереди.
+    Сообщения, не отправленные за timeout секунд, завершаются ошибкой RuntimeError.
+    """
+    global _worker
+    if _worker is None:
+        return
+    deadline = time.monotonic() + timeout
+    while (_queue.qsize() or _active_sends or _deferred) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    _worker.cancel()
+    _worker = None
+
+    pending = []
+    for handle, item in _deferred.values():
+        handle.cancel()
+        pending.append(item)
+    _deferred.clear()
+    while not _queue.empty():
+        pending.append(_queue.get_nowait()[2])
+    for item in pending:
+        if not item.future.done():
+            _send_stats["failed"] += 1
+            item.future.set_exception(RuntimeError("Send queue stopped before the message was sent"))
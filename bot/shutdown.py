@@ -0,0 +1,140 @@
+"""
+Корректная остановка бота: ожидание обрабатываемых запросов, снимок диалогов и счетчиков бюджетов,
+запись собранных заявок
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Set
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import TelegramObject
+from bot.recorder import stop_recording
+from bot.sender import stop_send_queue
+from config import get_budget_state_path, get_dialog_snapshot_path, get_shutdown_drain_timeout
+from llm.budget import load_budget_state, save_budget_state
+from llm.leads import stop_lead_capture
+from llm.logging_utils import stop_event_sink
+from llm.memory import get_dialog_stats, load_dialogs_snapshot, save_dialogs_snapshot
+from llm.state_backend import close_state_backend, get_state_backend
+
+logger = logging.getLogger(__name__)
+
+# Задачи, в которых сейчас выполняются обработчики обновлений
+_in_flight: Set[asyncio.Task] = set()
+_accepting = True
+
+def is_accepting_updates() -> bool:
+    """Принимает ли бот новые обновления"""
+    return _accepting
+
+def stop_accepting_updates() -> None:
+    """Перестать принимать новые обновления"""
+    global _accepting
+    _accepting = False
+
+def resume_accepting_updates() -> None:
+    """Снова принимать обновления (после перезапуска или в тестах)"""
+    global _accepting
+    _accepting = True
+
+def get_in_flight_count() -> int:
+    """Количество обрабатываемых сейчас обновлений"""
+    return len(_in_flight)
+
+async def drain_in_flight(timeout: float) -> int:
+    """
+    Дождаться завершения обрабатываемых обновлений
+
+    Args:
+        timeout: Максимальное время ожидания в секундах
+
+    Returns:
+        Количество задач, не завершившихся за отведенное время
+    """
+    current = asyncio.current_task()
+    pending = {task for task in _in_flight if task is not current and not task.done()}
+    if not pending:
+        return 0
+
+    logger.info(f"⏳ Draining {len(pending)} in-flight updates (timeout {timeout}s)")
+    _, still_pending = await asyncio.wait(pending, timeout=timeout)
+    if still_pending:
+        logger.warning(f"⚠️ {len(still_pending)} updates did not finish within {timeout}s")
+    return len(still_pending)
+
+class InFlightMiddleware(BaseMiddleware):
+    """Внешний middleware aiogram: учитывает обрабатываемые обновления и отклоняет новые при остановке"""
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if not _accepting:
+            logger.info("🛑 Update skipped: bot is shutting down")
+            return None
+
+        task = asyncio.current_task()
+        _in_flight.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            _in_flight.discard(task)
+
+def flush_logs() -> None:
+    """Сбросить буферы всех обработчиков логов"""
+    for handler in logging.getLogger().handlers:
+        try:
+            handler.flush()
+        except Exception:
+            pass
+
+async def on_startup() -> None:
+    """Восстановить диалоги и счетчики бюджетов предыдущего запуска"""
+    resume_accepting_updates()
+    # Снимок нужен только при хранении диалогов в памяти процесса
+    snapshot_path = get_dialog_snapshot_path()
+    if snapshot_path and get_state_backend() is None:
+        load_dialogs_snapshot(snapshot_path)
+    budget_state_path = get_budget_state_path()
+    if budget_state_path:
+        load_budget_state(budget_state_path)
+
+async def on_shutdown() -> None:
+    """
+    Координатор остановки: перестать принимать обновления, дождаться
+    обрабатываемых запросов, записать собранные заявки, сохранить снимок
+    диалогов и счетчики бюджетов, закрыть соединения общего хранилища,
+    сбросить метрики и логи.
+    Вызывается aiogram до закрытия сессии бота, поэтому ответы еще можно отправить.
+    """
+    stop_accepting_updates()
+    unfinished = await drain_in_flight(get_shutdown_drain_timeout())
+    await stop_send_queue()
+    await stop_lead_capture()
+
+    snapshot_path = get_dialog_snapshot_path()
+    if snapshot_path and get_state_backend() is None:
+        try:
+            save_dialogs_snapshot(snapshot_path)
+        except OSError as e:
+            logger.error(f"❌ Failed to save dialogs snapshot: {e}")
+
+    budget_state_path = get_budget_state_path()
+    if budget_state_path:
+        try:
+            save_budget_state(budget_state_path)
+        except OSError as e:
+            logger.error(f"❌ Failed to save budget state: {e}")
+
+    stats = get_dialog_stats()
+    logger.info(f"🛑 SHUTDOWN | Unfinished: {unfinished} | Dialogs: {stats['total_dialogs']} | "
+                f"Messages: {stats['total_messages']}")
+    close_state_backend()
+    stop_event_sink()
+    stop_recording()
+    flush_logs()
+
+def setup_shutdown(dp: Dispatcher) -> None:
+    """Зарегистрировать учет обновлений и обработчики запуска/остановки"""
+    dp.update.outer_middleware(InFlightMiddleware())
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
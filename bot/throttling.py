@@ -0,0 +1,186 @@
+"""
+Ограничение частоты запросов пользователей (token bucket)
+
+При заданном REDIS_URL корзины хранятся в общем хранилище и проверяются
+атомарным скриптом, поэтому лимиты действуют на все реплики бота.
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+from bot.sender import send_text
+from config import (
+    get_throttle_user_burst,
+    get_throttle_user_rate,
+    get_throttle_chat_burst,
+    get_throttle_chat_rate,
+    get_throttle_idle_ttl,
+)
+from llm.state_backend import RedisStateBackend, RespError, get_state_backend
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_MESSAGE = "⏳ Слишком много сообщений подряд. Пожалуйста, подождите немного и повторите запрос."
+
+# Корзины токенов: {key: [tokens, last_update, notified]}
+# OrderedDict упорядочен по времени последнего обращения, поэтому
+# простаивающие корзины всегда находятся в начале и вытесняются за O(1)
+_user_buckets: "OrderedDict[int, List[float]]" = OrderedDict()
+_chat_buckets: "OrderedDict[int, List[float]]" = OrderedDict()
+
+_throttle_stats: Dict[str, int] = {
+    "allowed": 0,
+    "throttled_user": 0,
+    "throttled_chat": 0,
+    "evicted": 0,
+}
+
+def _evict_idle_buckets(buckets: "OrderedDict[int, List[float]]", now: float, idle_ttl: float) -> None:
+    """Удалить корзины, к которым не обращались дольше idle_ttl секунд"""
+    while buckets:
+        key, bucket = next(iter(buckets.items()))
+        if now - bucket[1] < idle_ttl:
+            break
+        buckets.popitem(last=False)
+        _throttle_stats["evicted"] += 1
+
+def _get_bucket(buckets: "OrderedDict[int, List[float]]", key: int, burst: int, rate: float, now: float) -> List[float]:
+    """Получить корзину ключа с восполненными токенами"""
+    bucket = buckets.get(key)
+    if bucket is None:
+        bucket = [float(burst), now, 0]
+        buckets[key] = bucket
+        return bucket
+
+    bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+    bucket[1] = now
+    buckets.move_to_end(key)
+    return bucket
+
+async def _check_shared_rate_limit(backend: RedisStateBackend, user_id: int, chat_id: int,
+                                   now: Optional[float]) -> Optional[str]:
+    """Проверить лимиты по корзинам в общем хранилище; локально хранится только признак уведомления"""
+    idle_ttl = get_throttle_idle_ttl()
+    try:
+        limited = await backend.check_rate_limit(user_id, chat_id,
+                                                 get_throttle_user_burst(), get_throttle_user_rate(),
+                                                 get_throttle_chat_burst(), get_throttle_chat_rate(),
+                                                 idle_ttl, now)
+    except (OSError, RespError) as e:
+        # Недоступность хранилища не должна блокировать пользователей
+        logger.warning(f"⚠️ Shared rate limit unavailable, request allowed: {e}")
+        limited = None
+
+    local_now = time.monotonic()
+    _evict_idle_buckets(_user_buckets, local_now, idle_ttl)
+    bucket = _user_buckets.setdefault(user_id, [0.0, local_now, 0])
+    bucket[1] = local_now
+    _user_buckets.move_to_end(user_id)
+
+    if limited is None:
+        bucket[2] = 0
+        _throttle_stats["allowed"] += 1
+    else:
+        _throttle_stats[f"throttled_{limited}"] += 1
+    return limited
+
+def check_rate_limit(user_id: int, chat_id: int, now: Optional[float] = None) -> Optional[str]:
+    """
+    Проверить лимиты пользователя и чата и списать токен (корзины в памяти процесса)
+
+    Args:
+        user_id: ID пользователя
+        chat_id: ID чата
+        now: Текущее время (monotonic), для тестов
+
+    Returns:
+        None если запрос разрешен, иначе "user" или "chat" — какой лимит превышен
+    """
+    if now is None:
+        now = time.monotonic()
+
+    idle_ttl = get_throttle_idle_ttl()
+    _evict_idle_buckets(_user_buckets, now, idle_ttl)
+    _evict_idle_buckets(_chat_buckets, now, idle_ttl)
+
+    user_bucket = _get_bucket(_user_buckets, user_id, get_throttle_user_burst(), get_throttle_user_rate(), now)
+    chat_bucket = _get_bucket(_chat_buckets, chat_id, get_throttle_chat_burst(), get_throttle_chat_rate(), now)
+
+    if user_bucket[0] < 1:
+        _throttle_stats["throttled_user"] += 1
+        return "user"
+    if chat_bucket[0] < 1:
+        _throttle_stats["throttled_chat"] += 1
+        return "chat"
+
+    user_bucket[0] -= 1
+    chat_bucket[0] -= 1
+    user_bucket[2] = 0
+    _throttle_stats["allowed"] += 1
+    return None
+
+async def check_rate_limit_async(user_id: int, chat_id: int, now: Optional[float] = None) -> Optional[str]:
+    """
+    Проверить лимиты (см. check_rate_limit); при заданном REDIS_URL — по корзинам общего хранилища
+
+    Args:
+        user_id: ID пользователя
+        chat_id: ID чата
+        now: Текущее время (при общем хранилище — time.time()), для тестов
+
+    Returns:
+        None если запрос разрешен, иначе "user" или "chat" — какой лимит превышен
+    """
+    backend = get_state_backend()
+    if backend is None:
+        return check_rate_limit(user_id, chat_id, now)
+    return await _check_shared_rate_limit(backend, user_id, chat_id, now)
+
+def should_notify_throttled(user_id: int) -> bool:
+    """
+    Нужно ли отправить пользователю уведомление об ограничении.
+    Уведомление отправляется один раз за серию заблокированных сообщений.
+    """
+    bucket = _user_buckets.get(user_id)
+    if bucket is None or bucket[2]:
+        return False
+    bucket[2] = 1
+    return True
+
+def get_throttle_stats() -> Dict[str, int]:
+    """Получить счетчики ограничения частоты"""
+    return {
+        **_throttle_stats,
+        "tracked_users": len(_user_buckets),
+        "tracked_chats": len(_chat_buckets),
+    }
+
+def reset_throttling() -> None:
+    """Сбросить все корзины и счетчики"""
+    _user_buckets.clear()
+    _chat_buckets.clear()
+    for key in _throttle_stats:
+        _throttle_stats[key] = 0
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внешний middleware aiogram: ограничивает частоту сообщений и команд до вызова обработчиков"""
+
+    async def __call__(self,
+                       handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        if not isinstance(event, Message) or event.from_user is None:
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        chat_id = event.chat.id
+        limited = await check_rate_limit_async(user_id, chat_id)
+        if limited is None:
+            return await handler(event, data)
+
+        logger.warning(f"🚦 THROTTLED | Chat: {chat_id} | User: {user_id} | Limit: {limited}")
+        if should_notify_throttled(user_id):
+            await send_text(event, THROTTLED_MESSAGE)
+        return None
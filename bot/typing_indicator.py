@@ -0,0 +1,111 @@
+"""
+Статус "печатает" во время генерации ответа LLM
+
+Для всех чатов с генерацией в процессе работает одна общая фоновая задача,
+которая раз в TYPING_INTERVAL секунд ставит ChatAction.TYPING в очередь отправки
+с фоновым приоритетом. Пока предыдущее действие чата не отправлено, новое не
+ставится, поэтому число таймеров и элементов очереди не растет с числом чатов.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+from aiogram.enums import ChatAction
+from aiogram.types import Message
+from bot.sender import PRIORITY_BACKGROUND, enqueue_send
+from config import get_typing_indicator_enabled, get_typing_interval
+from llm.logging_utils import emit_event
+
+logger = logging.getLogger(__name__)
+
+# Чаты с генерацией в процессе: {chat_id: [количество генераций, бот, future действия в очереди или None]}
+_active: Dict[int, List[Any]] = {}
+_ticker: Optional[asyncio.Task] = None
+
+_typing_stats: Dict[str, int] = {
+    "generations": 0,
+    "resends": 0,
+    "actions_sent": 0,
+    "actions_coalesced": 0,
+}
+
+def _on_action_done(chat_id: int, future: asyncio.Future) -> None:
+    """Снять отметку об ожидающем действии чата"""
+    entry = _active.get(chat_id)
+    if entry is not None and entry[2] is future:
+        entry[2] = None
+    if not future.cancelled() and future.exception() is not None:
+        logger.debug(f"Typing action failed for chat {chat_id}: {future.exception()}")
+
+def _send_typing(chat_id: int) -> None:
+    """Поставить действие "печатает" в очередь, если предыдущее уже отправлено"""
+    entry = _active[chat_id]
+    if entry[2] is not None:
+        _typing_stats["actions_coalesced"] += 1
+        return
+
+    bot = entry[1]
+    _typing_stats["actions_sent"] += 1
+    future = enqueue_send(chat_id, lambda: bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING),
+                          PRIORITY_BACKGROUND)
+    entry[2] = future
+    future.add_done_callback(lambda done: _on_action_done(chat_id, done))
+
+async def _tick(interval: float) -> None:
+    """Общая фоновая задача: обновляет статус всех активных чатов, пока они есть"""
+    while _active:
+        await asyncio.sleep(interval)
+        for chat_id in list(_active):
+            _send_typing(chat_id)
+
+def _ensure_ticker() -> None:
+    """Запустить общую задачу обновления статуса, если она не работает"""
+    global _ticker
+    if _ticker is None or _ticker.done():
+        _ticker = asyncio.create_task(_tick(get_typing_interval()))
+
+@asynccontextmanager
+async def typing_indicator(message: Message) -> AsyncIterator[None]:
+    """
+    Показывать статус "печатает" в чате, пока выполняется блок
+
+    Сообщение, пришедшее в чат во время генерации ответа на предыдущее,
+    учитывается как повторная отправка (resend).
+
+    Args:
+        message: Входящее сообщение, на которое готовится ответ
+    """
+    chat_id = message.chat.id
+    _typing_stats["generations"] += 1
+
+    entry = _active.get(chat_id)
+    if entry is not None:
+        entry[0] += 1
+        _typing_stats["resends"] += 1
+        emit_event({"event_type": "resend", "chat_id": chat_id}, "RESEND_METRICS", logging.DEBUG)
+    else:
+        entry = [1, message.bot, None]
+        _active[chat_id] = entry
+        if get_typing_indicator_enabled():
+            _send_typing(chat_id)
+            _ensure_ticker()
+
+    try:
+        yield
+    finally:
+        entry[0] -= 1
+        if entry[0] <= 0 and _active.get(chat_id) is entry:
+            del _active[chat_id]
+            # Неотправленное действие отменяется: очередь пропускает завершенные элементы,
+            # и статус не появится после ответа
+            if entry[2] is not None:
+                entry[2].cancel()
+
+def get_typing_stats() -> Dict[str, Any]:
+    """Получить счетчики статуса "печатает" и долю повторных отправок"""
+    generations = _typing_stats["generations"]
+    return {
+        **_typing_stats,
+        "active_chats": len(_active),
+        "resend_rate": round(_typing_stats["resends"] / generations, 4) if generations else 0.0,
+    }
@@ -1,30 +1,558 @@
 import os
-from dotenv import load_dotenv
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import FrozenSet, Mapping, Optional, Tuple
 
-load_dotenv()
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm", "catalog.json")
+DEFAULT_FALLBACK_DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "doc")
+
+@dataclass(frozen=True)
+class Settings:
+    """Настройки приложения, разобранные из переменных окружения один раз"""
+    telegram_token: Optional[str]
+    log_level: str
+    openrouter_api_key: Optional[str]
+    openrouter_base_url: str
+    llm_model: str
+    llm_timeout: int
+    throttle_user_burst: int
+    throttle_user_rate: float
+    throttle_chat_burst: int
+    throttle_chat_rate: float
+    throttle_idle_ttl: int
+    compact_command_history: bool
+    service_catalog_path: str
+    catalog_reload_interval: float
+    dialog_snapshot_path: str
+    shutdown_drain_timeout: float
+    llm_max_message_chars: int
+    llm_max_total_chars: int
+    send_max_retries: int
+    send_global_rate: float
+    send_chat_rate: float
+    send_chat_burst: int
+    send_short_reply_chars: int
+    llm_warmup_enabled: bool
+    llm_warmup_request_timeout: float
+    dialog_max_messages: int
+    dialog_active_window: float
+    dialog_stats_interval: float
+    fallback_docs_dir: str
+    fuzzy_max_edit_distance: int
+    fuzzy_min_confidence: float
+    service_relevance_decay: float
+    service_relevance_min_score: float
+    service_relevance_top: int
+    service_relevance_ttl: float
+    llm_circuit_failure_threshold: int
+    llm_circuit_reset_timeout: float
+    event_log_path: str
+    event_log_max_bytes: int
+    event_log_backups: int
+    log_content_policy: Mapping[str, Tuple[int, float]]
+    typing_indicator_enabled: bool
+    typing_interval: float
+    redis_url: str
+    redis_pool_size: int
+    redis_timeout: float
+    redis_key_prefix: str
+    redis_dialog_ttl: int
+    idempotency_window: float
+    idempotency_max_keys: int
+    record_updates_path: str
+    budget_user_daily_tokens: int
+    budget_user_daily_cost: float
+    budget_global_daily_tokens: int
+    budget_global_daily_cost: float
+    budget_policy: str
+    budget_fallback_model: str
+    budget_shrink_messages: int
+    budget_hard_limit_factor: float
+    budget_state_path: str
+    budget_save_interval: float
+    llm_prices: Mapping[str, Tuple[float, float]]
+    admin_user_ids: FrozenSet[int]
+    loop_lag_interval: float
+    admin_profile_max_seconds: float
+    runtime_mode: str
+    eager_tasks: bool
+    health_port: int
+    health_probe_interval: float
+    health_probe_timeout: float
+    health_probe_ttl: float
+    health_max_send_queue: int
+    health_max_in_flight: int
+    leads_db_path: str
+    leads_queue_size: int
+    leads_batch_size: int
+    leads_flush_interval: float
+
+_settings: Optional[Settings] = None
+
+def _get_bool(name: str, default: str) -> bool:
+    """Разобрать булеву переменную окружения"""
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+def _get_content_policy(name: str) -> Mapping[str, Tuple[int, float]]:
+    """
+    Разобрать политику логирования содержимого вида "поле=длина:доля,..."
+    (например, "user_message=300:1.0,bot_response=100:0.1")
+    """
+    policy = {}
+    for item in filter(None, (part.strip() for part in os.getenv(name, "").split(","))):
+        field, _, value = item.partition("=")
+        max_chars, _, sample_rate = value.partition(":")
+        if not field or not max_chars:
+            raise ValueError(f"Invalid {name} entry: {item!r}")
+        policy[field.strip()] = (int(max_chars), float(sample_rate or "1"))
+    return MappingProxyType(policy)
+
+def _get_price_table(name: str) -> Mapping[str, Tuple[float, float]]:
+    """
+    Разобрать цены моделей вида "модель=запрос:ответ,..." в долларах за миллион токенов
+    (например, "anthropic/claude-3-haiku=0.25:1.25,openai/gpt-4o-mini=0.15:0.6")
+    """
+    prices = {}
+    for item in filter(None, (part.strip() for part in os.getenv(name, "").split(","))):
+        model, _, value = item.partition("=")
+        prompt_price, _, completion_price = value.partition(":")
+        if not model or not prompt_price or not completion_price:
+            raise ValueError(f"Invalid {name} entry: {item!r}")
+        prices[model.strip()] = (float(prompt_price), float(completion_price))
+    return MappingProxyType(prices)
+
+def _get_id_set(name: str) -> FrozenSet[int]:
+    """Разобрать список ID через запятую (например, "123456,789012")"""
+    try:
+        return frozenset(int(part) for part in os.getenv(name, "").replace(" ", "").split(",") if part)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected comma-separated integer IDs") from None
+
+def _get_choice(name: str, default: str, choices: Tuple[str, ...]) -> str:
+    """Разобрать переменную окружения с ограниченным набором значений"""
+    value = os.getenv(name, default).strip().lower()
+    if value not in choices:
+        raise ValueError(f"Invalid {name}: {value!r} (expected one of {', '.join(choices)})")
+    return value
+
+def load_settings() -> Settings:
+    """
+    Загрузить .env и разобрать переменные окружения
+
+    Returns:
+        Неизменяемый объект настроек
+
+    Raises:
+        ValueError: если значение переменной имеет неверный формат
+    """
+    # Импорт dotenv откладывается до первого обращения к настройкам
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    return Settings(
+        telegram_token=os.getenv("TELEGRAM_BOT_TOKEN"),
+        log_level=os.getenv("LOG_LEVEL", "INFO"),
+        openrouter_api_key=os.getenv("OPENROUTER_API_KEY"),
+        openrouter_base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+        llm_model=os.getenv("LLM_MODEL", "anthropic/claude-3-haiku"),
+        llm_timeout=int(os.getenv("LLM_TIMEOUT", "30")),
+        throttle_user_burst=int(os.getenv("THROTTLE_USER_BURST", "5")),
+        throttle_user_rate=float(os.getenv("THROTTLE_USER_RATE", "0.5")),
+        throttle_chat_burst=int(os.getenv("THROTTLE_CHAT_BURST", "10")),
+        throttle_chat_rate=float(os.getenv("THROTTLE_CHAT_RATE", "1.0")),
+        throttle_idle_ttl=int(os.getenv("THROTTLE_IDLE_TTL", "600")),
+        compact_command_history=_get_bool("COMPACT_COMMAND_HISTORY", "false"),
+        service_catalog_path=os.getenv("SERVICE_CATALOG_PATH", DEFAULT_CATALOG_PATH),
+        catalog_reload_interval=float(os.getenv("CATALOG_RELOAD_INTERVAL", "5")),
+        dialog_snapshot_path=os.getenv("DIALOG_SNAPSHOT_PATH", ""),
+        shutdown_drain_timeout=float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20")),
+        llm_max_message_chars=int(os.getenv("LLM_MAX_MESSAGE_CHARS", "4000")),
+        llm_max_total_chars=int(os.getenv("LLM_MAX_TOTAL_CHARS", "64000")),
+        send_max_retries=int(os.getenv("SEND_MAX_RETRIES", "3")),
+        send_global_rate=float(os.getenv("SEND_GLOBAL_RATE", "30")),
+        send_chat_rate=float(os.getenv("SEND_CHAT_RATE", "1.0")),
+        send_chat_burst=int(os.getenv("SEND_CHAT_BURST", "3")),
+        send_short_reply_chars=int(os.getenv("SEND_SHORT_REPLY_CHARS", "1000")),
+        llm_warmup_enabled=_get_bool("LLM_WARMUP_ENABLED", "false"),
+        llm_warmup_request_timeout=float(os.getenv("LLM_WARMUP_REQUEST_TIMEOUT", "5")),
+        dialog_max_messages=int(os.getenv("DIALOG_MAX_MESSAGES", "100")),
+        dialog_active_window=float(os.getenv("DIALOG_ACTIVE_WINDOW", "900")),
+        dialog_stats_interval=float(os.getenv("DIALOG_STATS_INTERVAL", "60")),
+        fallback_docs_dir=os.getenv("FALLBACK_DOCS_DIR", DEFAULT_FALLBACK_DOCS_DIR),
+        fuzzy_max_edit_distance=int(os.getenv("FUZZY_MAX_EDIT_DISTANCE", "2")),
+        fuzzy_min_confidence=float(os.getenv("FUZZY_MIN_CONFIDENCE", "0.8")),
+        service_relevance_decay=float(os.getenv("SERVICE_RELEVANCE_DECAY", "0.6")),
+        service_relevance_min_score=float(os.getenv("SERVICE_RELEVANCE_MIN_SCORE", "0.3")),
+        service_relevance_top=int(os.getenv("SERVICE_RELEVANCE_TOP", "3")),
+        service_relevance_ttl=float(os.getenv("SERVICE_RELEVANCE_TTL", "3600")),
+        llm_circuit_failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5")),
+        llm_circuit_reset_timeout=float(os.getenv("LLM_CIRCUIT_RESET_TIMEOUT", "30")),
+        event_log_path=os.getenv("EVENT_LOG_PATH", ""),
+        event_log_max_bytes=int(os.getenv("EVENT_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        event_log_backups=int(os.getenv("EVENT_LOG_BACKUPS", "5")),
+        log_content_policy=_get_content_policy("LOG_CONTENT_POLICY"),
+        typing_indicator_enabled=_get_bool("TYPING_INDICATOR_ENABLED", "true"),
+        typing_interval=float(os.getenv("TYPING_INTERVAL", "4.5")),
+        redis_url=os.getenv("REDIS_URL", ""),
+        redis_pool_size=int(os.getenv("REDIS_POOL_SIZE", "10")),
+        redis_timeout=float(os.getenv("REDIS_TIMEOUT", "2")),
+        redis_key_prefix=os.getenv("REDIS_KEY_PREFIX", "slibot:"),
+        redis_dialog_ttl=int(os.getenv("REDIS_DIALOG_TTL", str(7 * 24 * 3600))),
+        idempotency_window=float(os.getenv("IDEMPOTENCY_WINDOW", "600")),
+        idempotency_max_keys=int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000")),
+        record_updates_path=os.getenv("RECORD_UPDATES_PATH", ""),
+        budget_user_daily_tokens=int(os.getenv("BUDGET_USER_DAILY_TOKENS", "200000")),
+        budget_user_daily_cost=float(os.getenv("BUDGET_USER_DAILY_COST", "0")),
+        budget_global_daily_tokens=int(os.getenv("BUDGET_GLOBAL_DAILY_TOKENS", "0")),
+        budget_global_daily_cost=float(os.getenv("BUDGET_GLOBAL_DAILY_COST", "0")),
+        budget_policy=_get_choice("BUDGET_POLICY", "downgrade", ("downgrade", "shrink", "refuse")),
+        budget_fallback_model=os.getenv("BUDGET_FALLBACK_MODEL", ""),
+        budget_shrink_messages=int(os.getenv("BUDGET_SHRINK_MESSAGES", "4")),
+        budget_hard_limit_factor=float(os.getenv("BUDGET_HARD_LIMIT_FACTOR", "2")),
+        budget_state_path=os.getenv("BUDGET_STATE_PATH", ""),
+        budget_save_interval=float(os.getenv("BUDGET_SAVE_INTERVAL", "60")),
+        llm_prices=_get_price_table("LLM_PRICES"),
+        admin_user_ids=_get_id_set("ADMIN_USER_IDS"),
+        loop_lag_interval=float(os.getenv("LOOP_LAG_INTERVAL", "1")),
+        admin_profile_max_seconds=float(os.getenv("ADMIN_PROFILE_MAX_SECONDS", "30")),
+        runtime_mode=_get_choice("RUNTIME_MODE", "asyncio", ("asyncio", "uvloop", "auto")),
+        eager_tasks=_get_bool("EAGER_TASKS", "false"),
+        # Railway и подобные платформы передают порт в PORT
+        health_port=int(os.getenv("HEALTH_PORT", os.getenv("PORT", "0"))),
+        health_probe_interval=float(os.getenv("HEALTH_PROBE_INTERVAL", "15")),
+        health_probe_timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT", "5")),
+        health_probe_ttl=float(os.getenv("HEALTH_PROBE_TTL", "60")),
+        health_max_send_queue=int(os.getenv("HEALTH_MAX_SEND_QUEUE", "200")),
+        health_max_in_flight=int(os.getenv("HEALTH_MAX_IN_FLIGHT", "100")),
+        leads_db_path=os.getenv("LEADS_DB_PATH", ""),
+        leads_queue_size=int(os.getenv("LEADS_QUEUE_SIZE", "1000")),
+        leads_batch_size=int(os.getenv("LEADS_BATCH_SIZE", "100")),
+        leads_flush_interval=float(os.getenv("LEADS_FLUSH_INTERVAL", "5")),
+    )
+
+def get_settings() -> Settings:
+    """Получить настройки (разбираются при первом обращении)"""
+    global _settings
+    if _settings is None:
+        _settings = load_settings()
+    return _settings
+
+def reload_settings() -> Settings:
+    """Перечитать переменные окружения (например, в тестах)"""
+    global _settings
+    _settings = load_settings()
+    return _settings
 
 def get_telegram_token() -> str:
     """Получить токен Telegram бота из переменных окружения"""
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    token = get_settings().telegram_token
     if not token:
         raise ValueError("TELEGRAM_BOT_TOKEN not found in environment variables")
     return token
 
 def get_log_level() -> str:
     """Получить уровень логирования из переменных окружения"""
-    return os.getenv("LOG_LEVEL", "INFO")
+    return get_settings().log_level
 
 def get_openrouter_api_key() -> str:
     """Получить ключ API OpenRouter из переменных окружения"""
-    api_key = os.getenv("OPENROUTER_API_KEY")
+    api_key = get_settings().openrouter_api_key
     if not api_key:
         raise ValueError("OPENROUTER_API_KEY not found in environment variables")
     return api_key
 
+def get_openrouter_base_url() -> str:
+    """Получить адрес OpenAI-совместимого API (по умолчанию OpenRouter)"""
+    return get_settings().openrouter_base_url
+
 def get_llm_model() -> str:
     """Получить модель LLM из переменных окружения"""
-    return os.getenv("LLM_MODEL", "anthropic/claude-3-haiku")
+    return get_settings().llm_model
 
 def get_llm_timeout() -> int:
     """Получить таймаут для запросов к LLM"""
-    return int(os.getenv("LLM_TIMEOUT", "30")) 
\ No newline at end of file
+    return get_settings().llm_timeout
+
+def get_llm_warmup_enabled() -> bool:
+    """Прогревать ли соединение и кэш промпта LLM после /start"""
+    return get_settings().llm_warmup_enabled
+
+def get_llm_warmup_request_timeout() -> float:
+    """Получить таймаут HTTP-запроса прогрева LLM (секунды)"""
+    return get_settings().llm_warmup_request_timeout
+
+def get_llm_circuit_failure_threshold() -> int:
+    """Получить количество неудачных запросов подряд, после которого LLM временно не вызывается"""
+    return get_settings().llm_circuit_failure_threshold
+
+def get_llm_circuit_reset_timeout() -> float:
+    """Получить время до пробного запроса к LLM после размыкания (секунды)"""
+    return get_settings().llm_circuit_reset_timeout
+
+def get_fallback_docs_dir() -> str:
+    """Получить каталог документации для резервных ответов (пусто — только каталог услуг)"""
+    return get_settings().fallback_docs_dir
+
+def get_fuzzy_max_edit_distance() -> int:
+    """Получить максимальное число правок при сопоставлении слов с опечатками (0 — только точные совпадения)"""
+    return get_settings().fuzzy_max_edit_distance
+
+def get_fuzzy_min_confidence() -> float:
+    """Получить минимальную уверенность нечеткого совпадения, при которой услуга попадает в промпт"""
+    return get_settings().fuzzy_min_confidence
+
+def get_service_relevance_decay() -> float:
+    """Получить множитель затухания релевантности услуги за каждый ход диалога без ее упоминания"""
+    return get_settings().service_relevance_decay
+
+def get_service_relevance_min_score() -> float:
+    """Получить минимальную релевантность, при которой услуга остается в промпте"""
+    return get_settings().service_relevance_min_score
+
+def get_service_relevance_top() -> int:
+    """Получить максимальное количество релевантных услуг в промпте"""
+    return get_settings().service_relevance_top
+
+def get_service_relevance_ttl() -> float:
+    """Получить время хранения релевантности услуг неактивного чата (секунды)"""
+    return get_settings().service_relevance_ttl
+
+def get_event_log_path() -> str:
+    """Получить путь к журналу событий метрик (пусто — журнал отключен)"""
+    return get_settings().event_log_path
+
+def get_event_log_max_bytes() -> int:
+    """Получить размер файла журнала событий, после которого он ротируется (байты)"""
+    return get_settings().event_log_max_bytes
+
+def get_event_log_backups() -> int:
+    """Получить количество хранимых ротированных файлов журнала событий"""
+    return get_settings().event_log_backups
+
+def get_log_content_policy() -> Mapping[str, Tuple[int, float]]:
+    """Получить переопределения политики логирования содержимого: {поле: (длина, доля)}"""
+    return get_settings().log_content_policy
+
+def get_typing_indicator_enabled() -> bool:
+    """Показывать ли статус "печатает" во время генерации ответа"""
+    return get_settings().typing_indicator_enabled
+
+def get_typing_interval() -> float:
+    """Получить интервал обновления статуса "печатает" (Telegram показывает его ~5 секунд)"""
+    return get_settings().typing_interval
+
+def get_redis_url() -> str:
+    """Получить адрес общего хранилища состояния (redis://; пустая строка — состояние в памяти процесса)"""
+    return get_settings().redis_url
+
+def get_redis_pool_size() -> int:
+    """Получить размер пула соединений с хранилищем состояния"""
+    return get_settings().redis_pool_size
+
+def get_redis_timeout() -> float:
+    """Получить таймаут операций с хранилищем состояния (секунды)"""
+    return get_settings().redis_timeout
+
+def get_redis_key_prefix() -> str:
+    """Получить префикс ключей в хранилище состояния"""
+    return get_settings().redis_key_prefix
+
+def get_redis_dialog_ttl() -> int:
+    """Получить время хранения неактивной истории чата в хранилище (секунды, 0 — бессрочно)"""
+    return get_settings().redis_dialog_ttl
+
+def get_dialog_max_messages() -> int:
+    """Получить максимальное количество сообщений в истории чата (0 — без ограничения)"""
+    return get_settings().dialog_max_messages
+
+def get_dialog_active_window() -> float:
+    """Получить окно, в котором чат считается активным (секунды)"""
+    return get_settings().dialog_active_window
+
+def get_dialog_stats_interval() -> float:
+    """Получить интервал публикации метрик диалогов (секунды, 0 — отключено)"""
+    return get_settings().dialog_stats_interval
+
+def get_llm_max_message_chars() -> int:
+    """Получить максимальную длину одного сообщения (кроме системного), отправляемого в LLM"""
+    return get_settings().llm_max_message_chars
+
+def get_llm_max_total_chars() -> int:
+    """Получить максимальный суммарный размер запроса к LLM в символах"""
+    return get_settings().llm_max_total_chars
+
+def get_send_max_retries() -> int:
+    """Получить количество повторных попыток отправки при ограничении Telegram (retry_after)"""
+    return get_settings().send_max_retries
+
+def get_send_global_rate() -> float:
+    """Получить общий лимит отправки сообщений в Telegram (сообщений в секунду)"""
+    return get_settings().send_global_rate
+
+def get_send_chat_rate() -> float:
+    """Получить лимит отправки сообщений в один чат (сообщений в секунду)"""
+    return get_settings().send_chat_rate
+
+def get_send_chat_burst() -> int:
+    """Получить допустимый всплеск отправки в один чат"""
+    return get_settings().send_chat_burst
+
+def get_send_short_reply_chars() -> int:
+    """Получить длину ответа, до которой он отправляется с повышенным приоритетом"""
+    return get_settings().send_short_reply_chars
+
+def get_record_updates_path() -> str:
+    """Получить путь к файлу записи входящих сообщений для воспроизведения (пустая строка — запись отключена)"""
+    return get_settings().record_updates_path
+
+def get_idempotency_window() -> float:
+    """Получить время, в течение которого повторно доставленное обновление пропускается (секунды)"""
+    return get_settings().idempotency_window
+
+def get_idempotency_max_keys() -> int:
+    """Получить максимальное количество запоминаемых ключей обработанных обновлений"""
+    return get_settings().idempotency_max_keys
+
+def get_throttle_user_burst() -> int:
+    """Получить максимальный всплеск сообщений от одного пользователя"""
+    return get_settings().throttle_user_burst
+
+def get_throttle_user_rate() -> float:
+    """Получить скорость восполнения лимита пользователя (сообщений в секунду)"""
+    return get_settings().throttle_user_rate
+
+def get_throttle_chat_burst() -> int:
+    """Получить максимальный всплеск сообщений в одном чате"""
+    return get_settings().throttle_chat_burst
+
+def get_throttle_chat_rate() -> float:
+    """Получить скорость восполнения лимита чата (сообщений в секунду)"""
+    return get_settings().throttle_chat_rate
+
+def get_throttle_idle_ttl() -> int:
+    """Получить время простоя (в секундах), после которого лимиты пользователя сбрасываются"""
+    return get_settings().throttle_idle_ttl
+
+def get_compact_command_history() -> bool:
+    """Сохранять ли в историю краткую ссылку вместо полного текста ответов команд"""
+    return get_settings().compact_command_history
+
+def get_service_catalog_path() -> str:
+    """Получить путь к файлу каталога услуг (JSON)"""
+    return get_settings().service_catalog_path
+
+def get_catalog_reload_interval() -> float:
+    """Получить интервал проверки изменений файла каталога (секунды, 0 — без перезагрузки)"""
+    return get_settings().catalog_reload_interval
+
+def get_dialog_snapshot_path() -> str:
+    """Получить путь к файлу снимка диалогов (пустая строка — снимок отключен)"""
+    return get_settings().dialog_snapshot_path
+
+def get_shutdown_drain_timeout() -> float:
+    """Получить максимальное время ожидания обработки запросов при остановке (секунды)"""
+    return get_settings().shutdown_drain_timeout
+
+def get_budget_user_daily_tokens() -> int:
+    """Получить дневной бюджет токенов на пользователя (0 — без ограничения)"""
+    return get_settings().budget_user_daily_tokens
+
+def get_budget_user_daily_cost() -> float:
+    """Получить дневной бюджет стоимости запросов на пользователя в долларах (0 — без ограничения)"""
+    return get_settings().budget_user_daily_cost
+
+def get_budget_global_daily_tokens() -> int:
+    """Получить дневной бюджет токенов на весь бот (0 — без ограничения)"""
+    return get_settings().budget_global_daily_tokens
+
+def get_budget_global_daily_cost() -> float:
+    """Получить дневной бюджет стоимости запросов на весь бот в долларах (0 — без ограничения)"""
+    return get_settings().budget_global_daily_cost
+
+def get_budget_policy() -> str:
+    """Получить действие при превышении бюджета: downgrade, shrink или refuse"""
+    return get_settings().budget_policy
+
+def get_budget_fallback_model() -> str:
+    """Получить более дешевую модель для политики downgrade (пусто — вместо нее применяется shrink)"""
+    return get_settings().budget_fallback_model
+
+def get_budget_shrink_messages() -> int:
+    """Получить количество сообщений истории в запросе при превышении бюджета"""
+    return get_settings().budget_shrink_messages
+
+def get_budget_hard_limit_factor() -> float:
+    """Получить кратность бюджета, после которой запросы отклоняются при любой политике (0 — не отклоняются)"""
+    return get_settings().budget_hard_limit_factor
+
+def get_budget_state_path() -> str:
+    """Получить путь к файлу со счетчиками бюджетов (пусто — счетчики не сохраняются)"""
+    return get_settings().budget_state_path
+
+def get_budget_save_interval() -> float:
+    """Получить интервал сохранения счетчиков бюджетов (секунды)"""
+    return get_settings().budget_save_interval
+
+def get_llm_prices() -> Mapping[str, Tuple[float, float]]:
+    """Получить цены моделей {модель: (запрос, ответ)} в долларах за миллион токенов"""
+    return get_settings().llm_prices
+
+def get_admin_user_ids() -> FrozenSet[int]:
+    """Получить ID пользователей, которым доступны служебные команды"""
+    return get_settings().admin_user_ids
+
+def get_loop_lag_interval() -> float:
+    """Получить интервал измерения задержки цикла событий (секунды, 0 — не измеряется)"""
+    return get_settings().loop_lag_interval
+
+def get_admin_profile_max_seconds() -> float:
+    """Получить максимальную длительность профилирования по служебной команде (секунды)"""
+    return get_settings().admin_profile_max_seconds
+
+def get_runtime_mode() -> str:
+    """Получить режим цикла событий: asyncio, uvloop или auto (uvloop, если установлен)"""
+    return get_settings().runtime_mode
+
+def get_eager_tasks() -> bool:
+    """Получить флаг жадной фабрики задач asyncio (Python 3.12+)"""
+    return get_settings().eager_tasks
+
+def get_health_port() -> int:
+    """Получить порт эндпоинтов /healthz и /readyz (HEALTH_PORT или PORT; 0 — отключены)"""
+    return get_settings().health_port
+
+def get_health_probe_interval() -> float:
+    """Получить интервал фоновых проверок состояния (секунды)"""
+    return get_settings().health_probe_interval
+
+def get_health_probe_timeout() -> float:
+    """Получить таймаут проверки сессии Telegram (секунды)"""
+    return get_settings().health_probe_timeout
+
+def get_health_probe_ttl() -> float:
+    """Получить время, после которого результат проверки считается устаревшим (секунды)"""
+    return get_settings().health_probe_ttl
+
+def get_health_max_send_queue() -> int:
+    """Получить глубину очереди отправки, при превышении которой бот не готов принимать запросы"""
+    return get_settings().health_max_send_queue
+
+def get_health_max_in_flight() -> int:
+    """Получить число обрабатываемых обновлений, при превышении которого бот не готов принимать запросы"""
+    return get_settings().health_max_in_flight
+
+def get_leads_db_path() -> str:
+    """Получить путь к базе SQLite заявок (пусто — заявки не собираются)"""
+    return get_settings().leads_db_path
+
+def get_leads_queue_size() -> int:
+    """Получить емкость очереди сообщений для выделения заявок"""
+    return get_settings().leads_queue_size
+
+def get_leads_batch_size() -> int:
+    """Получить количество заявок, при накоплении которого они записываются досрочно"""
+    return get_settings().leads_batch_size
+
+def get_leads_flush_interval() -> float:
+    """Получить интервал записи накопленных заявок (секунды)"""
+    return get_settings().leads_flush_interval
@@ -0,0 +1,171 @@
+"""
+Анализ журнала событий метрик (NDJSON, см. EventSink в llm/logging_utils.py)
+
+Файлы читаются построчно, а задержки накапливаются в гистограмме с
+логарифмическими корзинами, поэтому память не зависит от размера журнала.
+
+Использование:
+    python -m llm.analyze_events /data/events.ndjson /data/events.ndjson.1
+    python -m llm.analyze_events --json /data/events.ndjson*
+"""
+import argparse
+import json
+import math
+import sys
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+# Границы корзин гистограммы задержек: от 10 мс до ~10 минут с шагом 5%
+LATENCY_BUCKETS = tuple(0.01 * 1.05 ** i for i in range(int(math.log(60000) / math.log(1.05)) + 2))
+
+class LatencyHistogram:
+    """Гистограмма задержек для приближенного вычисления перцентилей (погрешность до 5%)"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        """Учесть значение задержки (секунды)"""
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """Получить верхнюю границу корзины, в которую попадает перцентиль q (0..100)"""
+        if not self.total:
+            return 0.0
+        rank = math.ceil(self.total * q / 100)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(LATENCY_BUCKETS[index], self.max) if index < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+def read_events(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Построчно прочитать события из файлов журнала, пропуская поврежденные строки
+
+    Args:
+        paths: Пути к файлам журнала
+
+    Yields:
+        События в виде словарей
+    """
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(event, dict):
+                    yield event
+
+def _add_tokens(totals: Dict[Any, Dict[str, int]], key: Any, event: Dict[str, Any]) -> None:
+    """Прибавить токены запроса к итогам по ключу"""
+    entry = totals.setdefault(key, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+    entry["requests"] += 1
+    entry["prompt_tokens"] += event.get("prompt_tokens") or 0
+    entry["completion_tokens"] += event.get("completion_tokens") or 0
+
+def analyze_events(events: Iterable[Dict[str, Any]], top_chats: int = 10) -> Dict[str, Any]:
+    """
+    Посчитать сводку по событиям за один проход
+
+    Args:
+        events: Поток событий
+        top_chats: Сколько чатов с наибольшим расходом токенов включить в отчет
+
+    Returns:
+        Перцентили задержки LLM, доля ошибок, токены по моделям и чатам, счетчики событий
+    """
+    latency = LatencyHistogram()
+    event_counts: Dict[str, int] = {}
+    llm_errors: Dict[str, int] = {}
+    llm_failed = 0
+    tokens_by_model: Dict[str, Dict[str, int]] = {}
+    tokens_by_chat: Dict[Any, Dict[str, int]] = {}
+
+    for event in events:
+        event_type = event.get("event_type", "unknown")
+        event_counts[event_type] = event_counts.get(event_type, 0) + 1
+        if event_type != "llm_request":
+            continue
+
+        elapsed = event.get("elapsed_time")
+        if isinstance(elapsed, (int, float)):
+            latency.add(elapsed)
+        if not event.get("success"):
+            llm_failed += 1
+        if event.get("error"):
+            llm_errors[event["error"]] = llm_errors.get(event["error"], 0) + 1
+        _add_tokens(tokens_by_model, event.get("model") or "unknown", event)
+        _add_tokens(tokens_by_chat, event.get("chat_id"), event)
+
+    def spend(entry: Dict[str, int]) -> int:
+        return entry["prompt_tokens"] + entry["completion_tokens"]
+
+    top = sorted(tokens_by_chat.items(), key=lambda item: spend(item[1]), reverse=True)[:top_chats]
+    return {
+        "events": event_counts,
+        "llm_requests": latency.total,
+        "llm_error_rate": round(llm_failed / latency.total, 4) if latency.total else 0.0,
+        "llm_errors": llm_errors,
+        # Сообщения, пришедшие в чат во время генерации ответа на предыдущее
+        "resend_rate": round(event_counts.get("resend", 0) / latency.total, 4) if latency.total else 0.0,
+        "latency": {
+            "p50": round(latency.percentile(50), 3),
+            "p90": round(latency.percentile(90), 3),
+            "p99": round(latency.percentile(99), 3),
+            "max": round(latency.max, 3),
+            "mean": round(latency.sum / latency.total, 3) if latency.total else 0.0,
+        },
+        "tokens_by_model": tokens_by_model,
+        "top_chats_by_tokens": [{"chat_id": chat_id, **entry} for chat_id, entry in top],
+        "chats": len(tokens_by_chat),
+    }
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Оформить сводку в виде текста"""
+    latency = report["latency"]
+    lines = [
+        f"LLM requests: {report['llm_requests']} | Error rate: {report['llm_error_rate']:.2%} | "
+        f"Resend rate: {report['resend_rate']:.2%}",
+        f"Latency: p50 {latency['p50']}s | p90 {latency['p90']}s | p99 {latency['p99']}s | "
+        f"max {latency['max']}s | mean {latency['mean']}s",
+    ]
+    if report["llm_errors"]:
+        lines.append("Errors: " + ", ".join(f"{error}={count}" for error, count in report["llm_errors"].items()))
+    lines.append("Tokens by model:")
+    for model, entry in report["tokens_by_model"].items():
+        lines.append(f"  {model}: requests={entry['requests']} prompt={entry['prompt_tokens']} "
+                     f"completion={entry['completion_tokens']}")
+    lines.append(f"Top chats by tokens (of {report['chats']}):")
+    for entry in report["top_chats_by_tokens"]:
+        lines.append(f"  {entry['chat_id']}: requests={entry['requests']} prompt={entry['prompt_tokens']} "
+                     f"completion={entry['completion_tokens']}")
+    lines.append("Events: " + ", ".join(f"{name}={count}" for name, count in sorted(report["events"].items())))
+    return "\n".join(lines)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа командной строки"""
+    parser = argparse.ArgumentParser(description="Анализ журнала событий метрик бота")
+    parser.add_argument("paths", nargs="+", help="Файлы журнала событий (NDJSON)")
+    parser.add_argument("--json", action="store_true", help="Вывести сводку в формате JSON")
+    parser.add_argument("--top", type=int, default=10, help="Количество чатов в рейтинге расхода токенов")
+    args = parser.parse_args(argv)
+
+    report = analyze_events(read_events(args.paths), top_chats=args.top)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""
+Дневные бюджеты токенов и стоимости запросов к LLM
+
+Счетчики ведутся в памяти процесса отдельно для каждого пользователя и для
+всего бота за последние 24 часа: скользящее окно из часовых интервалов,
+расход интервалов старше окна вычитается из суммы при обращении. Проверка и
+учет — несколько обращений к словарю, без сетевых запросов и ввода-вывода,
+поэтому не добавляют заметной задержки к обработке сообщения. Счетчики
+периодически сохраняются в JSON (BUDGET_STATE_PATH), чтобы перезапуск не
+обнулял расход.
+
+При превышении бюджета применяется политика BUDGET_POLICY:
+"downgrade" — запрос к более дешевой модели (BUDGET_FALLBACK_MODEL),
+"shrink" — меньше сообщений истории в запросе (BUDGET_SHRINK_MESSAGES),
+"refuse" — вежливый отказ без обращения к LLM. После превышения бюджета
+в BUDGET_HARD_LIMIT_FACTOR раз запросы отклоняются при любой политике.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
+from config import (
+    get_budget_user_daily_tokens,
+    get_budget_user_daily_cost,
+    get_budget_global_daily_tokens,
+    get_budget_global_daily_cost,
+    get_budget_policy,
+    get_budget_fallback_model,
+    get_budget_hard_limit_factor,
+    get_budget_state_path,
+    get_budget_save_interval,
+    get_llm_prices,
+)
+
+logger = logging.getLogger(__name__)
+
+BUDGET_POLICIES = ("downgrade", "shrink", "refuse")
+
+SECONDS_PER_DAY = 86400
+
+# Скользящее окно бюджета: WINDOW_SLOTS интервалов по SLOT_SECONDS секунд
+WINDOW_SLOTS = 24
+SLOT_SECONDS = SECONDS_PER_DAY // WINDOW_SLOTS
+
+# Версия формата файла состояния
+STATE_VERSION = 2
+
+# Индексы счетчиков: [prompt_tokens, completion_tokens, cost, requests]
+PROMPT, COMPLETION, COST, REQUESTS = range(4)
+
+# Окно счетчиков: [сумма за окно, deque[(номер интервала, счетчики интервала)]]
+Window = List[Any]
+
+def _new_window(size: int) -> Window:
+    """Пустое окно из size счетчиков"""
+    return [[0] * size, deque()]
+
+_global: Window = _new_window(4)
+# Окна пользователей упорядочены по времени последнего расхода,
+# поэтому пользователи без расхода за окно вытесняются из начала за O(1)
+_users: "OrderedDict[str, Window]" = OrderedDict()
+# Сколько раз применялась каждая политика за окно (в порядке BUDGET_POLICIES)
+_actions: Window = _new_window(len(BUDGET_POLICIES))
+_dirty = False
+
+def _slot(now: float) -> int:
+    """Номер интервала окна для момента времени"""
+    return int(now // SLOT_SECONDS)
+
+def _expire(window: Window, slot: int) -> None:
+    """Вычесть из суммы окна интервалы, вышедшие за окно"""
+    total, slots = window
+    while slots and slots[0][0] <= slot - WINDOW_SLOTS:
+        _, values = slots.popleft()
+        for i, value in enumerate(values):
+            total[i] -= value
+    if not slots:
+        # Пустое окно обнуляется явно, чтобы не накапливалась погрешность вычитания стоимости
+        total[:] = [0] * len(total)
+
+def _add(window: Window, slot: int, values: List[float]) -> None:
+    """Добавить расход в текущий интервал окна"""
+    _expire(window, slot)
+    total, slots = window
+    if not slots or slots[-1][0] != slot:
+        slots.append((slot, [0] * len(values)))
+    current = slots[-1][1]
+    for i, value in enumerate(values):
+        current[i] += value
+        total[i] += value
+
+def _prune_users(slot: int) -> None:
+    """Удалить пользователей без расхода за окно"""
+    while _users:
+        window = next(iter(_users.values()))
+        _expire(window, slot)
+        if window[1]:
+            break
+        _users.popitem(last=False)
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Оценить стоимость запроса по ценам из LLM_PRICES
+
+    Args:
+        model: Модель, к которой выполнялся запрос
+        prompt_tokens: Токены запроса
+        completion_tokens: Токены ответа
+
+    Returns:
+        Стоимость в долларах; 0 для модели без указанной цены
+    """
+    prompt_price, completion_price = get_llm_prices().get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+def record_usage(user_id: str,
+                 model: str,
+                 prompt_tokens: Optional[int],
+                 completion_tokens: Optional[int],
+                 now: Optional[float] = None) -> float:
+    """
+    Учесть расход токенов запроса в счетчиках пользователя и бота
+
+    Args:
+        user_id: ID пользователя
+        model: Модель, к которой выполнялся запрос
+        prompt_tokens: Токены запроса из ответа API (None — не сообщены)
+        completion_tokens: Токены ответа из ответа API (None — не сообщены)
+        now: Текущее время (Unix), для тестов
+
+    Returns:
+        Оценка стоимости запроса в долларах
+    """
+    global _dirty
+    slot = _slot(time.time() if now is None else now)
+    _prune_users(slot)
+
+    prompt_tokens = prompt_tokens or 0
+    completion_tokens = completion_tokens or 0
+    cost = estimate_cost(model, prompt_tokens, completion_tokens)
+
+    window = _users.get(user_id)
+    if window is None:
+        window = _users[user_id] = _new_window(4)
+    _users.move_to_end(user_id)
+    usage = [prompt_tokens, completion_tokens, cost, 1]
+    _add(window, slot, usage)
+    _add(_global, slot, usage)
+    _dirty = True
+    return cost
+
+def _usage_ratio(counters: List[float], token_limit: int, cost_limit: float) -> float:
+    """Доля израсходованного бюджета (наибольшая из долей по токенам и по стоимости)"""
+    ratio = 0.0
+    if token_limit > 0:
+        ratio = (counters[PROMPT] + counters[COMPLETION]) / token_limit
+    if cost_limit > 0:
+        ratio = max(ratio, counters[COST] / cost_limit)
+    return ratio
+
+def get_budget_action(user_id: str, now: Optional[float] = None) -> Optional[str]:
+    """
+    Проверить бюджет перед запросом к LLM
+
+    Args:
+        user_id: ID пользователя
+        now: Текущее время (Unix), для тестов
+
+    Returns:
+        None — бюджет не превышен; иначе действие: "downgrade", "shrink" или "refuse"
+    """
+    slot = _slot(time.time() if now is None else now)
+    _expire(_global, slot)
+    ratio = _usage_ratio(_global[0], get_budget_global_daily_tokens(), get_budget_global_daily_cost())
+    window = _users.get(user_id)
+    if window is not None:
+        _expire(window, slot)
+        ratio = max(ratio, _usage_ratio(window[0], get_budget_user_daily_tokens(), get_budget_user_daily_cost()))
+    if ratio < 1:
+        return None
+
+    hard_limit_factor = get_budget_hard_limit_factor()
+    action = get_budget_policy()
+    if hard_limit_factor > 0 and ratio >= hard_limit_factor:
+        action = "refuse"
+    elif action == "downgrade" and not get_budget_fallback_model():
+        action = "shrink"
+    _add(_actions, slot, [int(policy == action) for policy in BUDGET_POLICIES])
+    return action
+
+def get_budget_usage(user_id: str, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Получить расход пользователя за последние 24 часа
+
+    Args:
+        user_id: ID пользователя
+        now: Текущее время (Unix), для тестов
+
+    Returns:
+        Словарь с prompt_tokens, completion_tokens, cost, requests
+    """
+    window = _users.get(user_id)
+    if window is None:
+        return _counters_dict([0, 0, 0.0, 0])
+    _expire(window, _slot(time.time() if now is None else now))
+    return _counters_dict(window[0])
+
+def _counters_dict(counters: List[float]) -> Dict[str, Any]:
+    """Представить счетчики словарем"""
+    return {
+        "prompt_tokens": counters[PROMPT],
+        "completion_tokens": counters[COMPLETION],
+        "cost": round(counters[COST], 6),
+        "requests": counters[REQUESTS],
+    }
+
+def get_budget_stats(top: int = 5, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Получить сводку расхода за последние 24 часа для мониторинга
+
+    Args:
+        top: Сколько пользователей с наибольшим расходом включить
+        now: Текущее время (Unix), для тестов
+
+    Returns:
+        Словарь с расходом бота, числом пользователей, применениями политик и топом пользователей
+    """
+    slot = _slot(time.time() if now is None else now)
+    _prune_users(slot)
+    for window in (_global, _actions, *_users.values()):
+        _expire(window, slot)
+    heaviest = sorted(_users.items(), key=lambda item: item[1][0][PROMPT] + item[1][0][COMPLETION], reverse=True)[:top]
+    return {
+        "window_hours": WINDOW_SLOTS * SLOT_SECONDS // 3600,
+        "global": _counters_dict(_global[0]),
+        "users": len(_users),
+        "actions": dict(zip(BUDGET_POLICIES, _actions[0])),
+        "top_users": {user_id: _counters_dict(window[0]) for user_id, window in heaviest},
+    }
+
+def reset_budgets() -> None:
+    """Сбросить все счетчики (для тестов)"""
+    global _global, _actions, _dirty
+    _global = _new_window(4)
+    _actions = _new_window(len(BUDGET_POLICIES))
+    _users.clear()
+    _dirty = False
+
+def _serialize_state() -> str:
+    """Сериализовать интервалы окна"""
+    return json.dumps({
+        "version": STATE_VERSION,
+        "slot_seconds": SLOT_SECONDS,
+        "global": list(_global[1]),
+        "users": {user_id: list(window[1]) for user_id, window in _users.items()},
+        "actions": list(_actions[1]),
+    }, separators=(",", ":"))
+
+def _restore_window(slots: List[Any], size: int, slot: int) -> Window:
+    """Восстановить окно из сохраненных интервалов, отбросив вышедшие за окно"""
+    window = _new_window(size)
+    for index, values in slots:
+        if len(values) != size:
+            raise ValueError(f"expected {size} counters, got {len(values)}")
+        _add(window, int(index), [value if isinstance(value, float) else int(value) for value in values])
+    _expire(window, slot)
+    return window
+
+def _write_state(path: str, payload: str) -> None:
+    """Атомарно записать файл состояния: сначала во временный файл, затем переименование"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def save_budget_state(path: str) -> int:
+    """
+    Сохранить счетчики окна в JSON
+
+    Args:
+        path: Путь к файлу состояния
+        
+    Returns:
+        Количество сохраненных пользователей
+    """
+    global _dirty
+    _write_state(path, _serialize_state())
+    _dirty = False
+    return len(_users)
+
+def load_budget_state(path: str, now: Optional[float] = None) -> int:
+    """
+    Восстановить счетчики из файла состояния.
+    Интервалы старше окна, неизвестная версия или поврежденный файл игнорируются.
+
+    Args:
+        path: Путь к файлу состояния
+        now: Текущее время (Unix), для тестов
+
+    Returns:
+        Количество восстановленных пользователей
+    """
+    global _global, _actions, _dirty
+    if not os.path.exists(path):
+        return 0
+    if now is None:
+        now = time.time()
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != STATE_VERSION or state.get("slot_seconds") != SLOT_SECONDS:
+            logger.warning(f"⚠️ Unsupported budget state version in {path}")
+            return 0
+        slot = _slot(now)
+        global_window = _restore_window(state["global"], 4, slot)
+        actions_window = _restore_window(state.get("actions", []), len(BUDGET_POLICIES), slot)
+        users = {str(user_id): _restore_window(slots, 4, slot) for user_id, slots in state["users"].items()}
+    except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+        logger.error(f"❌ Failed to load budget state from {path}: {e}")
+        return 0
+
+    _global = global_window
+    _actions = actions_window
+    _users.clear()
+    # Порядок по последнему интервалу расхода, как при записи через record_usage
+    for user_id, window in sorted(users.items(), key=lambda item: item[1][1][-1][0] if item[1][1] else -1):
+        if window[1]:
+            _users[user_id] = window
+    _dirty = False
+    logger.info(f"💰 Restored budget state: {len(_users)} users, ${_global[0][COST]:.4f} spent in the last 24h")
+    return len(_users)
+
+async def persist_budget_state(path: Optional[str] = None, interval: Optional[float] = None) -> None:
+    """
+    Фоновая задача: периодически сохранять счетчики, если они изменились
+
+    Args:
+        path: Путь к файлу состояния (по умолчанию BUDGET_STATE_PATH)
+        interval: Интервал сохранения в секундах (по умолчанию BUDGET_SAVE_INTERVAL)
+    """
+    if path is None:
+        path = get_budget_state_path()
+    if interval is None:
+        interval = get_budget_save_interval()
+
+    global _dirty
+    while True:
+        await asyncio.sleep(interval)
+        if not _dirty:
+            continue
+        # Сериализация — в цикле событий (счетчики меняются только в нем), запись файла — в потоке.
+        # Флаг сбрасывается до записи, чтобы расход, учтенный во время записи, снова его выставил,
+        # и восстанавливается, если запись не удалась
+        payload = _serialize_state()
+        _dirty = False
+        try:
+            await asyncio.to_thread(_write_state, path, payload)
+        except OSError as e:
+            _dirty = True
+            logger.error(f"❌ Failed to save budget state: {e}")
@@ -0,0 +1,247 @@
+"""
+Каталог услуг компании, загружаемый из файла, с горячей перезагрузкой
+
+Все производные структуры (индекс ключевых слов, разделы промпта, тексты команд)
+строятся при загрузке в новый неизменяемый снимок, который затем атомарно
+подменяет текущий. Обработчики берут ссылку на снимок один раз на запрос и
+никогда не видят частично построенный каталог.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+from config import get_service_catalog_path, get_catalog_reload_interval
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COMPANY_FIELDS = ("name", "website", "description", "mission")
+REQUIRED_SERVICE_FIELDS = ("name", "description", "keywords", "details", "type", "target_audience")
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога со всеми производными структурами"""
+    version: int
+    checksum: str
+    source: str
+    company_info: Mapping[str, str]
+    services: Mapping[str, Mapping[str, Any]]
+    # {ключевое слово: (ключи услуг,...)}
+    keyword_index: Mapping[str, Tuple[str, ...]]
+    # Краткие описания услуг в формате find_relevant_services
+    service_summaries: Mapping[str, Mapping[str, Any]]
+    # Разделы системного промпта "О компании" и "Наши услуги"
+    prompt_sections: str
+    # Структуры, построенные зарегистрированными модулями (тексты команд и т.п.)
+    derived: Mapping[str, Any]
+
+# Построители производных структур: {имя: функция(snapshot) -> значение}
+_derived_builders: Dict[str, Callable[[CatalogSnapshot], Any]] = {}
+
+_current: Optional[CatalogSnapshot] = None
+_source_stat: Optional[Tuple[int, int]] = None
+
+def validate_catalog_data(data: Any) -> None:
+    """
+    Проверить структуру данных каталога
+
+    Args:
+        data: Распарсенное содержимое файла каталога
+
+    Raises:
+        ValueError: если каталог некорректен
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Catalog must be a JSON object")
+
+    company = data.get("company")
+    if not isinstance(company, dict):
+        raise ValueError("Catalog field 'company' must be an object")
+    for field in REQUIRED_COMPANY_FIELDS:
+        if not isinstance(company.get(field), str) or not company[field]:
+            raise ValueError(f"Company field '{field}' must be a non-empty string")
+
+    services = data.get("services")
+    if not isinstance(services, dict) or not services:
+        raise ValueError("Catalog field 'services' must be a non-empty object")
+
+    for service_key, service in services.items():
+        if not isinstance(service, dict):
+            raise ValueError(f"Service '{service_key}' must be an object")
+        for field in REQUIRED_SERVICE_FIELDS:
+            if field not in service:
+                raise ValueError(f"Service '{service_key}' is missing field '{field}'")
+        for field in ("keywords", "details"):
+            value = service[field]
+            if not isinstance(value, list) or not value or not all(isinstance(item, str) and item for item in value):
+                raise ValueError(f"Service '{service_key}' field '{field}' must be a non-empty list of strings")
+        for field in ("name", "description", "type", "target_audience"):
+            if not isinstance(service[field], str) or not service[field]:
+                raise ValueError(f"Service '{service_key}' field '{field}' must be a non-empty string")
+
+def _freeze(value: Any) -> Any:
+    """Рекурсивно сделать структуру неизменяемой"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _build_keyword_index(services: Mapping[str, Mapping[str, Any]]) -> Mapping[str, Tuple[str, ...]]:
+    """Построить индекс {ключевое слово: ключи услуг}"""
+    index: Dict[str, list] = {}
+    for service_key, service in services.items():
+        for keyword in service["keywords"]:
+            keys = index.setdefault(keyword.lower(), [])
+            if service_key not in keys:
+                keys.append(service_key)
+    return MappingProxyType({keyword: tuple(keys) for keyword, keys in index.items()})
+
+def _render_prompt_sections(company: Mapping[str, str], services: Mapping[str, Mapping[str, Any]]) -> str:
+    """Отрисовать разделы системного промпта о компании и услугах"""
+    lines = [
+        "## О компании:",
+        f"• **Название**: {company['name']}",
+        f"• **Веб-сайт**: {company['website']}",
+        f"• **Миссия**: {company['mission']}",
+    ]
+    if company.get("specialization"):
+        lines.append(f"• **Специализация**: {company['specialization']}")
+    lines += ["", "## Наши услуги:"]
+
+    for service in services.values():
+        icon = service.get("icon", "•")
+        lines += ["", f"### {icon} {service['name']} ({service['type']})", service["description"]]
+
+    return "\n".join(lines)
+
+def build_snapshot(data: Dict[str, Any], version: int, checksum: str, source: str) -> CatalogSnapshot:
+    """
+    Построить снимок каталога со всеми производными структурами
+
+    Args:
+        data: Проверенные данные каталога
+        version: Номер версии снимка
+        checksum: Контрольная сумма содержимого файла
+        source: Путь к файлу каталога
+
+    Returns:
+        Новый снимок каталога
+    """
+    company = _freeze(data["company"])
+    services = _freeze(data["services"])
+    summaries = MappingProxyType({
+        service_key: MappingProxyType({
+            "key": service_key,
+            "name": service["name"],
+            "description": service["description"],
+            "details": service["details"],
+            "type": service["type"],
+            "target_audience": service["target_audience"],
+        })
+        for service_key, service in services.items()
+    })
+
+    snapshot = CatalogSnapshot(
+        version=version,
+        checksum=checksum,
+        source=source,
+        company_info=company,
+        services=services,
+        keyword_index=_build_keyword_index(services),
+        service_summaries=summaries,
+        prompt_sections=_render_prompt_sections(company, services),
+        derived=MappingProxyType({}),
+    )
+    return _with_derived(snapshot)
+
+def _with_derived(snapshot: CatalogSnapshot) -> CatalogSnapshot:
+    """Построить производные структуры зарегистрированных модулей"""
+    derived = {name: builder(snapshot) for name, builder in _derived_builders.items()}
+    return replace(snapshot, derived=MappingProxyType(derived))
+
+def register_derived(name: str, builder: Callable[[CatalogSnapshot], Any]) -> None:
+    """
+    Зарегистрировать построитель производной структуры каталога.
+    Структура строится сразу для текущего снимка и при каждой перезагрузке.
+
+    Args:
+        name: Имя структуры в snapshot.derived
+        builder: Функция, строящая структуру по снимку
+    """
+    global _current
+    _derived_builders[name] = builder
+    if _current is not None:
+        _current = _with_derived(_current)
+
+def reload_catalog(path: Optional[str] = None) -> bool:
+    """
+    Загрузить каталог из файла и атомарно заменить текущий снимок
+
+    Args:
+        path: Путь к файлу каталога (по умолчанию из конфигурации)
+
+    Returns:
+        True если каталог изменился и был заменен
+
+    Raises:
+        ValueError, OSError: если файл не читается или некорректен; текущий снимок при этом не меняется
+    """
+    global _current, _source_stat
+    path = path or get_service_catalog_path()
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    stat = os.stat(path)
+
+    checksum = hashlib.sha256(raw).hexdigest()[:12]
+    if _current is not None and _current.checksum == checksum and _current.source == path:
+        _source_stat = (stat.st_mtime_ns, stat.st_size)
+        return False
+
+    data = json.loads(raw.decode("utf-8"))
+    validate_catalog_data(data)
+
+    version = _current.version + 1 if _current is not None else 1
+    snapshot = build_snapshot(data, version, checksum, path)
+
+    _current = snapshot
+    _source_stat = (stat.st_mtime_ns, stat.st_size)
+    logger.info(f"📚 CATALOG LOADED | Version: {version} | Services: {len(snapshot.services)} | Checksum: {checksum}")
+    return True
+
+def get_catalog() -> CatalogSnapshot:
+    """Получить текущий снимок каталога"""
+    if _current is None:
+        reload_catalog()
+    return _current
+
+async def watch_catalog(interval: Optional[float] = None) -> None:
+    """
+    Фоновая задача: следить за изменением файла каталога и перезагружать его
+
+    Args:
+        interval: Интервал проверки в секундах (по умолчанию из конфигурации)
+    """
+    interval = interval if interval is not None else get_catalog_reload_interval()
+    if interval <= 0:
+        return
+
+    global _source_stat
+    logger.info(f"Catalog watcher started, interval={interval}s")
+    while True:
+        await asyncio.sleep(interval)
+        path = get_catalog().source
+        try:
+            stat = os.stat(path)
+            file_stat = (stat.st_mtime_ns, stat.st_size)
+            if file_stat == _source_stat:
+                continue
+            # Запоминаем состояние файла до загрузки, чтобы не повторять неудачную попытку до следующего изменения
+            _source_stat = file_stat
+            reload_catalog(path)
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ CATALOG RELOAD FAILED | Keeping version {get_catalog().version} | Error: {e}")
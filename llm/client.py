@@ -1,9 +1,22 @@
 import asyncio
 import logging
 import time
-from openai import OpenAI, APIError, RateLimitError, APITimeoutError
-from typing import List, Dict, Optional
-from config import get_openrouter_api_key, get_llm_model, get_llm_timeout
+from types import SimpleNamespace
+from typing import Any, List, Dict, Optional
+from config import (
+    get_openrouter_api_key,
+    get_openrouter_base_url,
+    get_llm_model,
+    get_llm_timeout,
+    get_llm_warmup_request_timeout,
+    get_llm_max_message_chars,
+    get_llm_max_total_chars,
+    get_llm_circuit_failure_threshold,
+    get_llm_circuit_reset_timeout,
+)
+from llm.fallback import build_fallback_answer
+from llm.logging_utils import log_content
+from llm.prompts import get_base_system_prompt
 
 logger = logging.getLogger(__name__)
 
@@ -11,13 +24,170 @@ logger = logging.getLogger(__name__)
 MAX_RETRIES = 3
 RETRY_DELAY = 1.0  # секунды
 
-async def get_llm_response(messages: List[Dict[str, str]], max_retries: int = MAX_RETRIES) -> str:
+VALID_ROLES = frozenset(("system", "user", "assistant"))
+
+# Имена из SDK openai, которые импортируются лениво при первом обращении:
+# импорт openai (с его pydantic-моделями) занимает сотни миллисекунд холодного старта
+_OPENAI_NAMES = ("OpenAI", "APIError", "RateLimitError", "APITimeoutError")
+
+# Клиент создается при первом запросе и переиспользуется (пул HTTP-соединений)
+_client: Optional[Any] = None
+_client_key: Optional[tuple] = None
+
+# Размыкатель цепи: после серии неудачных запросов LLM временно не вызывается,
+# пользователи сразу получают резервный ответ, затем выполняется один пробный запрос
+# (остальные запросы до его успеха получают резервный ответ)
+_circuit: Dict[str, Any] = {
+    "failures": 0,
+    "opened_at": None,
+    "probing": False,
+}
+
+# Количество выполняющихся сейчас HTTP-запросов к LLM
+_in_flight = 0
+
+# Модели, для которых OpenRouter кэширует префикс промпта только по явной разметке
+# cache_control (остальные провайдеры кэшируют префикс автоматически)
+EXPLICIT_CACHE_MODEL_PREFIXES = ("anthropic/",)
+
+def get_llm_in_flight() -> int:
+    """Количество выполняющихся сейчас запросов к LLM"""
+    return _in_flight
+
+def get_circuit_state(now: Optional[float] = None) -> str:
+    """
+    Получить состояние размыкателя цепи LLM
+
+    Returns:
+        "closed" — запросы выполняются, "open" — LLM не вызывается,
+        "half_open" — разрешен пробный запрос
+    """
+    if _circuit["opened_at"] is None:
+        return "closed"
+    if now is None:
+        now = time.monotonic()
+    if now - _circuit["opened_at"] >= get_llm_circuit_reset_timeout():
+        return "half_open"
+    return "open"
+
+def _record_success() -> None:
+    """Замкнуть цепь после успешного ответа"""
+    if _circuit["opened_at"] is not None:
+        logger.info("🟢 LLM CIRCUIT CLOSED")
+    _circuit["failures"] = 0
+    _circuit["opened_at"] = None
+
+def _record_failure() -> None:
+    """Учесть неудачный запрос и разомкнуть цепь при превышении порога"""
+    _circuit["failures"] += 1
+    if _circuit["failures"] >= get_llm_circuit_failure_threshold():
+        if _circuit["opened_at"] is None or get_circuit_state() == "half_open":
+            logger.warning(f"🔴 LLM CIRCUIT OPEN | Consecutive failures: {_circuit['failures']}")
+        _circuit["opened_at"] = time.monotonic()
+
+def reset_circuit_breaker() -> None:
+    """Сбросить размыкатель цепи"""
+    _circuit["failures"] = 0
+    _circuit["opened_at"] = None
+    _circuit["probing"] = False
+
+def _load_openai_sdk() -> None:
+    """Импортировать SDK openai и опубликовать нужные имена в модуле (llm.client.OpenAI и т.п.)"""
+    module_globals = globals()
+    if all(name in module_globals for name in _OPENAI_NAMES):
+        return
+    import openai
+    for name in _OPENAI_NAMES:
+        # Не перезаписываем имена, уже подмененные (например, в тестах)
+        module_globals.setdefault(name, getattr(openai, name))
+
+def __getattr__(name: str) -> Any:
+    """Ленивый доступ к именам SDK openai (llm.client.OpenAI и т.п.)"""
+    if name in _OPENAI_NAMES:
+        _load_openai_sdk()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _openai_sdk() -> Any:
+    """Имена SDK openai (OpenAI, APIError, ...); имена, подмененные в модуле (в тестах), имеют приоритет"""
+    _load_openai_sdk()
+    module_globals = globals()
+    return SimpleNamespace(**{name: module_globals[name] for name in _OPENAI_NAMES})
+
+def _get_client() -> Any:
+    """Получить клиент OpenRouter, создав его при первом обращении"""
+    global _client, _client_key
+    openai_client = _openai_sdk().OpenAI
+    api_key = get_openrouter_api_key()
+    base_url = get_openrouter_base_url()
+    key = (openai_client, api_key, base_url)
+    if _client is None or _client_key != key:
+        _client = openai_client(base_url=base_url, api_key=api_key)
+        _client_key = key
+    return _client
+
+def _usage_value(usage: Any, name: str) -> Optional[int]:
+    """Получить счетчик токенов из ответа API, если он есть"""
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) else None
+
+def _mark_prompt_cache(messages: List[Dict[str, Any]], model: str) -> List[Dict[str, Any]]:
+    """
+    Разметить базовый системный промпт точкой кэширования cache_control
+
+    Динамическая часть системного промпта (релевантные услуги) выносится в отдельный
+    блок после точки кэширования, поэтому прогрев и реальные запросы используют
+    один и тот же закэшированный префикс.
+
+    Args:
+        messages: Сообщения запроса
+        model: Модель запроса
+
+    Returns:
+        Сообщения с размеченным системным промптом (или исходные, если разметка не нужна)
+    """
+    if not model.startswith(EXPLICIT_CACHE_MODEL_PREFIXES) or not messages or messages[0].get("role") != "system":
+        return messages
+    content = messages[0]["content"]
+    base_prompt = get_base_system_prompt()
+    if not isinstance(content, str) or not content.startswith(base_prompt):
+        return messages
+    blocks = [{"type": "text", "text": base_prompt, "cache_control": {"type": "ephemeral"}}]
+    if len(content) > len(base_prompt):
+        blocks.append({"type": "text", "text": content[len(base_prompt):]})
+    return [{"role": "system", "content": blocks}] + messages[1:]
+
+async def _create_completion(client: Any, track: bool = True, **kwargs: Any) -> Any:
+    """
+    Выполнить запрос к API в отдельном потоке
+
+    Args:
+        client: Клиент OpenAI
+        track: Учитывать запрос в счетчике выполняющихся запросов (служебные запросы не учитываются)
+        **kwargs: Параметры chat.completions.create
+    """
+    global _in_flight
+    if track:
+        _in_flight += 1
+    try:
+        return await asyncio.to_thread(client.chat.completions.create, **kwargs)
+    finally:
+        if track:
+            _in_flight -= 1
+
+async def get_llm_response(messages: List[Dict[str, str]],
+                           max_retries: int = MAX_RETRIES,
+                           stats: Optional[Dict[str, Any]] = None,
+                           model: Optional[str] = None) -> str:
     """
     Получить ответ от LLM через OpenRouter API с поддержкой повторных попыток
     
     Args:
         messages: Список сообщений в формате [{"role": "user", "content": "..."}]
         max_retries: Максимальное количество повторных попыток
+        stats: Словарь, в который записываются сведения о запросе для метрик:
+            model, success, attempts, error, fallback, prompt_tokens, completion_tokens
+        model: Модель для запроса (по умолчанию LLM_MODEL)
     
     Returns:
         Ответ от LLM
@@ -25,77 +195,110 @@ async def get_llm_response(messages: List[Dict[str, str]], max_retries: int = MA
     start_time = time.time()
     
     # Логируем только в первый раз, до цикла попыток
-    model = get_llm_model()
-    timeout = get_llm_timeout()
+    if model is None:
+        model = get_llm_model()
+    
+    if stats is None:
+        stats = {}
+    stats.update(model=model, success=False, attempts=0, error=None, fallback=False,
+                 prompt_tokens=None, completion_tokens=None)
+    
+    user_messages = [msg for msg in messages if msg.get('role') == 'user']
+    last_user_msg = user_messages[-1]['content'] if user_messages else ""
+    
+    circuit_state = get_circuit_state()
+    if circuit_state == "open" or (circuit_state == "half_open" and _circuit["probing"]):
+        logger.warning("🔴 LLM CIRCUIT OPEN | Returning fallback response")
+        stats.update(error="circuit_open", fallback=True)
+        return build_fallback_answer(last_user_msg)
     
+    # В полуоткрытом состоянии пропускается только этот запрос
+    probe = circuit_state == "half_open"
+    if probe:
+        logger.info("🟡 LLM CIRCUIT HALF-OPEN | Sending probe request")
+        _circuit["probing"] = True
+    try:
+        return await _request_with_retries(messages, model, max_retries, stats, last_user_msg, start_time)
+    finally:
+        if probe:
+            _circuit["probing"] = False
+
+async def _request_with_retries(messages: List[Dict[str, str]],
+                                model: str,
+                                max_retries: int,
+                                stats: Dict[str, Any],
+                                last_user_msg: str,
+                                start_time: float) -> str:
+    """Выполнить запрос к LLM с повторными попытками (см. get_llm_response)"""
+    timeout = get_llm_timeout()
+    _load_openai_sdk()
     logger.info(f"🔄 LLM REQUEST | Model: {model} | Messages: {len(messages)}")
     
     # Логируем системный промпт и последние сообщения только один раз
     if messages:
         system_msg = messages[0] if messages[0].get('role') == 'system' else None
         if system_msg:
-            logger.info(f"🤖 System prompt: {system_msg['content'][:200]}...")
+            log_content(logger, "system_prompt", "🤖 System prompt", system_msg['content'])
         
         # Логируем последние пользовательские сообщения
-        user_messages = [msg for msg in messages if msg.get('role') == 'user']
-        if user_messages:
-            last_user_msg = user_messages[-1]['content']
-            logger.info(f"👤 Last user message: {last_user_msg}")
+        if last_user_msg:
+            log_content(logger, "llm_user_message", "👤 Last user message", last_user_msg)
     
+    sdk = _openai_sdk()
     for attempt in range(max_retries + 1):
+        stats["attempts"] = attempt + 1
         try:
-            client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=get_openrouter_api_key()
-            )
+            client = _get_client()
             
             if attempt > 0:
                 logger.info(f"🔄 LLM RETRY | Attempt: {attempt + 1}/{max_retries + 1}")
             
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
-                model=model,
-                messages=messages,
-                timeout=timeout
-            )
-            
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
+            response = await _create_completion(
+                client,
                 model=model,
-                messages=messages,
+                messages=_mark_prompt_cache(messages, model),
                 timeout=timeout
             )
             
             if not response.choices or len(response.choices) == 0:
-                raise APIError("No choices returned from LLM API")
+                raise sdk.APIError("No choices returned from LLM API")
             
             result = response.choices[0].message.content
             if not result:
-                raise APIError("Empty content returned from LLM API")
+                raise sdk.APIError("Empty content returned from LLM API")
             
             elapsed_time = time.time() - start_time
             logger.info(f"✅ LLM RESPONSE | Success | Length: {len(result)} chars | Time: {elapsed_time:.2f}s")
-            logger.info(f"🎯 LLM Content: {result}")
+            log_content(logger, "llm_response", "🎯 LLM Content", result)
             
+            usage = getattr(response, "usage", None)
+            stats.update(success=True,
+                         prompt_tokens=_usage_value(usage, "prompt_tokens"),
+                         completion_tokens=_usage_value(usage, "completion_tokens"))
+            _record_success()
             return result
             
-        except APITimeoutError as e:
+        except sdk.APITimeoutError as e:
             logger.warning(f"LLM request timeout on attempt {attempt + 1}: {str(e)}")
             if attempt < max_retries:
                 await asyncio.sleep(RETRY_DELAY * (attempt + 1))  # Экспоненциальная задержка
                 continue
             logger.error("LLM request timeout after all retries")
-            return "Извините, сервис временно недоступен из-за превышения времени ожидания. Попробуйте позже или обратитесь к техническим специалистам."
+            _record_failure()
+            stats.update(error="timeout", fallback=True)
+            return build_fallback_answer(last_user_msg)
             
-        except RateLimitError as e:
+        except sdk.RateLimitError as e:
             logger.warning(f"LLM rate limit exceeded on attempt {attempt + 1}: {str(e)}")
             if attempt < max_retries:
                 await asyncio.sleep(RETRY_DELAY * (attempt + 2))  # Больше задержка для rate limit
                 continue
             logger.error("LLM rate limit exceeded after all retries")
-            return "Слишком много запросов к сервису. Пожалуйста, попробуйте через несколько минут."
+            _record_failure()
+            stats.update(error="rate_limit", fallback=True)
+            return build_fallback_answer(last_user_msg)
             
-        except APIError as e:
+        except sdk.APIError as e:
             error_message = str(e).lower()
             logger.warning(f"LLM API error on attempt {attempt + 1}: {str(e)}")
             
@@ -106,9 +309,12 @@ async def get_llm_response(messages: List[Dict[str, str]], max_retries: int = MA
                     continue
             
             logger.error(f"LLM API error after attempt {attempt + 1}: {str(e)}")
+            _record_failure()
+            stats["error"] = "api_error"
             if "invalid" in error_message or "unauthorized" in error_message:
                 return "Ошибка конфигурации сервиса. Обратитесь к техническим специалистам."
-            return "Извините, произошла ошибка сервиса. Попробуйте еще раз или обратитесь к техническим специалистам."
+            stats["fallback"] = True
+            return build_fallback_answer(last_user_msg)
             
         except Exception as e:
             logger.error(f"Unexpected LLM error on attempt {attempt + 1}: {str(e)}")
@@ -116,66 +322,150 @@ async def get_llm_response(messages: List[Dict[str, str]], max_retries: int = MA
                 await asyncio.sleep(RETRY_DELAY * (attempt + 1))
                 continue
             logger.error(f"Unexpected LLM error after all retries: {str(e)}")
+            _record_failure()
+            stats["error"] = "unexpected"
             return "Произошла неожиданная ошибка. Попробуйте еще раз или обратитесь к техническим специалистам."
 
-async def validate_messages(messages: List[Dict[str, str]]) -> bool:
+async def warm_up_llm(messages: List[Dict[str, str]], stats: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Прогреть LLM для предсказуемого префикса запроса: установить HTTP-соединение
+    в пуле клиента и отправить префикс с max_tokens=1, чтобы провайдеры
+    с кэшированием префикса промпта закэшировали его до реального запроса
+    (базовый системный промпт размечается cache_control, см. _mark_prompt_cache).
+    Служебный запрос не учитывается в счетчике выполняющихся запросов и
+    ограничен коротким таймаутом LLM_WARMUP_REQUEST_TIMEOUT: отмена задачи
+    не прерывает запрос в потоке, поэтому таймаут ограничивает задержку остановки.
+    
+    Args:
+        messages: Префикс запроса (системный промпт и известные сообщения)
+        stats: Словарь, в который записываются model, prompt_tokens и completion_tokens для учета расхода
+        
+    Returns:
+        True если прогрев выполнен успешно
+    """
+    if stats is None:
+        stats = {}
+    model = get_llm_model()
+    start_time = time.time()
+    try:
+        client = _get_client()
+        response = await _create_completion(
+            client,
+            track=False,
+            model=model,
+            messages=_mark_prompt_cache(messages, model),
+            max_tokens=1,
+            timeout=get_llm_warmup_request_timeout()
+        )
+    except Exception as e:
+        logger.warning(f"LLM warm-up failed: {str(e)}")
+        return False
+    
+    usage = getattr(response, "usage", None)
+    stats.update(model=model,
+                 prompt_tokens=_usage_value(usage, "prompt_tokens"),
+                 completion_tokens=_usage_value(usage, "completion_tokens"))
+    logger.info(f"🔥 LLM WARM-UP | Messages: {len(messages)} | Time: {time.time() - start_time:.2f}s")
+    return True
+
+def validate_messages(messages: List[Dict[str, str]],
+                      max_message_chars: Optional[int] = None,
+                      max_total_chars: Optional[int] = None) -> bool:
     """
-    Валидация сообщений перед отправкой в LLM
+    Валидация сообщений перед отправкой в LLM (один проход, без копирования содержимого)
     
     Args:
         messages: Список сообщений для валидации
+        max_message_chars: Максимальная длина входящего сообщения пользователя — последнего в запросе
+            (по умолчанию из конфигурации); длина сообщений истории ограничена только суммарным размером
+        max_total_chars: Максимальный суммарный размер запроса (по умолчанию из конфигурации)
         
     Returns:
         True если сообщения валидны
     """
-    if not messages or len(messages) == 0:
+    if not messages:
         logger.error("Empty messages list provided to LLM")
         return False
     
+    if max_message_chars is None:
+        max_message_chars = get_llm_max_message_chars()
+    if max_total_chars is None:
+        max_total_chars = get_llm_max_total_chars()
+    
+    total_chars = 0
+    last = len(messages) - 1
     for i, message in enumerate(messages):
         if not isinstance(message, dict):
             logger.error(f"Message {i} is not a dictionary: {type(message)}")
             return False
         
-        if "role" not in message or "content" not in message:
+        role = message.get("role")
+        content = message.get("content")
+        if role is None or content is None:
             logger.error(f"Message {i} missing required fields: {message.keys()}")
             return False
         
-        if message["role"] not in ["system", "user", "assistant"]:
-            logger.error(f"Message {i} has invalid role: {message['role']}")
+        if role not in VALID_ROLES:
+            logger.error(f"Message {i} has invalid role: {role}")
             return False
         
-        if not message["content"] or len(message["content"].strip()) == 0:
+        # isspace() проверяет строку на месте, в отличие от strip(), который создает копию
+        if not isinstance(content, str) or not content or content.isspace():
             logger.error(f"Message {i} has empty content")
             return False
+        
+        length = len(content)
+        if i == last and role == "user" and length > max_message_chars:
+            logger.error(f"Message {i} is too long: {length} > {max_message_chars} chars")
+            return False
+        total_chars += length
+    
+    if total_chars > max_total_chars:
+        logger.error(f"Request is too large: {total_chars} > {max_total_chars} chars")
+        return False
     
     return True
 
-def get_fallback_response(user_message: str = "") -> str:
+def fit_messages_to_budget(messages: List[Dict[str, str]],
+                           max_total_chars: Optional[int] = None) -> List[Dict[str, str]]:
     """
-    Получить резервный ответ при недоступности LLM
+    Убрать самые старые сообщения истории, чтобы запрос уложился в суммарный размер.
+    Системные сообщения и последнее сообщение (запрос пользователя) сохраняются.
     
     Args:
-        user_message: Сообщение пользователя для контекстного ответа
+        messages: Системный промпт, история и последнее сообщение пользователя
+        max_total_chars: Максимальный суммарный размер запроса (по умолчанию из конфигурации)
         
     Returns:
-        Резервный ответ
+        Исходный список, если он укладывается в размер, иначе новый список без старых сообщений
     """
-    user_message_lower = user_message.lower() if user_message else ""
-    
-    # Простые эвристики для резервных ответов
-    if any(keyword in user_message_lower for keyword in ["поиск", "найти", "словарь"]):
-        return ("К сожалению, сервис временно недоступен. Для информации о нашей поисковой системе "
-                "жестового языка, пожалуйста, посетите https://ods.ai/projects/sli или попробуйте позже.")
+    if max_total_chars is None:
+        max_total_chars = get_llm_max_total_chars()
+    # Некорректный запрос возвращается без изменений — его отклонит validate_messages
+    if len(messages) < 3 or not all(isinstance(message, dict) for message in messages):
+        return messages
     
-    if any(keyword in user_message_lower for keyword in ["обучение", "курс", "изучение"]):
-        return ("К сожалению, сервис временно недоступен. Для информации о наших обучающих программах "
-                "по жестовому языку, пожалуйста, посетите https://ods.ai/projects/sli или попробуйте позже.")
+    total_chars = sum(len(message.get("content") or "") for message in messages)
+    if total_chars <= max_total_chars:
+        return messages
     
-    if any(keyword in user_message_lower for keyword in ["перевод", "переводчик"]):
-        return ("К сожалению, сервис временно недоступен. Для информации о нашей системе машинного перевода "
-                "жестов, пожалуйста, посетите https://ods.ai/projects/sli или попробуйте позже.")
+    system = [message for message in messages[:-1] if message.get("role") == "system"]
+    history = [message for message in messages[:-1] if message.get("role") != "system"]
+    dropped = 0
+    while dropped < len(history) and total_chars > max_total_chars:
+        total_chars -= len(history[dropped].get("content") or "")
+        dropped += 1
+    logger.warning(f"✂️ Request trimmed to fit {max_total_chars} chars: {dropped} oldest history messages dropped")
+    return system + history[dropped:] + messages[-1:]
+
+def get_fallback_response(user_message: str = "") -> str:
+    """
+    Получить резервный ответ при недоступности LLM
     
-    return ("К сожалению, наш ИИ-ассистент временно недоступен. Пожалуйста, попробуйте позже или "
-            "посетите наш сайт https://ods.ai/projects/sli для получения информации о наших услугах. "
-            "Также можете воспользоваться командой /services для просмотра доступных решений.") 
\ No newline at end of file
+    Args:
+        user_message: Сообщение пользователя для контекстного ответа
+        
+    Returns:
+        Резервный ответ, собранный из каталога услуг без сетевых запросов
+    """
+    return build_fallback_answer(user_message)
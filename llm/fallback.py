@@ -0,0 +1,227 @@
+"""
+Резервные ответы без обращения к LLM
+
+Индекс BM25 по описаниям услуг каталога (и, при наличии, фрагментам документации)
+строится при загрузке каталога как производная структура снимка. При недоступности
+LLM ответ собирается из наиболее подходящей услуги по шаблону, без сетевых запросов.
+"""
+import logging
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple
+from config import get_fallback_docs_dir, get_fuzzy_max_edit_distance, get_fuzzy_min_confidence
+from llm.catalog import CatalogSnapshot, get_catalog, register_derived
+from llm.fuzzy import FuzzyIndex, build_fuzzy_index, lookup, strip_ending, words
+
+logger = logging.getLogger(__name__)
+
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Термы индекса — основы слов, обрезанные до префикса этой длины
+STEM_LENGTH = 6
+
+# Минимальная длина фрагмента документации, попадающего в индекс
+MIN_SNIPPET_CHARS = 80
+
+# Максимальная длина фрагмента документации в ответе
+MAX_SNIPPET_CHARS = 300
+
+_MARKDOWN_RE = re.compile(r"[#*`>_\[\]|]+")
+_CODE_BLOCK_RE = re.compile(r"```.*?```", re.S)
+
+_STOPWORDS = frozenset((
+    "и", "в", "во", "на", "с", "со", "по", "для", "как", "что", "это", "или", "не", "ли",
+    "а", "но", "от", "до", "из", "за", "у", "к", "о", "об", "мне", "мы", "вы", "я",
+    "есть", "вас", "нас", "нужно", "нужен", "нужна", "можно", "какие", "какой",
+))
+
+FALLBACK_HEADER = "⚠️ Наш ИИ-ассистент временно недоступен, но вот что может быть полезно по вашему вопросу:"
+
+@dataclass(frozen=True)
+class FallbackDocument:
+    """Документ индекса: услуга каталога или фрагмент документации"""
+    kind: str
+    key: str
+    text: str
+
+@dataclass(frozen=True)
+class FallbackIndex:
+    """Предпостроенный индекс BM25"""
+    documents: Tuple[FallbackDocument, ...]
+    # {терм: ((номер документа, вес BM25),...)}
+    postings: Mapping[str, Tuple[Tuple[int, float], ...]]
+    # Слова документов без окончаний для исправления опечаток запроса: {слово: (терм,)}
+    vocabulary: FuzzyIndex
+
+def _words(text: str) -> List[str]:
+    """Нормализованные слова текста без стоп-слов и окончаний"""
+    return [strip_ending(word) for word in words(text) if len(word) >= 2 and word not in _STOPWORDS]
+
+def tokenize(text: str) -> List[str]:
+    """Разбить текст на нормализованные термы (нижний регистр, ё→е, латинские двойники букв, обрезка окончаний)"""
+    return [word[:STEM_LENGTH] for word in _words(text)]
+
+def load_doc_snippets(docs_dir: str) -> List[FallbackDocument]:
+    """
+    Загрузить фрагменты (абзацы) Markdown-документации
+
+    Args:
+        docs_dir: Каталог с .md файлами (просматривается рекурсивно)
+
+    Returns:
+        Список фрагментов; пустой, если каталог не задан или отсутствует
+    """
+    if not docs_dir or not os.path.isdir(docs_dir):
+        return []
+
+    snippets = []
+    for root, _, files in os.walk(docs_dir):
+        for name in sorted(files):
+            if not name.endswith(".md"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    content = _CODE_BLOCK_RE.sub("", f.read())
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Fallback index: skipped {path}: {e}")
+                continue
+            for paragraph in re.split(r"\n\s*\n", content):
+                text = " ".join(_MARKDOWN_RE.sub(" ", paragraph).split())
+                if len(text) >= MIN_SNIPPET_CHARS:
+                    snippets.append(FallbackDocument("doc", os.path.relpath(path, docs_dir), text))
+    return snippets
+
+def build_fallback_index(services: Mapping[str, Mapping], extra_documents: List[FallbackDocument]) -> FallbackIndex:
+    """
+    Построить индекс BM25 по услугам и дополнительным документам.
+    Веса BM25 вычисляются заранее, поэтому поиск сводится к сложению весов термов запроса.
+
+    Args:
+        services: Услуги каталога
+        extra_documents: Фрагменты документации
+
+    Returns:
+        Индекс для поиска
+    """
+    documents = [
+        FallbackDocument("service", service_key, " ".join((
+            service["name"], service["description"], " ".join(service["keywords"]),
+            " ".join(service["details"]), service["target_audience"],
+        )))
+        for service_key, service in services.items()
+    ]
+    documents += extra_documents
+
+    term_counts = [Counter(tokenize(document.text)) for document in documents]
+    lengths = [sum(counts.values()) for counts in term_counts]
+    avg_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    postings: Dict[str, List[Tuple[int, float]]] = {}
+    for doc_id, counts in enumerate(term_counts):
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((doc_id, tf))
+
+    total = len(documents)
+    weighted = {}
+    for term, entries in postings.items():
+        idf = math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+        weighted[term] = tuple(
+            (doc_id, idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / avg_length)))
+            for doc_id, tf in entries
+        )
+
+    vocabulary = build_fuzzy_index(
+        ((word, word[:STEM_LENGTH]) for document in documents for word in _words(document.text)),
+        get_fuzzy_max_edit_distance(),
+    )
+    return FallbackIndex(documents=tuple(documents), postings=MappingProxyType(weighted), vocabulary=vocabulary)
+
+def _query_terms(index: FallbackIndex, query: str) -> Dict[str, float]:
+    """
+    Термы запроса с весами: 1.0 для термов индекса, уверенность сопоставления —
+    для слов с опечатками, исправленных по словарю индекса
+    """
+    min_confidence = get_fuzzy_min_confidence()
+    terms: Dict[str, float] = {}
+    for word in _words(query):
+        term = word[:STEM_LENGTH]
+        if term in index.postings:
+            terms[term] = 1.0
+            continue
+        match = lookup(index.vocabulary, word)
+        if match is not None and match.confidence >= min_confidence:
+            for corrected in match.values:
+                terms[corrected] = max(terms.get(corrected, 0.0), match.confidence)
+    return terms
+
+def search(index: FallbackIndex, query: str, limit: int = 3) -> List[Tuple[float, FallbackDocument]]:
+    """
+    Найти документы, наиболее подходящие к запросу
+
+    Args:
+        index: Индекс BM25
+        query: Текст запроса
+        limit: Максимальное количество результатов
+
+    Returns:
+        Список (оценка, документ) по убыванию оценки
+    """
+    scores: Dict[int, float] = {}
+    for term, term_weight in _query_terms(index, query).items():
+        for doc_id, weight in index.postings.get(term, ()):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight * term_weight
+
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [(score, index.documents[doc_id]) for doc_id, score in best]
+
+def _build_index(catalog: CatalogSnapshot) -> FallbackIndex:
+    """Построить индекс резервных ответов для снимка каталога"""
+    return build_fallback_index(catalog.services, load_doc_snippets(get_fallback_docs_dir()))
+
+register_derived("fallback_index", _build_index)
+
+def _truncate(text: str, limit: int) -> str:
+    """Обрезать текст по границе слова"""
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+def build_fallback_answer(user_message: str = "") -> str:
+    """
+    Собрать содержательный ответ из каталога услуг без обращения к LLM
+
+    Args:
+        user_message: Сообщение пользователя
+
+    Returns:
+        Текст ответа
+    """
+    catalog = get_catalog()
+    company = catalog.company_info
+    results = search(catalog.derived["fallback_index"], user_message) if user_message else []
+
+    service = next((document for _, document in results if document.kind == "service"), None)
+    snippet = next((document for _, document in results if document.kind == "doc"), None)
+    footer = (f"Подробнее о компании: {company['website']}\n"
+              f"Все решения — /services, связаться с командой — /contact. Попробуйте задать вопрос позже.")
+
+    if service is None and snippet is None:
+        return (f"{FALLBACK_HEADER}\n\n{company['name']} — {company['description']}\n\n{footer}")
+
+    parts = [FALLBACK_HEADER]
+    if service is not None:
+        info = catalog.services[service.key]
+        details = "\n".join(f"• {detail}" for detail in info["details"][:3])
+        parts.append(f"{info.get('icon', '•')} **{info['name']}**\n{info['description']}\n\n"
+                     f"Возможности:\n{details}\n\nДля кого: {info['target_audience']}")
+    if snippet is not None:
+        parts.append(f"📄 {_truncate(snippet.text, MAX_SNIPPET_CHARS)}")
+    parts.append(footer)
+    return "\n\n".join(parts)
@@ -0,0 +1,170 @@
+"""
+Нечеткое сопоставление слов с опечатками (индекс удалений в духе SymSpell)
+
+Для каждого слова словаря заранее строятся варианты с удалением до N букв.
+Слово запроса сопоставляется через те же варианты удалений, поэтому поиск
+не перебирает словарь попарно: число обращений к индексу зависит только от
+длины слова. Кандидаты проверяются взвешенным расстоянием Дамерау-Левенштейна,
+в котором замена похожих по звучанию букв (е/э, о/а, и/ы, ...) стоит половину.
+Латинские буквы, похожие на кириллические, в словах со смешанным алфавитом
+заменяются кириллическими ("обучениe" с латинской e → "обучение").
+"""
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+# Латинские буквы, неотличимые от кириллических на письме (после приведения к нижнему регистру)
+HOMOGLYPHS = str.maketrans("aceopxykmthb", "асеорхукмтнв")
+
+# Пары букв, которые путают при наборе на слух: замена стоит половину правки
+CONFUSABLE_COST = 0.5
+_CONFUSABLE = frozenset(
+    pair
+    for a, b in ("еэ", "оа", "иы", "еи", "шщ", "ьъ", "зс", "дт", "бп", "вф", "гк", "жш", "цс")
+    for pair in ((a, b), (b, a))
+)
+
+# Окончания, отбрасываемые перед сопоставлением (грубый стемминг для русской морфологии)
+MIN_STEM_LENGTH = 3
+ENDINGS = tuple(sorted((
+    "ениями", "ением", "ения", "ение", "ать", "ять", "ить", "ами", "ями", "ого", "его",
+    "ому", "ему", "ыми", "ими", "ой", "ый", "ий", "ая", "яя", "ое", "ее", "ые", "ие",
+    "ов", "ев", "ам", "ям", "ах", "ях", "ом", "ем", "а", "я", "ы", "и", "е", "у", "ю", "о", "ь",
+), key=len, reverse=True))
+
+_WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+@dataclass(frozen=True)
+class FuzzyIndex:
+    """Предпостроенный индекс удалений"""
+    # {слово словаря: связанные значения}
+    terms: Mapping[str, Tuple[str, ...]]
+    # {вариант с удаленными буквами: слова словаря}
+    deletes: Mapping[str, Tuple[str, ...]]
+    max_distance: int
+
+@dataclass(frozen=True)
+class FuzzyMatch:
+    """Найденное слово словаря и уверенность сопоставления (1.0 — точное совпадение)"""
+    term: str
+    values: Tuple[str, ...]
+    distance: float
+    confidence: float
+
+def normalize_word(word: str) -> str:
+    """Привести слово к нижнему регистру, заменить ё и латинские двойники кириллических букв"""
+    word = word.lower().replace("ё", "е")
+    if _CYRILLIC_RE.search(word):
+        word = word.translate(HOMOGLYPHS)
+    return word
+
+def normalize_text(text: str) -> str:
+    """Нормализовать все слова текста (см. normalize_word)"""
+    return _WORD_RE.sub(lambda match: normalize_word(match.group()), text.lower())
+
+def words(text: str) -> List[str]:
+    """Разбить текст на нормализованные слова"""
+    return [normalize_word(word) for word in _WORD_RE.findall(text.lower())]
+
+def strip_ending(word: str) -> str:
+    """Отбросить окончание слова, если остается основа не короче MIN_STEM_LENGTH"""
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+def allowed_distance(length: int, max_distance: int) -> int:
+    """Допустимое число правок для слова длины length: короткие слова сопоставляются только точно"""
+    if length < 4:
+        return 0
+    return min(1 if length < 8 else 2, max_distance)
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    """Все варианты слова с удалением от 0 до distance букв"""
+    variants = {word}
+    level = {word}
+    for _ in range(distance):
+        level = {variant[:i] + variant[i + 1:] for variant in level if len(variant) > 2 for i in range(len(variant))}
+        variants |= level
+    return variants
+
+def weighted_distance(a: str, b: str) -> float:
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних букв) с удешевленной заменой похожих букв"""
+    before_previous: List[float] = []
+    row = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        previous_row, row = row, [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            if a[i - 1] == b[j - 1]:
+                cost = 0.0
+            elif (a[i - 1], b[j - 1]) in _CONFUSABLE:
+                cost = CONFUSABLE_COST
+            else:
+                cost = 1.0
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before_previous[j - 2] + 1)
+        before_previous = previous_row
+    return row[len(b)]
+
+def build_fuzzy_index(entries: Iterable[Tuple[str, str]], max_distance: int) -> FuzzyIndex:
+    """
+    Построить индекс удалений
+
+    Args:
+        entries: Пары (слово словаря, связанное значение); слово должно быть нормализовано
+        max_distance: Максимальное число правок
+
+    Returns:
+        Индекс для поиска
+    """
+    terms: Dict[str, List[str]] = {}
+    for term, value in entries:
+        values = terms.setdefault(term, [])
+        if value not in values:
+            values.append(value)
+
+    deletes: Dict[str, List[str]] = {}
+    for term in terms:
+        for variant in _deletes(term, allowed_distance(len(term), max_distance)):
+            deletes.setdefault(variant, []).append(term)
+
+    return FuzzyIndex(
+        terms=MappingProxyType({term: tuple(values) for term, values in terms.items()}),
+        deletes=MappingProxyType({variant: tuple(found) for variant, found in deletes.items()}),
+        max_distance=max_distance,
+    )
+
+def lookup(index: FuzzyIndex, word: str) -> Optional[FuzzyMatch]:
+    """
+    Найти ближайшее слово словаря
+
+    Args:
+        index: Индекс удалений
+        word: Нормализованное слово запроса
+
+    Returns:
+        Лучшее совпадение или None, если в пределах допустимого числа правок ничего нет
+    """
+    values = index.terms.get(word)
+    if values is not None:
+        return FuzzyMatch(word, values, 0.0, 1.0)
+    if len(word) < 3:
+        return None
+
+    best: Optional[FuzzyMatch] = None
+    seen: Set[str] = set()
+    for variant in _deletes(word, index.max_distance):
+        for term in index.deletes.get(variant, ()):
+            if term in seen:
+                continue
+            seen.add(term)
+            distance = weighted_distance(word, term)
+            if distance > allowed_distance(len(term), index.max_distance):
+                continue
+            confidence = round(1 - distance / max(len(term), len(word)), 3)
+            if best is None or confidence > best.confidence:
+                best = FuzzyMatch(term, index.terms[term], distance, confidence)
+    return best
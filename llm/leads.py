@@ -0,0 +1,402 @@
+"""
+Сбор заявок: интерес к услугам, бюджет и контакты, которые пользователь
+сообщает в диалоге
+
+Обработчик сообщения после ответа только ставит сообщение в ограниченную
+очередь (LEADS_QUEUE_SIZE) — без разбора текста и ввода-вывода, поэтому сбор
+заявок не добавляет заметной задержки к ответу. Фоновая задача выделяет из
+сообщений данные заявки, объединяет их по чату и пачками записывает в SQLite
+(LEADS_DB_PATH) в отдельном потоке: при накоплении LEADS_BATCH_SIZE чатов или
+раз в LEADS_FLUSH_INTERVAL секунд. В базе одна запись на чат, новые данные
+дополняют ее. При переполнении очереди сообщение не учитывается.
+
+Выгрузка в CSV:
+    python -m llm.leads leads.db leads.csv
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config import get_leads_db_path, get_leads_queue_size, get_leads_batch_size, get_leads_flush_interval
+from llm.logging_utils import find_pii, redact_pii
+
+logger = logging.getLogger(__name__)
+
+# Ожидание блокировки базы другим писателем (секунды)
+LOCK_TIMEOUT = 30.0
+
+# Сумма с валютой или масштабом ("500 тыс. руб", "300000₽", "$5000", "5k usd",
+# "бюджет около 2 млн"); число без них после слова "бюджет" ("бюджет 300000")
+# принимается, только если таких сумм нет и за числом не следует слово
+# ("бюджет на 3 месяца", "бюджет на 2025 год")
+_AMOUNT = r"\d(?:[\d\s.,]*\d)?"
+_SCALE_WORD = r"\s*(?:тыс\w*|млн\w*|миллион\w*|k|к)(?!\w)\.?"
+_SCALE = rf"(?:{_SCALE_WORD})?"
+_CURRENCY = r"\s*(?:руб\w*|р\.|₽|usd|\$|долл\w*|€|евро|eur)"
+_BUDGET_RE = re.compile(
+    rf"бюджет\w*\D{{0,20}}?{_AMOUNT}(?:{_SCALE_WORD}(?:{_CURRENCY})?|{_CURRENCY})"
+    rf"|[$€]\s*{_AMOUNT}{_SCALE}"
+    rf"|{_AMOUNT}{_SCALE}{_CURRENCY}",
+    re.IGNORECASE,
+)
+_BARE_BUDGET_RE = re.compile(rf"бюджет\w*\D{{0,20}}?{_AMOUNT}(?![.,]?\d)(?![\d\s]*[^\W\d_])", re.IGNORECASE)
+
+@dataclass(frozen=True)
+class LeadRecord:
+    """Данные заявки по чату"""
+    chat_id: int
+    user_id: str
+    services: Tuple[str, ...]
+    budget: Optional[str]
+    phone: Optional[str]
+    email: Optional[str]
+    messages: int
+    first_seen: float
+    last_seen: float
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leads (
+    chat_id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    services TEXT NOT NULL,
+    budget TEXT,
+    phone TEXT,
+    email TEXT,
+    messages INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+)
+"""
+_COLUMNS = "chat_id, user_id, services, budget, phone, email, messages, first_seen, last_seen"
+_UPSERT = f"""
+INSERT INTO leads ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(chat_id) DO UPDATE SET
+    user_id = excluded.user_id,
+    services = excluded.services,
+    budget = excluded.budget,
+    phone = excluded.phone,
+    email = excluded.email,
+    messages = excluded.messages,
+    first_seen = excluded.first_seen,
+    last_seen = excluded.last_seen
+"""
+
+# Сигнал остановки в очереди: сообщения перед ним обрабатываются и записываются
+_STOP = object()
+
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_path: Optional[str] = None
+
+# Заявки, выделенные, но еще не записанные: {chat_id: запись}
+_pending: Dict[int, LeadRecord] = {}
+
+_stats: Dict[str, Any] = {
+    "submitted": 0,
+    "dropped": 0,
+    "extracted": 0,
+    "skipped": 0,
+    "written": 0,
+    "flushes": 0,
+    "failed": 0,
+    "last_flush_seconds": 0.0,
+}
+
+def extract_lead(chat_id: int,
+                 user_id: str,
+                 text: str,
+                 services: Iterable[str] = (),
+                 now: Optional[float] = None) -> Optional[LeadRecord]:
+    """
+    Выделить данные заявки из сообщения пользователя
+
+    Args:
+        chat_id: ID чата
+        user_id: ID пользователя
+        text: Текст сообщения
+        services: Ключи услуг, найденных в сообщении
+        now: Время сообщения (Unix)
+
+    Returns:
+        Запись заявки или None, если в сообщении нет ни услуг, ни бюджета, ни контактов
+    """
+    contacts = find_pii(text)
+    phone = next((value for kind, value in contacts if kind == "phone"), None)
+    email = next((value for kind, value in contacts if kind == "email"), None)
+    # Бюджет ищется в тексте с замаскированными контактами, чтобы телефон не приняли за сумму.
+    # Телефон — только номер с "+" или 7/8 в начале, поэтому суммы вида "500 000 000" остаются бюджетом
+    redacted = redact_pii(text)
+    match = _BUDGET_RE.search(redacted) or _BARE_BUDGET_RE.search(redacted)
+    budget = " ".join(match.group().split()) if match else None
+    services = tuple(sorted(set(services)))
+    if not (services or budget or phone or email):
+        return None
+
+    if now is None:
+        now = time.time()
+    return LeadRecord(chat_id=chat_id, user_id=str(user_id), services=services, budget=budget,
+                      phone=phone, email=email, messages=1, first_seen=now, last_seen=now)
+
+def merge_leads(old: LeadRecord, new: LeadRecord) -> LeadRecord:
+    """
+    Объединить заявки одного чата: услуги накапливаются, бюджет и контакты
+    берутся из более новой записи, если они в ней есть
+
+    Args:
+        old: Ранее сохраненная запись
+        new: Более новая запись
+
+    Returns:
+        Объединенная запись
+    """
+    return LeadRecord(
+        chat_id=old.chat_id,
+        user_id=new.user_id,
+        services=tuple(sorted(set(old.services) | set(new.services))),
+        budget=new.budget or old.budget,
+        phone=new.phone or old.phone,
+        email=new.email or old.email,
+        messages=old.messages + new.messages,
+        first_seen=min(old.first_seen, new.first_seen),
+        last_seen=max(old.last_seen, new.last_seen),
+    )
+
+def _to_row(record: LeadRecord) -> Tuple[Any, ...]:
+    """Строка таблицы leads из записи заявки"""
+    return (record.chat_id, record.user_id, ",".join(record.services), record.budget, record.phone,
+            record.email, record.messages, record.first_seen, record.last_seen)
+
+def _from_row(row: Tuple[Any, ...]) -> LeadRecord:
+    """Запись заявки из строки таблицы leads"""
+    chat_id, user_id, services, budget, phone, email, messages, first_seen, last_seen = row
+    return LeadRecord(chat_id=chat_id, user_id=user_id, services=tuple(filter(None, services.split(","))),
+                      budget=budget, phone=phone, email=email, messages=messages,
+                      first_seen=first_seen, last_seen=last_seen)
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Открыть базу заявок, создав таблицу при необходимости"""
+    connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+    connection.execute(_SCHEMA)
+    return connection
+
+def write_leads(path: str, records: List[LeadRecord]) -> int:
+    """
+    Записать пачку заявок одной транзакцией, объединив их с уже сохраненными записями чатов
+
+    Args:
+        path: Путь к базе SQLite
+        records: Заявки (не более одной на чат)
+
+    Returns:
+        Количество записанных чатов
+    """
+    connection = _connect(path)
+    try:
+        # Блокировка на запись с начала транзакции: объединение с сохраненной записью
+        # не теряет данные при параллельной записи другим процессом
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = []
+            for record in records:
+                row = connection.execute(f"SELECT {_COLUMNS} FROM leads WHERE chat_id = ?",
+                                         (record.chat_id,)).fetchone()
+                if row is not None:
+                    record = merge_leads(_from_row(row), record)
+                rows.append(_to_row(record))
+            connection.executemany(_UPSERT, rows)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    finally:
+        connection.close()
+    return len(rows)
+
+def read_leads(path: str) -> List[LeadRecord]:
+    """
+    Прочитать все заявки, начиная с самых свежих
+
+    Args:
+        path: Путь к базе SQLite
+
+    Returns:
+        Список заявок
+    """
+    connection = _connect(path)
+    try:
+        rows = connection.execute(f"SELECT {_COLUMNS} FROM leads ORDER BY last_seen DESC").fetchall()
+    finally:
+        connection.close()
+    return [_from_row(row) for row in rows]
+
+def export_leads_csv(db_path: str, csv_path: str) -> int:
+    """
+    Выгрузить заявки в CSV (время — ISO 8601, UTC)
+
+    Args:
+        db_path: Путь к базе SQLite
+        csv_path: Путь к файлу CSV
+
+    Returns:
+        Количество выгруженных заявок
+    """
+    leads = read_leads(db_path)
+    # utf-8-sig — чтобы Excel правильно определил кодировку
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(_COLUMNS.split(", "))
+        for record in leads:
+            row = asdict(record)
+            row["services"] = ",".join(record.services)
+            for field in ("first_seen", "last_seen"):
+                row[field] = datetime.fromtimestamp(row[field], timezone.utc).isoformat(timespec="seconds")
+            writer.writerow(row.values())
+    return len(leads)
+
+def _accept(item: Tuple[int, str, str, Tuple[str, ...], float]) -> None:
+    """Выделить заявку из сообщения очереди и объединить ее с ожидающей записью чата"""
+    record = extract_lead(*item)
+    if record is None:
+        _stats["skipped"] += 1
+        return
+    _stats["extracted"] += 1
+    pending = _pending.get(record.chat_id)
+    _pending[record.chat_id] = merge_leads(pending, record) if pending else record
+
+async def _flush(path: str) -> None:
+    """Записать ожидающие заявки в потоке; при ошибке они остаются до следующей записи"""
+    batch = list(_pending.values())
+    _pending.clear()
+    started = time.perf_counter()
+    try:
+        written = await asyncio.to_thread(write_leads, path, batch)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"❌ Failed to write leads to {path}: {e}")
+        _stats["failed"] += 1
+        for record in batch:
+            newer = _pending.get(record.chat_id)
+            _pending[record.chat_id] = merge_leads(record, newer) if newer else record
+        return
+    _stats["written"] += written
+    _stats["flushes"] += 1
+    _stats["last_flush_seconds"] = round(time.perf_counter() - started, 4)
+    logger.debug(f"📇 LEADS FLUSH | Chats: {written} | {_stats['last_flush_seconds']}s")
+
+async def _lead_worker(queue: asyncio.Queue, path: str) -> None:
+    """Фоновая задача: выделять заявки из очереди и записывать их пачками до сигнала остановки"""
+    loop = asyncio.get_running_loop()
+    batch_size = get_leads_batch_size()
+    interval = get_leads_flush_interval()
+    deadline = loop.time() + interval
+    stopping = False
+
+    while not stopping:
+        timeout = deadline - loop.time()
+        if timeout > 0 and len(_pending) < batch_size:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = None
+            # Забираем уже накопившиеся сообщения без ожидания
+            while item is not None and item is not _STOP:
+                _accept(item)
+                item = queue.get_nowait() if not queue.empty() and len(_pending) < batch_size else None
+            stopping = item is _STOP
+            if not stopping and loop.time() < deadline and len(_pending) < batch_size:
+                continue
+        if _pending:
+            await _flush(path)
+        deadline = loop.time() + interval
+
+def _ensure_worker(path: str) -> asyncio.Queue:
+    """Запустить фоновую задачу записи заявок в текущем цикле событий"""
+    global _queue, _worker, _loop, _path
+    loop = asyncio.get_running_loop()
+    if _worker is None or _worker.done() or _loop is not loop or _path != path:
+        if _worker is not None and not _worker.done() and _loop is loop:
+            _worker.cancel()
+        _queue = asyncio.Queue(maxsize=get_leads_queue_size())
+        _loop = loop
+        _path = path
+        _worker = loop.create_task(_lead_worker(_queue, path))
+        logger.info(f"📇 Lead capture started: {path}")
+    return _queue
+
+def submit_lead(chat_id: int, user_id: Any, text: str, services: Iterable[str] = ()) -> bool:
+    """
+    Поставить сообщение пользователя в очередь выделения заявки, не дожидаясь обработки
+
+    Args:
+        chat_id: ID чата
+        user_id: ID пользователя
+        text: Текст сообщения
+        services: Ключи услуг, уже найденных в сообщении обработчиком
+
+    Returns:
+        True, если сообщение поставлено в очередь; False, если сбор заявок отключен или очередь переполнена
+    """
+    path = get_leads_db_path()
+    if not path:
+        return False
+    queue = _ensure_worker(path)
+    try:
+        queue.put_nowait((chat_id, str(user_id), text, tuple(services), time.time()))
+    except asyncio.QueueFull:
+        _stats["dropped"] += 1
+        return False
+    _stats["submitted"] += 1
+    return True
+
+async def stop_lead_capture(timeout: float = 5.0) -> None:
+    """Обработать сообщения из очереди, записать ожидающие заявки и остановить фоновую задачу"""
+    global _queue, _worker, _loop
+    worker, queue = _worker, _queue
+    _worker = _queue = _loop = None
+    if worker is None or worker.done():
+        return
+    try:
+        await asyncio.wait_for(queue.put(_STOP), timeout)
+        await asyncio.wait_for(worker, timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"❌ Timed out writing leads on shutdown: {len(_pending) + queue.qsize()} left")
+
+def get_lead_stats() -> Dict[str, Any]:
+    """
+    Получить статистику сбора заявок
+
+    Returns:
+        Счетчики сообщений и записей, текущая глубина очереди и число ожидающих записи чатов
+    """
+    return {
+        **_stats,
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "pending": len(_pending),
+    }
+
+def reset_leads() -> None:
+    """Сбросить ожидающие заявки и счетчики (для тестов)"""
+    _pending.clear()
+    for key in _stats:
+        _stats[key] = 0.0 if key == "last_flush_seconds" else 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Точка входа командной строки: выгрузка заявок в CSV"""
+    parser = argparse.ArgumentParser(description="Выгрузка заявок из базы SQLite в CSV")
+    parser.add_argument("db_path", help="База заявок (LEADS_DB_PATH)")
+    parser.add_argument("csv_path", help="Файл CSV")
+    args = parser.parse_args(argv)
+
+    count = export_leads_csv(args.db_path, args.csv_path)
+    print(f"Exported {count} leads to {args.csv_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
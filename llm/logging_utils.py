@@ -1,15 +1,236 @@
 """
 Утилиты для расширенного логирования
 """
+import asyncio
 import logging
 import json
+import os
+import queue
+import random
+import re
+import threading
 import time
 from datetime import datetime
-from typing import Dict, Any, Optional
-from llm.memory import get_dialog_stats
+from typing import Dict, Any, List, Optional, Tuple
+from config import (
+    get_dialog_stats_interval,
+    get_event_log_path,
+    get_event_log_max_bytes,
+    get_event_log_backups,
+    get_log_content_policy,
+)
+from llm.budget import get_budget_stats
+from llm.memory import get_dialog_stats, get_history_length_histogram, get_shared_dialog_stats
 
 logger = logging.getLogger(__name__)
 
+# Политика логирования содержимого на уровне INFO: {поле: (максимальная длина, доля логируемых)}.
+# Полный текст пишется только на уровне DEBUG. Переопределяется через LOG_CONTENT_POLICY.
+CONTENT_LOG_POLICY = {
+    "user_message": (200, 1.0),
+    "bot_response": (200, 1.0),
+    "llm_user_message": (0, 0.0),
+    "llm_response": (0, 0.0),
+    "system_prompt": (0, 0.0),
+    "service_query": (0, 0.0),
+}
+
+# Запас к длине фрагмента при маскировании, чтобы обрезка не оставила часть телефона или почты
+REDACTION_MARGIN = 32
+
+# Телефоны и почта маскируются за один проход общим регулярным выражением.
+# Телефон — номер с "+" или российский номер из 11 цифр с 7/8 в начале:
+# суммы и идентификаторы вида "500 000 000" под шаблон не попадают
+_PII_RE = re.compile(
+    r"(?P<email>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+    r"|(?P<phone>(?<![\w+])"
+    r"(?:\+\d[\d\s()-]{8,}\d|[78][\s(-]*\d{3}[\s)-]*\d{3}[\s-]*\d{2}[\s-]*\d{2})"
+    r"(?!\w))"
+)
+_PII_MASKS = {"email": "[email]", "phone": "[phone]"}
+
+def redact_pii(text: str) -> str:
+    """Замаскировать телефоны и адреса почты"""
+    return _PII_RE.sub(lambda match: _PII_MASKS[match.lastgroup], text)
+
+def find_pii(text: str) -> List[Tuple[str, str]]:
+    """Найти телефоны и адреса почты: список пар (вид — "email" или "phone", значение)"""
+    return [(match.lastgroup, match.group()) for match in _PII_RE.finditer(text)]
+
+def log_content(log: logging.Logger, field: str, label: str, text: str) -> None:
+    """
+    Залогировать содержимое сообщения по политике поля: на уровне DEBUG — полностью,
+    на уровне INFO — с выборкой, обрезкой и маскированием персональных данных.
+    Стоимость не зависит от длины текста: обрабатывается только выводимый фрагмент.
+
+    Args:
+        log: Логгер вызывающего модуля
+        field: Поле политики (user_message, bot_response, llm_response, ...)
+        label: Префикс строки лога
+        text: Содержимое
+    """
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"{label}: {redact_pii(text)}")
+        return
+    if not log.isEnabledFor(logging.INFO):
+        return
+
+    max_chars, sample_rate = get_log_content_policy().get(field) or CONTENT_LOG_POLICY.get(field, (200, 1.0))
+    if max_chars <= 0 or sample_rate <= 0 or (sample_rate < 1 and random.random() >= sample_rate):
+        return
+
+    if len(text) <= max_chars:
+        log.info(f"{label}: {redact_pii(text)}")
+        return
+    snippet = redact_pii(text[:max_chars + REDACTION_MARGIN])[:max_chars]
+    log.info(f"{label}: {snippet}… (+{len(text) - max_chars} chars)")
+
+# Максимальное количество событий, записываемых за один проход фонового потока
+EVENT_BATCH_SIZE = 1000
+
+_STOP = object()
+
+class EventSink:
+    """
+    Журнал событий метрик: записи NDJSON (одно событие на строку) дописываются
+    в файл фоновым потоком, файл ротируется по размеру (events.ndjson.1, .2, ...)
+    """
+    
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.written = 0
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="event-sink", daemon=True)
+        self._file = None
+        self._size = 0
+    
+    def start(self) -> None:
+        """Открыть файл журнала и запустить фоновый поток записи"""
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        self._thread.start()
+    
+    def put(self, record: Dict[str, Any]) -> None:
+        """Поставить событие в очередь записи (сериализация выполняется в фоновом потоке)"""
+        self._queue.put(record)
+    
+    def close(self, timeout: float = 5.0) -> None:
+        """Записать события из очереди и закрыть журнал"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+    
+    def _run(self) -> None:
+        """Фоновый поток: забирает события пачками и дописывает их в файл"""
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < EVENT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            lines = []
+            for record in batch:
+                if record is _STOP:
+                    stopping = True
+                    continue
+                try:
+                    lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str))
+                except Exception as e:
+                    logger.error(f"Failed to serialize event for {self.path}: {e}")
+            
+            # Любая ошибка записи логируется, поток продолжает работу: иначе очередь росла бы без ограничений
+            try:
+                if lines:
+                    self._write(("\n".join(lines) + "\n").encode("utf-8"))
+                    self.written += len(lines)
+            except Exception as e:
+                logger.error(f"Failed to write event log {self.path}: {e}")
+                self._reopen()
+        
+        self._file.close()
+    
+    def _reopen(self) -> None:
+        """Открыть файл журнала заново, если он был закрыт"""
+        if self._file is None or not self._file.closed:
+            return
+        try:
+            self._file = open(self.path, "ab")
+            self._size = self._file.tell()
+        except OSError as e:
+            logger.error(f"Failed to reopen event log {self.path}: {e}")
+    
+    def _write(self, data: bytes) -> None:
+        """Дописать данные, предварительно ротировав файл при превышении размера"""
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+    
+    def _rotate(self) -> None:
+        """Сдвинуть ротированные файлы и начать новый файл журнала"""
+        self._file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "ab")
+        self._size = 0
+
+_event_sink: Optional[EventSink] = None
+
+def start_event_sink(path: Optional[str] = None) -> Optional[EventSink]:
+    """
+    Запустить журнал событий
+    
+    Args:
+        path: Путь к файлу журнала (по умолчанию EVENT_LOG_PATH)
+        
+    Returns:
+        Журнал событий или None, если путь не задан
+    """
+    global _event_sink
+    path = path or get_event_log_path()
+    if not path:
+        return None
+    
+    stop_event_sink()
+    sink = EventSink(path, get_event_log_max_bytes(), get_event_log_backups())
+    sink.start()
+    _event_sink = sink
+    logger.info(f"📒 Event log started: {path}")
+    return sink
+
+def stop_event_sink() -> None:
+    """Записать оставшиеся события и остановить журнал"""
+    global _event_sink
+    sink, _event_sink = _event_sink, None
+    if sink is not None:
+        sink.close()
+
+def emit_event(record: Dict[str, Any], label: str, level: int = logging.INFO) -> None:
+    """
+    Записать событие метрик: в журнал событий, если он включен, иначе в лог
+    
+    Args:
+        record: Событие (словарь с полем event_type)
+        label: Префикс строки лога, например LLM_METRICS
+        level: Уровень строки лога, когда журнал событий отключен
+    """
+    if _event_sink is not None:
+        _event_sink.put(record)
+    elif logger.isEnabledFor(level):
+        logger.log(level, f"{label}: {json.dumps(record)}")
+
 class MetricsLogger:
     """Класс для сбора и логирования метрик производительности"""
     
@@ -25,7 +246,9 @@ class MetricsLogger:
                        end_time: float,
                        success: bool,
                        error: Optional[str] = None,
-                       response_length: Optional[int] = None):
+                       response_length: Optional[int] = None,
+                       prompt_tokens: Optional[int] = None,
+                       completion_tokens: Optional[int] = None):
         """Логировать метрики запроса к LLM"""
         
         elapsed_time = end_time - start_time
@@ -40,10 +263,12 @@ class MetricsLogger:
             "elapsed_time": round(elapsed_time, 3),
             "success": success,
             "response_length": response_length,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
             "error": error
         }
         
-        logger.info(f"LLM_METRICS: {json.dumps(metric_data)}")
+        emit_event(metric_data, "LLM_METRICS")
     
     def log_dialog_state(self, chat_id: int, user_id: str, messages_in_history: int):
         """Логировать состояние диалога"""
@@ -60,7 +285,24 @@ class MetricsLogger:
             "total_messages": dialog_stats.get("total_messages", 0)
         }
         
-        logger.info(f"DIALOG_METRICS: {json.dumps(metric_data)}")
+        emit_event(metric_data, "DIALOG_METRICS")
+    
+    def log_dialog_gauges(self, shared: Optional[Dict[str, int]] = None):
+        """Логировать агрегаты по всем диалогам (значения-показатели на текущий момент)"""
+        
+        dialog_stats = get_dialog_stats()
+        if shared is not None:
+            dialog_stats["shared"] = shared
+        
+        metric_data = {
+            "timestamp": datetime.now().isoformat(),
+            "event_type": "dialog_gauges",
+            **dialog_stats,
+            "history_length_histogram": get_history_length_histogram(),
+            "budget": get_budget_stats()
+        }
+        
+        emit_event(metric_data, "DIALOG_GAUGES", logging.INFO)
     
     def log_command_usage(self, command: str, user_id: str, chat_id: int):
         """Логировать использование команд"""
@@ -73,7 +315,7 @@ class MetricsLogger:
             "chat_id": chat_id
         }
         
-        logger.info(f"COMMAND_METRICS: {json.dumps(metric_data)}")
+        emit_event(metric_data, "COMMAND_METRICS")
     
     def log_service_suggestion(self, 
                               user_id: str, 
@@ -93,11 +335,28 @@ class MetricsLogger:
             "services_count": services_count
         }
         
-        logger.info(f"SERVICE_METRICS: {json.dumps(metric_data)}")
+        emit_event(metric_data, "SERVICE_METRICS")
 
 # Глобальный экземпляр логгера метрик
 metrics_logger = MetricsLogger()
 
+async def publish_dialog_gauges(interval: Optional[float] = None):
+    """
+    Фоновая задача: периодически публиковать метрики диалогов
+    
+    Args:
+        interval: Интервал публикации в секундах (по умолчанию DIALOG_STATS_INTERVAL)
+    """
+    if interval is None:
+        interval = get_dialog_stats_interval()
+    
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            metrics_logger.log_dialog_gauges(await get_shared_dialog_stats())
+        except Exception as e:
+            logger.error(f"Failed to publish dialog gauges: {str(e)}")
+
 def log_user_interaction(user_id: str, 
                         chat_id: int, 
                         message_type: str, 
@@ -123,7 +382,7 @@ def log_user_interaction(user_id: str,
         "processing_time": processing_time
     }
     
-    logger.info(f"USER_INTERACTION: {json.dumps(interaction_data)}")
+    emit_event(interaction_data, "USER_INTERACTION")
 
 def log_error_context(error_type: str, 
                      error_message: str,
@@ -150,6 +409,9 @@ def log_error_context(error_type: str,
         "context": context or {}
     }
     
+    # Ошибки остаются в основном логе и при включенном журнале событий
+    if _event_sink is not None:
+        _event_sink.put(error_data)
     logger.error(f"ERROR_CONTEXT: {json.dumps(error_data)}")
 
 def setup_detailed_logging():
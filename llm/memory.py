@@ -1,6 +1,22 @@
+import heapq
+import json
 import logging
+import os
+import time
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from config import (
+    get_dialog_max_messages,
+    get_dialog_active_window,
+    get_service_relevance_decay,
+    get_service_relevance_min_score,
+    get_service_relevance_top,
+    get_service_relevance_ttl,
+)
+from llm.state_backend import RespError, get_state_backend
 
 logger = logging.getLogger(__name__)
 
@@ -8,6 +24,190 @@ logger = logging.getLogger(__name__)
 # Структура: {chat_id: [{"role": "user/assistant", "content": "...", "timestamp": datetime}]}
 _dialogs: Dict[int, List[Dict[str, str]]] = {}
 
+# Общее хранилище длинных текстов сообщений: {content: [canonical, refcount]}
+# Одинаковые ответы (приветствие, список услуг, справка) хранятся в одном экземпляре,
+# а сообщения всех чатов ссылаются на этот объект строки
+_blobs: Dict[str, List[Any]] = {}
+
+# Тексты короче этого порога не выносятся в общее хранилище
+INTERN_MIN_CHARS = 64
+
+# Суммарная длина текстов по ссылкам из диалогов и фактически хранимых текстов
+_blob_stats: Dict[str, int] = {
+    "referenced_chars": 0,
+    "stored_chars": 0,
+    "refs": 0,
+}
+
+# Счетчики, обновляемые за O(1) при добавлении и удалении сообщений,
+# чтобы статистика не требовала обхода всех диалогов
+_dialog_counters: Dict[str, int] = {
+    "chats": 0,
+    "messages": 0,
+    "bytes": 0,
+    "evictions": 0,
+}
+_role_counts: Dict[str, int] = {}
+# Размер текстов каждого чата в байтах (для поиска самых больших диалогов)
+_chat_bytes: Dict[int, int] = {}
+
+# Верхние границы корзин гистограммы длины истории; последняя корзина — все, что длиннее
+HISTORY_LENGTH_BUCKETS = (1, 5, 10, 20, 50, 100)
+_length_histogram: List[int] = [0] * (len(HISTORY_LENGTH_BUCKETS) + 1)
+
+# Время последнего сообщения в чате: {chat_id: monotonic}, упорядочено по времени
+_last_activity: "OrderedDict[int, float]" = OrderedDict()
+
+# Релевантность услуг в диалоге: {chat_id: [номер хода, {ключ услуги: [оценка, ход обновления]}, monotonic]}
+# Оценки затухают экспоненциально с каждым ходом; затухание применяется лениво при обращении,
+# поэтому обновление стоит O(услуг в сообщении), а история диалога не просматривается заново.
+# OrderedDict упорядочен по времени обновления для вытеснения неактивных чатов
+_service_relevance: "OrderedDict[int, List[Any]]" = OrderedDict()
+
+# Формат файла снимка: заголовок + версия формата + JSON, сжатый zlib
+SNAPSHOT_MAGIC = b"DLGS"
+SNAPSHOT_VERSION = 1
+
+def _intern_content(content: str) -> str:
+    """Получить общий экземпляр текста сообщения и увеличить счетчик ссылок"""
+    if len(content) < INTERN_MIN_CHARS:
+        return content
+    
+    entry = _blobs.get(content)
+    if entry is None:
+        entry = [content, 0]
+        _blobs[content] = entry
+        _blob_stats["stored_chars"] += len(content)
+    entry[1] += 1
+    _blob_stats["referenced_chars"] += len(content)
+    _blob_stats["refs"] += 1
+    return entry[0]
+
+def _release_content(content: str) -> None:
+    """Уменьшить счетчик ссылок текста и удалить его, если ссылок не осталось"""
+    entry = _blobs.get(content)
+    if entry is None:
+        return
+    
+    entry[1] -= 1
+    _blob_stats["referenced_chars"] -= len(content)
+    _blob_stats["refs"] -= 1
+    if entry[1] <= 0:
+        del _blobs[content]
+        _blob_stats["stored_chars"] -= len(content)
+
+def _track_message(chat_id: int, message: Dict[str, str], delta: int) -> None:
+    """Учесть добавление (delta=1) или удаление (delta=-1) сообщения в счетчиках"""
+    role = message["role"]
+    size = delta * len(message["content"].encode("utf-8"))
+    _dialog_counters["messages"] += delta
+    _dialog_counters["bytes"] += size
+    _chat_bytes[chat_id] = _chat_bytes.get(chat_id, 0) + size
+    _role_counts[role] = _role_counts.get(role, 0) + delta
+
+def _move_in_histogram(old_length: int, new_length: int) -> None:
+    """Перенести чат в корзину гистограммы, соответствующую новой длине истории"""
+    if old_length:
+        _length_histogram[bisect_left(HISTORY_LENGTH_BUCKETS, old_length)] -= 1
+    if new_length:
+        _length_histogram[bisect_left(HISTORY_LENGTH_BUCKETS, new_length)] += 1
+
+def _prune_activity(now: float) -> None:
+    """Удалить из окна активности чаты, неактивные дольше DIALOG_ACTIVE_WINDOW"""
+    window = get_dialog_active_window()
+    while _last_activity:
+        chat_id, last_seen = next(iter(_last_activity.items()))
+        if now - last_seen < window:
+            break
+        _last_activity.popitem(last=False)
+
+def _touch_chat(chat_id: int) -> None:
+    """Отметить активность чата"""
+    now = time.monotonic()
+    _last_activity[chat_id] = now
+    _last_activity.move_to_end(chat_id)
+    _prune_activity(now)
+
+def _release_dialog(chat_id: int) -> None:
+    """Удалить диалог, освободить ссылки на его тексты и обновить счетчики"""
+    messages = _dialogs.pop(chat_id, None)
+    if messages is None:
+        return
+    
+    for message in messages:
+        _release_content(message["content"])
+        _track_message(chat_id, message, -1)
+    _dialog_counters["chats"] -= 1
+    _chat_bytes.pop(chat_id, None)
+    _move_in_histogram(len(messages), 0)
+    _last_activity.pop(chat_id, None)
+
+def _prune_relevance(now: float) -> None:
+    """Удалить релевантность услуг чатов, неактивных дольше SERVICE_RELEVANCE_TTL"""
+    ttl = get_service_relevance_ttl()
+    while _service_relevance:
+        chat_id, state = next(iter(_service_relevance.items()))
+        if now - state[2] < ttl:
+            break
+        _service_relevance.popitem(last=False)
+
+def update_service_relevance(chat_id: int, scores: Mapping[str, float], now: Optional[float] = None) -> None:
+    """
+    Учесть услуги, найденные в очередном сообщении пользователя
+    
+    Args:
+        chat_id: ID чата
+        scores: Оценки услуг в сообщении {ключ услуги: уверенность}; пустой словарь — ход без услуг
+        now: Текущее время (monotonic), для тестов
+    """
+    if now is None:
+        now = time.monotonic()
+    _prune_relevance(now)
+    
+    state = _service_relevance.get(chat_id)
+    if state is None:
+        state = [0, {}, now]
+        _service_relevance[chat_id] = state
+    state[0] += 1
+    state[2] = now
+    _service_relevance.move_to_end(chat_id)
+    
+    turn = state[0]
+    decay = get_service_relevance_decay()
+    for service_key, score in scores.items():
+        entry = state[1].get(service_key)
+        previous = entry[0] * decay ** (turn - entry[1]) if entry is not None else 0.0
+        state[1][service_key] = [previous + score, turn]
+
+def get_top_services(chat_id: int, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+    """
+    Получить наиболее релевантные услуги диалога
+    
+    Args:
+        chat_id: ID чата
+        limit: Максимальное количество услуг (по умолчанию SERVICE_RELEVANCE_TOP)
+        
+    Returns:
+        Список (ключ услуги, оценка) по убыванию оценки; услуги с оценкой ниже
+        SERVICE_RELEVANCE_MIN_SCORE не включаются и удаляются из состояния
+    """
+    state = _service_relevance.get(chat_id)
+    if state is None:
+        return []
+    
+    turn = state[0]
+    decay = get_service_relevance_decay()
+    min_score = get_service_relevance_min_score()
+    ranked = []
+    for service_key, (score, updated) in list(state[1].items()):
+        current = score * decay ** (turn - updated)
+        if current < min_score:
+            del state[1][service_key]
+            continue
+        ranked.append((service_key, round(current, 3)))
+    ranked.sort(key=lambda item: item[1], reverse=True)
+    return ranked[:limit if limit is not None else get_service_relevance_top()]
+
 def get_dialog_history(chat_id: int, max_messages: int = 10) -> List[Dict[str, str]]:
     """
     Получить историю диалога для чата (последние N сообщений)
@@ -35,18 +235,52 @@ def add_message_to_dialog(chat_id: int, role: str, content: str) -> None:
         role: Роль отправителя (user/assistant/system)
         content: Содержание сообщения
     """
-    if chat_id not in _dialogs:
-        _dialogs[chat_id] = []
+    dialog = _dialogs.get(chat_id)
+    if dialog is None:
+        dialog = []
+        _dialogs[chat_id] = dialog
+        _dialog_counters["chats"] += 1
+    old_length = len(dialog)
     
     message = {
         "role": role,
-        "content": content,
+        "content": _intern_content(content),
         "timestamp": datetime.now().isoformat()
     }
     
-    _dialogs[chat_id].append(message)
+    dialog.append(message)
+    _track_message(chat_id, message, 1)
+    
+    # Старые сообщения сверх лимита вытесняются из истории
+    max_messages = get_dialog_max_messages()
+    if max_messages and len(dialog) > max_messages:
+        for evicted in dialog[:-max_messages]:
+            _release_content(evicted["content"])
+            _track_message(chat_id, evicted, -1)
+            _dialog_counters["evictions"] += 1
+        del dialog[:-max_messages]
+    
+    _move_in_histogram(old_length, len(dialog))
+    _touch_chat(chat_id)
     logger.info(f"Added message to dialog {chat_id}: role={role}, content_length={len(content)}")
 
+def add_message_and_get_history(chat_id: int, role: str, content: str,
+                                max_messages: int = 10) -> List[Dict[str, str]]:
+    """
+    Добавить сообщение и получить историю диалога
+    
+    Args:
+        chat_id: ID чата
+        role: Роль отправителя (user/assistant/system)
+        content: Содержание сообщения
+        max_messages: Максимальное количество сообщений для возврата
+        
+    Returns:
+        Список сообщений в формате [{"role": "user/assistant", "content": "..."}]
+    """
+    add_message_to_dialog(chat_id, role, content)
+    return get_dialog_history(chat_id, max_messages)
+
 def clear_dialog_history(chat_id: int) -> None:
     """
     Очистить историю диалога для чата
@@ -54,21 +288,212 @@ def clear_dialog_history(chat_id: int) -> None:
     Args:
         chat_id: ID чата
     """
+    _service_relevance.pop(chat_id, None)
     if chat_id in _dialogs:
-        del _dialogs[chat_id]
+        _release_dialog(chat_id)
         logger.info(f"Cleared dialog history for chat {chat_id}")
 
-def get_dialog_stats() -> Dict[str, int]:
+# Асинхронные варианты: при заданном REDIS_URL история хранится в общем хранилище
+# (сетевой обмен выполняется в цикле событий), иначе вызываются функции выше
+
+async def get_dialog_history_async(chat_id: int, max_messages: int = 10) -> List[Dict[str, str]]:
+    """Получить историю диалога (см. get_dialog_history) с учетом общего хранилища"""
+    backend = get_state_backend()
+    if backend is None:
+        return get_dialog_history(chat_id, max_messages)
+    return await backend.get_history(chat_id, max_messages)
+
+async def add_message_to_dialog_async(chat_id: int, role: str, content: str) -> None:
+    """Добавить сообщение в историю диалога (см. add_message_to_dialog) с учетом общего хранилища"""
+    backend = get_state_backend()
+    if backend is None:
+        add_message_to_dialog(chat_id, role, content)
+        return
+    await backend.add_message(chat_id, role, content)
+    logger.info(f"Added message to dialog {chat_id}: role={role}, content_length={len(content)}")
+
+async def add_message_and_get_history_async(chat_id: int, role: str, content: str,
+                                            max_messages: int = 10) -> List[Dict[str, str]]:
+    """
+    Добавить сообщение и получить историю диалога (см. add_message_and_get_history).
+    В общем хранилище обе операции выполняются за один сетевой обмен.
+    """
+    backend = get_state_backend()
+    if backend is None:
+        return add_message_and_get_history(chat_id, role, content, max_messages)
+    history = await backend.add_message_and_get_history(chat_id, role, content, max_messages)
+    logger.info(f"Added message to dialog {chat_id}: role={role}, content_length={len(content)}")
+    return history
+
+async def clear_dialog_history_async(chat_id: int) -> None:
+    """Очистить историю диалога (см. clear_dialog_history) с учетом общего хранилища"""
+    backend = get_state_backend()
+    if backend is None:
+        clear_dialog_history(chat_id)
+        return
+    _service_relevance.pop(chat_id, None)
+    await backend.clear(chat_id)
+    logger.info(f"Cleared dialog history for chat {chat_id}")
+
+def get_dialog_stats() -> Dict[str, Any]:
     """
     Получить статистику диалогов
     
+    Счетчики поддерживаются инкрементально, поэтому вызов не зависит от числа чатов.
+    
     Returns:
-        Словарь со статистикой диалогов
+        Словарь со статистикой диалогов; dedup_ratio — во сколько раз общее
+        хранилище текстов меньше суммарной длины текстов по ссылкам
+    """
+    _prune_activity(time.monotonic())
+    stored_chars = _blob_stats["stored_chars"]
+    
+    stats = {
+        "total_dialogs": _dialog_counters["chats"],
+        "total_messages": _dialog_counters["messages"],
+        "total_bytes": _dialog_counters["bytes"],
+        "messages_by_role": {role: count for role, count in _role_counts.items() if count},
+        "evicted_messages": _dialog_counters["evictions"],
+        "active_chats": len(_last_activity),
+        "unique_blobs": len(_blobs),
+        "blob_refs": _blob_stats["refs"],
+        "dedup_ratio": round(_blob_stats["referenced_chars"] / stored_chars, 2) if stored_chars else 1.0,
+        "relevance_chats": len(_service_relevance)
+    }
+    return stats
+
+async def get_shared_dialog_stats() -> Optional[Dict[str, int]]:
+    """
+    Получить общие для всех реплик счетчики диалогов из хранилища состояния
+    
+    Returns:
+        Счетчики или None, если общее хранилище не задано или недоступно
+    """
+    backend = get_state_backend()
+    if backend is None:
+        return None
+    try:
+        return await backend.get_shared_stats()
+    except (OSError, RespError) as e:
+        logger.warning(f"⚠️ Shared dialog stats unavailable: {e}")
+        return None
+
+def get_history_length_histogram() -> Dict[str, int]:
+    """
+    Получить распределение чатов по длине истории
+    
+    Returns:
+        Словарь {"<=N": количество чатов}, последняя корзина — ">N"
+    """
+    labels = [f"<={bound}" for bound in HISTORY_LENGTH_BUCKETS] + [f">{HISTORY_LENGTH_BUCKETS[-1]}"]
+    return dict(zip(labels, _length_histogram))
+
+def get_dialog_bytes_by_length() -> Dict[str, int]:
+    """
+    Получить размер текстов диалогов в байтах по корзинам длины истории
+    (те же корзины, что в get_history_length_histogram)
+    
+    Returns:
+        Словарь {"<=N": байт}, последняя корзина — ">N"
+    """
+    labels = [f"<={bound}" for bound in HISTORY_LENGTH_BUCKETS] + [f">{HISTORY_LENGTH_BUCKETS[-1]}"]
+    sizes = [0] * len(labels)
+    for chat_id, size in _chat_bytes.items():
+        sizes[bisect_left(HISTORY_LENGTH_BUCKETS, len(_dialogs[chat_id]))] += size
+    return dict(zip(labels, sizes))
+
+def get_largest_dialogs(limit: int = 10) -> List[Tuple[int, int, int]]:
     """
-    total_dialogs = len(_dialogs)
-    total_messages = sum(len(messages) for messages in _dialogs.values())
+    Получить самые большие диалоги по размеру текстов
+    
+    Args:
+        limit: Количество диалогов
+        
+    Returns:
+        Список (ID чата, сообщений, байт) по убыванию размера
+    """
+    largest = heapq.nlargest(limit, _chat_bytes.items(), key=lambda item: item[1])
+    return [(chat_id, len(_dialogs[chat_id]), size) for chat_id, size in largest]
+
+def reset_dialogs() -> None:
+    """Удалить все диалоги и сбросить счетчики"""
+    _dialogs.clear()
+    _blobs.clear()
+    _chat_bytes.clear()
+    _service_relevance.clear()
+    _last_activity.clear()
+    _role_counts.clear()
+    for counters in (_blob_stats, _dialog_counters):
+        for key in counters:
+            counters[key] = 0
+    _length_histogram[:] = [0] * len(_length_histogram)
+
+def save_dialogs_snapshot(path: str) -> int:
+    """
+    Сохранить все диалоги в компактный бинарный файл.
+    Запись атомарная: сначала во временный файл, затем переименование.
+    
+    Args:
+        path: Путь к файлу снимка
+        
+    Returns:
+        Количество сохраненных диалогов
+    """
+    payload = json.dumps(
+        {str(chat_id): messages for chat_id, messages in _dialogs.items()},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    data = SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]) + zlib.compress(payload, 6)
+    
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    
+    logger.info(f"💾 Saved dialogs snapshot: {len(_dialogs)} chats, {len(data)} bytes -> {path}")
+    return len(_dialogs)
+
+def load_dialogs_snapshot(path: str) -> int:
+    """
+    Восстановить диалоги из файла снимка.
+    Неизвестная версия формата или поврежденный файл игнорируются.
+    
+    Args:
+        path: Путь к файлу снимка
+        
+    Returns:
+        Количество восстановленных диалогов
+    """
+    if not os.path.exists(path):
+        return 0
+    
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        
+        header_size = len(SNAPSHOT_MAGIC) + 1
+        if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError("not a dialogs snapshot")
+        version = data[len(SNAPSHOT_MAGIC)]
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {version}")
+        
+        restored = json.loads(zlib.decompress(data[header_size:]).decode("utf-8"))
+    except (OSError, ValueError, zlib.error) as e:
+        logger.warning(f"⚠️ Dialogs snapshot {path} ignored: {e}")
+        return 0
+    
+    for chat_id, messages in restored.items():
+        _release_dialog(int(chat_id))
+        for message in messages:
+            message["content"] = _intern_content(message["content"])
+            _track_message(int(chat_id), message, 1)
+        _dialogs[int(chat_id)] = messages
+        _dialog_counters["chats"] += 1
+        _move_in_histogram(0, len(messages))
     
-    return {
-        "total_dialogs": total_dialogs,
-        "total_messages": total_messages
-    } 
\ No newline at end of file
+    logger.info(f"💾 Restored dialogs snapshot: {len(restored)} chats from {path}")
+    return len(restored)
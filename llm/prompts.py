@@ -1,34 +1,13 @@
 # LLM prompts module
 
-from llm.services import get_company_info, get_all_services, find_relevant_services, format_services_for_prompt
+from llm.catalog import CatalogSnapshot, get_catalog, register_derived
+from typing import Optional
+from llm.memory import get_top_services
+from llm.services import find_relevant_services, format_services_for_prompt, get_services_by_keys
 
-# Базовый системный промпт
-BASE_SYSTEM_PROMPT = """Ты — консультант компании Sign Language Interface, которая специализируется на разработке передовых решений для распознавания жестов и создания доступных технологий для жестового языка.
-
-## О компании:
-• **Название**: Sign Language Interface
-• **Веб-сайт**: https://ods.ai/projects/sli
-• **Миссия**: Улучшение доступности технологий для людей, использующих жестовые языки
-• **Специализация**: Разработка решений для распознавания жестов, системы машинного перевода, обучающие платформы
-
-## Наши услуги:
-
-### 🔍 Поисковая система для жестового языка (MVP)
-Интеллектуальная поисковая система для нахождения жестов по описанию или контексту
-
-### 📚 Интерактивная система обучения жестовому языку (Medium VP)
-Комплексная платформа для изучения жестового языка с использованием ИИ
-
-### 🔄 Система машинного перевода жестов (Maximal VP)
-Автоматический перевод между жестовым и устным языком в реальном времени
-
-### 💼 Консультационные услуги по жестовым интерфейсам
-Экспертная поддержка в разработке и внедрении решений для жестового интерфейса
-
-### 🎨 UI/UX дизайн для жестовых интерфейсов
-Создание пользовательских интерфейсов, адаптированных для жестового управления
-
-## Твоя роль:
+# Статичная часть системного промпта; разделы о компании и услугах
+# отрисовываются из каталога (см. llm/catalog.py)
+SYSTEM_PROMPT_RULES = """## Твоя роль:
 Ты помогаешь клиентам понять, какие из наших решений подойдут для их задач в области жестового языка и распознавания жестов.
 
 ## Правила поведения:
@@ -46,28 +25,50 @@ BASE_SYSTEM_PROMPT = """Ты — консультант компании Sign La
 - Фокус на практической пользе для клиента
 - Понимание особенностей работы с жестовыми языками"""
 
-def get_system_prompt(user_message: str = "") -> str:
+def render_base_system_prompt(catalog: CatalogSnapshot) -> str:
+    """
+    Отрисовать базовый системный промпт для снимка каталога
+    
+    Args:
+        catalog: Снимок каталога услуг
+        
+    Returns:
+        Базовый системный промпт
+    """
+    company = catalog.company_info
+    intro = f"Ты — консультант компании {company['name']}. {company['description']}."
+    return "\n\n".join([intro, catalog.prompt_sections, SYSTEM_PROMPT_RULES])
+
+register_derived("base_system_prompt", render_base_system_prompt)
+
+def get_system_prompt(user_message: str = "", chat_id: Optional[int] = None) -> str:
     """
     Получить системный промпт с учетом сообщения пользователя
     
     Args:
         user_message: Сообщение пользователя для поиска релевантных услуг
+        chat_id: ID чата; если указан, услуги берутся из накопленной релевантности
+            диалога (см. update_service_relevance), а не только из последнего сообщения
         
     Returns:
         Системный промпт с релевантными услугами
     """
-    prompt = BASE_SYSTEM_PROMPT
+    prompt = get_base_system_prompt()
     
-    # Если есть сообщение пользователя, добавляем релевантные услуги
-    if user_message:
+    if chat_id is not None:
+        relevant_services = get_services_by_keys(service_key for service_key, _ in get_top_services(chat_id))
+    elif user_message:
         relevant_services = find_relevant_services(user_message)
-        if relevant_services:
-            services_info = format_services_for_prompt(relevant_services)
-            prompt += f"\n\n## Релевантные услуги для данного запроса:\n{services_info}"
-            prompt += "\n\nОбрати особое внимание на эти услуги при формировании ответа."
+    else:
+        relevant_services = []
+    
+    if relevant_services:
+        services_info = format_services_for_prompt(relevant_services)
+        prompt += f"\n\n## Релевантные услуги для данного запроса:\n{services_info}"
+        prompt += "\n\nОбрати особое внимание на эти услуги при формировании ответа."
     
     return prompt
 
 def get_base_system_prompt() -> str:
     """Получить базовый системный промпт без динамических элементов"""
-    return BASE_SYSTEM_PROMPT 
\ No newline at end of file
+    return get_catalog().derived["base_system_prompt"] 
\ No newline at end of file
@@ -1,96 +1,89 @@
 """
 Модуль с услугами компании Sign Language Interface
 Компания специализируется на разработке решений для распознавания жестов
+
+Данные услуг загружаются из файла каталога (см. llm/catalog.py)
 """
 import logging
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Mapping, Optional
+from config import get_fuzzy_max_edit_distance, get_fuzzy_min_confidence
+from llm.catalog import CatalogSnapshot, get_catalog, register_derived
+from llm.fuzzy import FuzzyIndex, build_fuzzy_index, lookup, normalize_text, normalize_word, strip_ending, words
+from llm.logging_utils import log_content
 
 logger = logging.getLogger(__name__)
 
-# Услуги компании Sign Language Interface
-COMPANY_SERVICES = {
-    "поисковая_система": {
-        "name": "Поисковая система для жестового языка",
-        "description": "Интеллектуальная поисковая система для нахождения жестов по описанию или контексту",
-        "keywords": ["поиск", "жест", "словарь", "база данных", "найти", "искать"],
-        "details": [
-            "Поиск жестов по текстовому описанию",
-            "Распознавание жестов из видео",
-            "Интеграция с базой данных жестов",
-            "API для сторонних приложений"
-        ],
-        "type": "MVP",
-        "target_audience": "образовательные учреждения, сообщества глухих"
-    },
-    "обучающая_система": {
-        "name": "Интерактивная система обучения жестовому языку",
-        "description": "Комплексная платформа для изучения жестового языка с использованием ИИ",
-        "keywords": ["обучение", "изучение", "курс", "учеба", "преподавание", "образование"],
-        "details": [
-            "Персонализированные уроки жестового языка",
-            "Оценка правильности выполнения жестов",
-            "Интерактивные упражнения и игры",
-            "Отслеживание прогресса обучения"
-        ],
-        "type": "Medium VP",
-        "target_audience": "студенты, преподаватели, самообучающиеся"
-    },
-    "машинный_перевод": {
-        "name": "Система машинного перевода жестов",
-        "description": "Автоматический перевод между жестовым и устным языком в реальном времени",
-        "keywords": ["перевод", "переводчик", "устный", "жестовый", "коммуникация"],
-        "details": [
-            "Перевод с жестового языка на устный",
-            "Перевод с устного языка на жестовый",
-            "Работа в реальном времени",
-            "Поддержка различных диалектов жестового языка"
-        ],
-        "type": "Maximal VP",
-        "target_audience": "широкий круг пользователей, корпоративные клиенты"
-    },
-    "консалтинг": {
-        "name": "Консультационные услуги по жестовым интерфейсам",
-        "description": "Экспертная поддержка в разработке и внедрении решений для жестового интерфейса",
-        "keywords": ["консультация", "экспертиза", "внедрение", "разработка", "консалтинг"],
-        "details": [
-            "Анализ потребностей в жестовых интерфейсах",
-            "Техническая экспертиза решений",
-            "Разработка стратегии внедрения",
-            "Обучение команды разработчиков"
-        ],
-        "type": "Consulting",
-        "target_audience": "IT-компании, стартапы, крупные корпорации"
-    },
-    "ui_ux_дизайн": {
-        "name": "UI/UX дизайн для жестовых интерфейсов",
-        "description": "Создание пользовательских интерфейсов, адаптированных для жестового управления",
-        "keywords": ["дизайн", "интерфейс", "ui", "ux", "пользовательский", "жестовый"],
-        "details": [
-            "Дизайн интерфейсов для жестового управления",
-            "Исследование пользовательского опыта",
-            "Прототипирование жестовых интерфейсов",
-            "Тестирование с реальными пользователями"
-        ],
-        "type": "Design",
-        "target_audience": "продуктовые команды, дизайн-агентства"
-    }
-}
-
-# Информация о компании
-COMPANY_INFO = {
-    "name": "Sign Language Interface",
-    "website": "https://ods.ai/projects/sli",
-    "description": "Компания специализируется на разработке передовых решений для распознавания жестов и создания доступных технологий для жестового языка",
-    "mission": "Улучшение доступности технологий для людей, использующих жестовые языки"
-}
+def get_catalog_version() -> int:
+    """Получить текущую версию каталога услуг"""
+    return get_catalog().version
 
-def get_company_info() -> Dict:
+def get_company_info() -> Mapping[str, str]:
     """Получить информацию о компании"""
-    return COMPANY_INFO
+    return get_catalog().company_info
 
-def get_all_services() -> Dict[str, Dict]:
+def get_all_services() -> Mapping[str, Mapping]:
     """Получить все услуги компании"""
-    return COMPANY_SERVICES
+    return get_catalog().services
+
+def _build_keyword_fuzzy_index(catalog: CatalogSnapshot) -> FuzzyIndex:
+    """Построить индекс удалений по однословным ключевым словам каталога"""
+    return build_fuzzy_index(
+        ((strip_ending(normalize_word(keyword)), keyword) for keyword in catalog.keyword_index if " " not in keyword),
+        get_fuzzy_max_edit_distance(),
+    )
+
+register_derived("keyword_fuzzy_index", _build_keyword_fuzzy_index)
+
+def score_services(user_message: str) -> Dict[str, float]:
+    """
+    Оценить уверенность совпадения сообщения с услугами
+    
+    Args:
+        user_message: Сообщение пользователя
+        
+    Returns:
+        Словарь {ключ услуги: уверенность от 0 до 1}; 1.0 — точное вхождение ключевого слова
+    """
+    catalog = get_catalog()
+    text = normalize_text(user_message)
+    scores: Dict[str, float] = {}
+    
+    # Точное вхождение ключевого слова через предпостроенный индекс
+    for keyword, service_keys in catalog.keyword_index.items():
+        if keyword in text:
+            for service_key in service_keys:
+                scores[service_key] = 1.0
+    
+    # Слова с опечатками сопоставляются через индекс удалений
+    fuzzy_index = catalog.derived["keyword_fuzzy_index"]
+    for word in set(words(text)):
+        match = lookup(fuzzy_index, strip_ending(word))
+        if match is None:
+            continue
+        for keyword in match.values:
+            for service_key in catalog.keyword_index[keyword]:
+                scores[service_key] = max(scores.get(service_key, 0.0), match.confidence)
+    return scores
+
+def find_relevant_service_scores(user_message: str) -> Dict[str, float]:
+    """
+    Найти услуги, уверенно совпавшие с сообщением пользователя
+    
+    Args:
+        user_message: Сообщение пользователя
+        
+    Returns:
+        Словарь {ключ услуги: уверенность}; совпадения с уверенностью ниже FUZZY_MIN_CONFIDENCE не включаются
+    """
+    scores = score_services(user_message)
+    min_confidence = get_fuzzy_min_confidence()
+    
+    relevant = {service_key: score for service_key, score in scores.items() if score >= min_confidence}
+    skipped = {service_key: score for service_key, score in scores.items() if score < min_confidence}
+    if skipped:
+        logger.debug(f"Low-confidence service matches skipped: {skipped}")
+    log_content(logger, "service_query", "Service query", user_message)
+    return relevant
 
 def find_relevant_services(user_message: str) -> List[Dict]:
     """
@@ -100,29 +93,31 @@ def find_relevant_services(user_message: str) -> List[Dict]:
         user_message: Сообщение пользователя
         
     Returns:
-        Список релевантных услуг
+        Список релевантных услуг; совпадения с уверенностью ниже FUZZY_MIN_CONFIDENCE не включаются
     """
-    user_message_lower = user_message.lower()
-    relevant_services = []
+    scores = find_relevant_service_scores(user_message)
     
-    for service_key, service_info in COMPANY_SERVICES.items():
-        # Проверяем совпадение по ключевым словам
-        keywords_match = any(keyword in user_message_lower for keyword in service_info["keywords"])
-        
-        if keywords_match:
-            relevant_services.append({
-                "key": service_key,
-                "name": service_info["name"],
-                "description": service_info["description"],
-                "details": service_info["details"],
-                "type": service_info["type"],
-                "target_audience": service_info["target_audience"]
-            })
+    # Сохраняем порядок услуг из каталога
+    relevant_services = [summary for service_key, summary in get_catalog().service_summaries.items()
+                         if service_key in scores]
     
-    logger.info(f"Found {len(relevant_services)} relevant services for message: {user_message}")
+    logger.info(f"Found {len(relevant_services)} relevant services")
     return relevant_services
 
-def get_service_details(service_key: str) -> Optional[Dict]:
+def get_services_by_keys(service_keys: Iterable[str]) -> List[Dict]:
+    """
+    Получить краткие описания услуг по ключам
+    
+    Args:
+        service_keys: Ключи услуг в нужном порядке
+        
+    Returns:
+        Список услуг; ключи, которых нет в каталоге, пропускаются
+    """
+    summaries = get_catalog().service_summaries
+    return [summaries[service_key] for service_key in service_keys if service_key in summaries]
+
+def get_service_details(service_key: str) -> Optional[Mapping]:
     """
     Получить подробную информацию об услуге
     
@@ -132,7 +127,7 @@ def get_service_details(service_key: str) -> Optional[Dict]:
     Returns:
         Информация об услуге или None
     """
-    return COMPANY_SERVICES.get(service_key)
+    return get_catalog().services.get(service_key)
 
 def format_services_for_prompt(services: List[Dict]) -> str:
     """
@@ -0,0 +1,386 @@
+"""
+Общее состояние реплик в хранилище с протоколом Redis (RESP)
+
+Минимальный асинхронный клиент RESP на asyncio с пулом соединений: истории
+диалогов хранятся в ограниченных списках и обновляются конвейером команд
+(один сетевой обмен на реплику диалога), корзины токенов ограничения частоты
+обновляются атомарно Lua-скриптом через EVALSHA, ключи обработанных обновлений
+занимаются командой SET NX EX. Включается переменной REDIS_URL;
+по умолчанию состояние хранится в памяти процесса.
+
+Сетевой обмен выполняется в цикле событий и не занимает потоки пула
+asyncio.to_thread, в которых выполняются запросы к LLM.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+from config import (
+    get_redis_url,
+    get_redis_pool_size,
+    get_redis_timeout,
+    get_redis_key_prefix,
+    get_redis_dialog_ttl,
+    get_dialog_max_messages,
+)
+
+logger = logging.getLogger(__name__)
+
+class RespError(Exception):
+    """Ошибка, возвращенная сервером"""
+
+class RespConnection:
+    """Соединение с сервером RESP"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> "RespConnection":
+        """Открыть соединение"""
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @staticmethod
+    def encode(args: Sequence[Any]) -> bytes:
+        """Закодировать команду в массив bulk-строк"""
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def send(self, commands: Sequence[Sequence[Any]]) -> None:
+        """Отправить команды одним пакетом"""
+        self._writer.write(b"".join(self.encode(command) for command in commands))
+        await self._writer.drain()
+
+    async def read_reply(self) -> Any:
+        """Прочитать ответ сервера (ошибки возвращаются как RespError, а не выбрасываются)"""
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            return RespError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            try:
+                data = await self._reader.readexactly(length + 2)
+            except asyncio.IncompleteReadError:
+                raise ConnectionError("Connection closed by server") from None
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [await self.read_reply() for _ in range(count)]
+        raise ConnectionError(f"Unexpected reply prefix: {line[:20]!r}")
+
+    async def exchange(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """Отправить команды и прочитать ответы на них"""
+        await self.send(commands)
+        return [await self.read_reply() for _ in commands]
+
+    def close(self) -> None:
+        """Закрыть соединение"""
+        try:
+            self._writer.close()
+        except (OSError, RuntimeError):
+            # Цикл событий, в котором открыто соединение, уже закрыт
+            pass
+
+class RespClient:
+    """Клиент RESP с пулом соединений фиксированного размера"""
+
+    def __init__(self, url: str, pool_size: int, timeout: float):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported state backend URL scheme: {parsed.scheme!r}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        # Соединения создаются лениво и привязаны к циклу событий, в котором открыты
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._idle: List[RespConnection] = []
+        self._scripts: Dict[str, str] = {}
+
+    def _ensure_pool(self) -> None:
+        """Создать пул для текущего цикла событий (соединения другого цикла закрываются)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self.close()
+        self._loop = loop
+        self._slots = asyncio.Semaphore(self.pool_size)
+
+    async def _connect(self) -> RespConnection:
+        """Открыть соединение, выполнить аутентификацию и выбрать базу"""
+        connection = await RespConnection.open(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            try:
+                replies = await connection.exchange(setup)
+            except BaseException:
+                connection.close()
+                raise
+            for reply in replies:
+                if isinstance(reply, RespError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[RespConnection]:
+        """
+        Взять соединение из пула; если обмен прерван ошибкой или отменой,
+        соединение закрывается (в нем могут остаться непрочитанные ответы)
+        """
+        self._ensure_pool()
+        slots = self._slots
+        try:
+            await asyncio.wait_for(slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError("State backend connection pool exhausted") from None
+
+        connection = self._idle.pop() if self._idle else None
+        reusable = False
+        try:
+            if connection is None:
+                connection = await self._connect()
+            yield connection
+            reusable = True
+        finally:
+            if connection is not None:
+                if reusable and slots is self._slots:
+                    self._idle.append(connection)
+                else:
+                    connection.close()
+            slots.release()
+
+    async def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """
+        Выполнить команды за один сетевой обмен
+
+        Returns:
+            Ответы на команды по порядку
+
+        Raises:
+            RespError: если сервер вернул ошибку на одну из команд
+            TimeoutError: если сервер не ответил за REDIS_TIMEOUT
+        """
+        try:
+            async with self.connection() as connection:
+                replies = await asyncio.wait_for(connection.exchange(commands), self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError("State backend request timed out") from None
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    async def execute(self, *args: Any) -> Any:
+        """Выполнить одну команду"""
+        return (await self.pipeline([args]))[0]
+
+    async def run_script(self, script: str, keys: Sequence[Any], args: Sequence[Any]) -> Any:
+        """
+        Выполнить Lua-скрипт по SHA1 (EVALSHA), загрузив его при первом обращении или после сброса кэша сервера
+        """
+        sha = self._scripts.get(script)
+        if sha is None:
+            sha = hashlib.sha1(script.encode("utf-8")).hexdigest()
+            self._scripts[script] = sha
+        try:
+            return await self.execute("EVALSHA", sha, len(keys), *keys, *args)
+        except RespError as e:
+            if not str(e).startswith("NOSCRIPT"):
+                raise
+        await self.execute("SCRIPT", "LOAD", script)
+        return await self.execute("EVALSHA", sha, len(keys), *keys, *args)
+
+    def close(self) -> None:
+        """Закрыть свободные соединения пула"""
+        for connection in self._idle:
+            connection.close()
+        self._idle = []
+
+# Две корзины токенов (пользователь и чат) проверяются и списываются атомарно.
+# KEYS: корзина пользователя, корзина чата
+# ARGV: емкость и скорость пользователя, емкость и скорость чата, текущее время, время жизни (мс)
+# Возвращает 0 — запрос разрешен, 1 — превышен лимит пользователя, 2 — лимит чата
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[5])
+local ttl = tonumber(ARGV[6])
+local function refill(key, burst, rate)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    return math.min(burst, tokens + math.max(0, now - ts) * rate)
+end
+local user_tokens = refill(KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[2]))
+local chat_tokens = refill(KEYS[2], tonumber(ARGV[3]), tonumber(ARGV[4]))
+local result = 0
+if user_tokens < 1 then
+    result = 1
+elseif chat_tokens < 1 then
+    result = 2
+else
+    user_tokens = user_tokens - 1
+    chat_tokens = chat_tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', user_tokens, 'ts', now)
+redis.call('HSET', KEYS[2], 'tokens', chat_tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ttl)
+redis.call('PEXPIRE', KEYS[2], ttl)
+return result
+"""
+
+_RATE_LIMIT_RESULTS = {0: None, 1: "user", 2: "chat"}
+
+class RedisStateBackend:
+    """Истории диалогов и корзины токенов в хранилище RESP"""
+
+    def __init__(self, client: RespClient, prefix: str, dialog_ttl: int):
+        self.client = client
+        self.prefix = prefix
+        self.dialog_ttl = dialog_ttl
+
+    def _dialog_key(self, chat_id: int) -> str:
+        return f"{self.prefix}dialog:{chat_id}"
+
+    def _append_commands(self, chat_id: int, role: str, content: str) -> List[Tuple[Any, ...]]:
+        """Команды добавления сообщения: запись, обрезка до лимита, продление срока и счетчики"""
+        key = self._dialog_key(chat_id)
+        entry = json.dumps({"role": role, "content": content, "timestamp": time.time()},
+                           ensure_ascii=False, separators=(",", ":"))
+        commands: List[Tuple[Any, ...]] = [("RPUSH", key, entry)]
+        max_messages = get_dialog_max_messages()
+        if max_messages:
+            commands.append(("LTRIM", key, -max_messages, -1))
+        if self.dialog_ttl:
+            commands.append(("EXPIRE", key, self.dialog_ttl))
+        stats_key = f"{self.prefix}stats"
+        commands += [
+            ("HINCRBY", stats_key, "messages_added", 1),
+            ("HINCRBY", stats_key, "bytes_added", len(content.encode("utf-8"))),
+            ("HINCRBY", stats_key, f"role:{role}", 1),
+        ]
+        return commands
+
+    @staticmethod
+    def _decode_history(entries: List[bytes]) -> List[Dict[str, str]]:
+        """Разобрать элементы списка истории"""
+        history = []
+        for raw in entries:
+            message = json.loads(raw)
+            history.append({"role": message["role"], "content": message["content"]})
+        return history
+
+    async def get_history(self, chat_id: int, max_messages: int) -> List[Dict[str, str]]:
+        """Последние max_messages сообщений чата"""
+        if max_messages <= 0:
+            return []
+        return self._decode_history(await self.client.execute("LRANGE", self._dialog_key(chat_id), -max_messages, -1))
+
+    async def add_message(self, chat_id: int, role: str, content: str) -> None:
+        """Добавить сообщение одним сетевым обменом"""
+        await self.client.pipeline(self._append_commands(chat_id, role, content))
+
+    async def add_message_and_get_history(self, chat_id: int, role: str, content: str,
+                                          max_messages: int) -> List[Dict[str, str]]:
+        """Добавить сообщение и получить историю одним сетевым обменом"""
+        commands = self._append_commands(chat_id, role, content)
+        commands.append(("LRANGE", self._dialog_key(chat_id), -max(max_messages, 1), -1))
+        entries = (await self.client.pipeline(commands))[-1]
+        return self._decode_history(entries) if max_messages > 0 else []
+
+    async def clear(self, chat_id: int) -> None:
+        """Удалить историю чата"""
+        await self.client.execute("DEL", self._dialog_key(chat_id))
+
+    async def get_shared_stats(self) -> Dict[str, int]:
+        """Общие для всех реплик счетчики добавленных сообщений"""
+        reply = await self.client.execute("HGETALL", f"{self.prefix}stats") or []
+        return {reply[i].decode("utf-8"): int(reply[i + 1]) for i in range(0, len(reply), 2)}
+
+    async def claim_updates(self, keys: Sequence[str], ttl: float) -> bool:
+        """
+        Атомарно занять ключи обновления (SET NX EX) одним сетевым обменом
+
+        Returns:
+            True если ни один ключ не был занят раньше, то есть обновление обрабатывается впервые
+        """
+        expire = max(int(ttl), 1)
+        replies = await self.client.pipeline([("SET", f"{self.prefix}update:{key}", 1, "NX", "EX", expire) for key in keys])
+        return all(reply == "OK" for reply in replies)
+
+    async def release_updates(self, keys: Sequence[str]) -> None:
+        """Освободить ключи обновления, обработка которого не завершилась"""
+        await self.client.execute("DEL", *(f"{self.prefix}update:{key}" for key in keys))
+
+    async def check_rate_limit(self, user_id: int, chat_id: int,
+                               user_burst: int, user_rate: float,
+                               chat_burst: int, chat_rate: float,
+                               idle_ttl: float, now: Optional[float] = None) -> Optional[str]:
+        """
+        Атомарно проверить и списать токены корзин пользователя и чата
+
+        Returns:
+            None если запрос разрешен, иначе "user" или "chat"
+        """
+        if now is None:
+            now = time.time()
+        result = await self.client.run_script(
+            TOKEN_BUCKET_SCRIPT,
+            [f"{self.prefix}bucket:user:{user_id}", f"{self.prefix}bucket:chat:{chat_id}"],
+            [user_burst, user_rate, chat_burst, chat_rate, f"{now:.6f}", int(idle_ttl * 1000)],
+        )
+        return _RATE_LIMIT_RESULTS[int(result)]
+
+_backend: Optional[RedisStateBackend] = None
+_backend_url: Optional[str] = None
+
+def get_state_backend() -> Optional[RedisStateBackend]:
+    """
+    Получить общее хранилище состояния
+
+    Returns:
+        Хранилище или None, если REDIS_URL не задан и состояние хранится в памяти процесса
+    """
+    global _backend, _backend_url
+    url = get_redis_url()
+    if not url:
+        return None
+    if _backend is None or _backend_url != url:
+        client = RespClient(url, get_redis_pool_size(), get_redis_timeout())
+        _backend = RedisStateBackend(client, get_redis_key_prefix(), get_redis_dialog_ttl())
+        _backend_url = url
+        logger.info(f"🗄️ State backend: {client.host}:{client.port}/{client.db} | "
+                    f"Pool: {get_redis_pool_size()}")
+    return _backend
+
+def close_state_backend() -> None:
+    """Закрыть соединения общего хранилища (при остановке бота)"""
+    if _backend is not None:
+        _backend.client.close()
@@ -1,9 +1,23 @@
 import asyncio
 import logging
+from datetime import datetime
 from aiogram import Bot, Dispatcher
-from config import get_telegram_token, get_log_level
+from config import (
+    get_telegram_token,
+    get_log_level,
+    get_dialog_stats_interval,
+    get_budget_state_path,
+    get_loop_lag_interval,
+)
+from bot.admin import monitor_loop_lag
+from bot.runtime import get_runtime_info, run
+from bot.health import start_health_server, stop_health_server
 from bot.handlers import setup_handlers
-from llm.logging_utils import setup_detailed_logging
+from bot.shutdown import setup_shutdown
+from bot.recorder import setup_recording
+from llm.logging_utils import setup_detailed_logging, publish_dialog_gauges, start_event_sink, emit_event
+from llm.catalog import get_catalog, watch_catalog
+from llm.budget import persist_budget_state
 
 async def main():
     """Основная функция приложения"""
@@ -16,6 +30,40 @@ async def main():
     # Регистрация обработчиков
     setup_handlers(dp)
     
+    # Корректная остановка: ожидание запросов и снимок диалогов
+    setup_shutdown(dp)
+    
+    # Запись обезличенных сообщений для воспроизведения (если задан RECORD_UPDATES_PATH)
+    setup_recording(dp)
+    
+    # Загрузка каталога услуг и слежение за изменениями файла
+    catalog = get_catalog()
+    logger.info(f"Service catalog version {catalog.version} loaded from {catalog.source}")
+    catalog_watcher = asyncio.create_task(watch_catalog())
+    
+    # Журнал событий метрик (если задан EVENT_LOG_PATH) и периодическая публикация метрик диалогов
+    start_event_sink()
+    
+    # Среда выполнения (RUNTIME_MODE, EAGER_TASKS) — в лог и в журнал событий
+    runtime = get_runtime_info()
+    logger.info(f"⚙️ Runtime: loop={runtime['loop']} | eager_tasks={runtime['eager_tasks']} | "
+                f"Python {runtime['python']} | mode={runtime['mode']}")
+    emit_event({"timestamp": datetime.now().isoformat(), "event_type": "runtime", **runtime},
+               "RUNTIME_METRICS", logging.INFO)
+    
+    background_tasks = [catalog_watcher]
+    if get_dialog_stats_interval() > 0:
+        background_tasks.append(asyncio.create_task(publish_dialog_gauges()))
+    # Периодическое сохранение счетчиков бюджетов (если задан BUDGET_STATE_PATH)
+    if get_budget_state_path():
+        background_tasks.append(asyncio.create_task(persist_budget_state()))
+    # Измерение задержки цикла событий для /admin_stats
+    if get_loop_lag_interval() > 0:
+        background_tasks.append(asyncio.create_task(monitor_loop_lag()))
+    
+    # Эндпоинты /healthz и /readyz для платформы (если задан HEALTH_PORT или PORT)
+    await start_health_server(bot)
+    
     logger.info("Starting bot...")
     
     try:
@@ -23,6 +71,9 @@ async def main():
     except Exception as e:
         logger.error(f"Error during bot polling: {str(e)}")
     finally:
+        for task in background_tasks:
+            task.cancel()
+        await stop_health_server()
         await bot.session.close()
 
 if __name__ == "__main__":
@@ -31,7 +82,7 @@ if __name__ == "__main__":
     logger = logging.getLogger(__name__)
     
     try:
-        asyncio.run(main())
+        run(main)
     except KeyboardInterrupt:
         logger.info("Bot stopped by user (Ctrl+C)")
     except Exception as e:
@@ -0,0 +1,120 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from aiogram.filters import CommandObject
+from aiogram.types import Message, User
+from bot.admin import (
+    cmd_admin_top,
+    collect_runtime_stats,
+    get_loop_lag_stats,
+    is_admin,
+    monitor_loop_lag,
+    profile_cpu,
+    trace_memory_growth,
+)
+from config import reload_settings
+from llm.memory import add_message_to_dialog, get_dialog_bytes_by_length, get_largest_dialogs, reset_dialogs
+
+@pytest.fixture(autouse=True)
+def admin_env(monkeypatch):
+    """Администратор с ID 42"""
+    monkeypatch.setenv("ADMIN_USER_IDS", "42, 43")
+    reload_settings()
+    reset_dialogs()
+    yield
+    reset_dialogs()
+    monkeypatch.undo()
+    reload_settings()
+
+def make_message(user_id):
+    message = Mock(spec=Message)
+    message.from_user = Mock(spec=User)
+    message.from_user.id = user_id
+    message.answer = AsyncMock()
+    return message
+
+def test_is_admin():
+    """Тест фильтра служебных команд по ADMIN_USER_IDS"""
+    assert is_admin(make_message(42))
+    assert not is_admin(make_message(7))
+
+def test_largest_dialogs_and_memory_by_length():
+    """Тест: размер диалогов учитывается по чатам и по корзинам длины истории"""
+    add_message_to_dialog(1, "user", "а" * 10)
+    for _ in range(3):
+        add_message_to_dialog(2, "user", "b" * 100)
+
+    assert get_largest_dialogs(1) == [(2, 3, 300)]
+    assert get_largest_dialogs() == [(2, 3, 300), (1, 1, 20)]
+    by_length = get_dialog_bytes_by_length()
+    assert by_length["<=1"] == 20
+    assert by_length["<=5"] == 300
+
+@pytest.mark.asyncio
+async def test_collect_runtime_stats():
+    """Тест: сводка содержит показатели всех подсистем и доли попаданий"""
+    for chat_id in (1, 2):
+        add_message_to_dialog(chat_id, "assistant", "одинаковый длинный ответ " * 5)
+
+    stats = collect_runtime_stats()
+
+    assert stats["llm"]["in_flight"] == 0
+    assert stats["llm"]["circuit"] == "closed"
+    assert stats["dialogs"]["total_dialogs"] == 2
+    assert stats["caches"]["blob_reuse"] == 0.5
+    assert "queued" in stats["send_queue"]
+    assert stats["runtime"]["tasks"] >= 1
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_detects_blocking():
+    """Тест: блокирующий код в цикле событий виден как задержка"""
+    monitor = asyncio.create_task(monitor_loop_lag(0.01))
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)
+    await asyncio.sleep(0.03)
+    monitor.cancel()
+
+    assert get_loop_lag_stats()["max"] >= 0.05
+
+@pytest.mark.asyncio
+async def test_trace_memory_growth_reports_allocations():
+    """Тест: снимок памяти показывает строки с наибольшим ростом"""
+    retained = []
+
+    async def allocate():
+        await asyncio.sleep(0.01)
+        retained.append([bytearray(1000) for _ in range(200)])
+
+    task = asyncio.create_task(allocate())
+    summary = await trace_memory_growth(0.05)
+    await task
+
+    assert summary.startswith("🧠 Memory growth over 0.05s")
+    assert "test_admin.py" in summary
+
+@pytest.mark.asyncio
+async def test_profile_cpu_samples_event_loop_thread():
+    """Тест: профилирование находит функцию, занимающую цикл событий"""
+    async def busy():
+        await asyncio.sleep(0.02)
+        deadline = asyncio.get_running_loop().time() + 0.2
+        while asyncio.get_running_loop().time() < deadline:
+            sum(range(1000))
+
+    task = asyncio.create_task(busy())
+    summary = await profile_cpu(0.3, interval=0.002)
+    await task
+
+    assert "busy (test_admin.py" in summary
+
+@pytest.mark.asyncio
+async def test_admin_top_command():
+    """Тест команды /admin_top"""
+    add_message_to_dialog(5, "user", "привет")
+    message = make_message(42)
+
+    with patch("bot.admin.send_text", new_callable=AsyncMock) as send:
+        await cmd_admin_top(message, CommandObject(command="admin_top", args="3"))
+
+    assert send.call_args[0][1].startswith("5: 1 messages")
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import time
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from aiogram.types import Message, Chat, User
+from bot.handlers import handle_message
+from config import reload_settings
+from llm.budget import (
+    estimate_cost,
+    get_budget_action,
+    get_budget_stats,
+    get_budget_usage,
+    load_budget_state,
+    persist_budget_state,
+    record_usage,
+    reset_budgets,
+    save_budget_state,
+)
+from llm.memory import clear_dialog_history
+
+DAY = 86400
+NOON = 20000 * DAY + 43200
+
+@pytest.fixture(autouse=True)
+def budget_env(monkeypatch):
+    """Небольшие бюджеты и цены для тестов"""
+    monkeypatch.setenv("BUDGET_USER_DAILY_TOKENS", "1000")
+    monkeypatch.setenv("BUDGET_GLOBAL_DAILY_COST", "1.0")
+    monkeypatch.setenv("BUDGET_POLICY", "downgrade")
+    monkeypatch.setenv("BUDGET_FALLBACK_MODEL", "cheap/model")
+    monkeypatch.setenv("BUDGET_HARD_LIMIT_FACTOR", "2")
+    monkeypatch.setenv("LLM_PRICES", "main/model=1000:2000,cheap/model=10:20")
+    reload_settings()
+    reset_budgets()
+    yield
+    reset_budgets()
+    monkeypatch.undo()
+    reload_settings()
+
+def test_estimate_cost_from_price_table():
+    """Тест оценки стоимости по ценам за миллион токенов"""
+    assert estimate_cost("main/model", 1000, 500) == pytest.approx(2.0)
+    assert estimate_cost("unknown/model", 1000, 500) == 0.0
+
+def test_user_budget_downgrade_then_refuse():
+    """Тест: после превышения бюджета модель заменяется, после двукратного — запрос отклоняется"""
+    assert get_budget_action("1", now=NOON) is None
+    record_usage("1", "cheap/model", 900, 200, now=NOON)
+
+    assert get_budget_action("1", now=NOON) == "downgrade"
+    assert get_budget_action("2", now=NOON) is None
+
+    record_usage("1", "cheap/model", 800, 100, now=NOON)
+    assert get_budget_action("1", now=NOON) == "refuse"
+    assert get_budget_usage("1", now=NOON) == {"prompt_tokens": 1700, "completion_tokens": 300,
+                                               "cost": 0.023, "requests": 2}
+    assert get_budget_stats(now=NOON)["actions"] == {"downgrade": 1, "shrink": 0, "refuse": 1}
+
+def test_global_cost_budget_applies_to_everyone(monkeypatch):
+    """Тест: превышение общего бюджета стоимости затрагивает всех пользователей"""
+    monkeypatch.setenv("BUDGET_POLICY", "shrink")
+    reload_settings()
+
+    record_usage("1", "main/model", 100, 600, now=NOON)
+
+    assert get_budget_action("2", now=NOON) == "shrink"
+    assert get_budget_stats(now=NOON)["global"]["cost"] == pytest.approx(1.3)
+
+def test_downgrade_without_fallback_model_shrinks(monkeypatch):
+    """Тест: без BUDGET_FALLBACK_MODEL вместо смены модели сокращается контекст"""
+    monkeypatch.setenv("BUDGET_FALLBACK_MODEL", "")
+    reload_settings()
+
+    record_usage("1", "cheap/model", 1000, 0, now=NOON)
+
+    assert get_budget_action("1", now=NOON) == "shrink"
+
+def test_window_is_rolling():
+    """Тест: расход учитывается 24 часа с момента запроса, а не до конца календарных суток"""
+    record_usage("1", "cheap/model", 1500, 0, now=NOON)
+    record_usage("1", "cheap/model", 100, 0, now=NOON + DAY / 2)
+    # Полночь UTC не сбрасывает счетчики
+    assert get_budget_action("1", now=NOON + DAY / 2) == "downgrade"
+
+    assert get_budget_action("1", now=NOON + DAY) is None
+    assert get_budget_usage("1", now=NOON + DAY) == {"prompt_tokens": 100, "completion_tokens": 0,
+                                                     "cost": 0.001, "requests": 1}
+    assert get_budget_stats(now=NOON + DAY / 2 + DAY)["users"] == 0
+
+def test_state_roundtrip(tmp_path):
+    """Тест сохранения и восстановления счетчиков; расход старше окна не восстанавливается"""
+    path = str(tmp_path / "budgets.json")
+    record_usage("1", "main/model", 100, 50, now=NOON)
+    record_usage("2", "cheap/model", 10, 5, now=NOON)
+    assert save_budget_state(path) == 2
+
+    reset_budgets()
+    assert load_budget_state(path, now=NOON + 60) == 2
+    assert get_budget_usage("1", now=NOON + 60)["prompt_tokens"] == 100
+    assert get_budget_usage("2", now=NOON + 60)["cost"] == pytest.approx(0.0002)
+
+    # Состояние за прошлые календарные сутки восстанавливается, пока оно в пределах окна
+    reset_budgets()
+    assert load_budget_state(path, now=NOON + DAY / 2 + 60) == 2
+
+    reset_budgets()
+    assert load_budget_state(path, now=NOON + DAY) == 0
+    assert get_budget_usage("1", now=NOON + DAY)["requests"] == 0
+
+def test_invalid_state_file_ignored(tmp_path):
+    """Тест: поврежденный файл состояния игнорируется"""
+    path = tmp_path / "budgets.json"
+    path.write_text(json.dumps({"version": 2, "slot_seconds": 3600, "global": [],
+                                "users": {"1": [[480012, ["x"]]]}}), encoding="utf-8")
+
+    assert load_budget_state(str(path), now=NOON) == 0
+    assert load_budget_state(str(tmp_path / "missing.json")) == 0
+
+@pytest.mark.asyncio
+async def test_failed_save_keeps_state_dirty(tmp_path):
+    """Тест: после неудачной записи счетчики сохраняются при следующей попытке"""
+    calls = []
+
+    def flaky_write(path, payload):
+        calls.append(payload)
+        if len(calls) == 1:
+            raise OSError("disk full")
+
+    record_usage("1", "main/model", 100, 50)
+    with patch("llm.budget._write_state", side_effect=flaky_write):
+        task = asyncio.create_task(persist_budget_state(str(tmp_path / "budgets.json"), interval=0.01))
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+    assert len(calls) == 2
+    assert calls[0] == calls[1]
+
+def test_check_is_cheap():
+    """Тест: проверка бюджета не зависит от числа пользователей и занимает микросекунды"""
+    for user_id in range(10000):
+        record_usage(str(user_id), "main/model", 10, 10, now=NOON)
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        get_budget_action("42", now=NOON)
+    assert (time.perf_counter() - start) / 10000 < 50e-6
+
+def make_message(text):
+    message = Mock(spec=Message)
+    message.chat = Mock(spec=Chat)
+    message.chat.id = 777
+    message.from_user = Mock(spec=User)
+    message.from_user.id = 778
+    message.from_user.full_name = "Test"
+    message.text = text
+    message.answer = AsyncMock()
+    return message
+
+@pytest.mark.asyncio
+async def test_handler_applies_budget_policy():
+    """Тест: обработчик учитывает расход, переключает модель и отклоняет запросы сверх бюджета"""
+    clear_dialog_history(777)
+
+    async def fake_llm(messages, stats=None, model=None):
+        stats.update(model=model or "main/model", success=True, prompt_tokens=700, completion_tokens=100)
+        return "Ответ"
+
+    with patch("bot.handlers.get_llm_response", side_effect=fake_llm) as mock_llm:
+        await handle_message(make_message("Расскажите про перевод"))
+        assert mock_llm.call_args.kwargs["model"] is None
+        await handle_message(make_message("А сколько стоит?"))
+        assert mock_llm.call_args.kwargs["model"] is None
+
+        await handle_message(make_message("А сроки?"))
+        assert mock_llm.call_args.kwargs["model"] == "cheap/model"
+
+        refused = make_message("Еще вопрос")
+        await handle_message(refused)
+        assert mock_llm.call_count == 3
+        assert "лимит" in refused.answer.call_args[0][0]
+
+    assert get_budget_usage("778")["requests"] == 3
+    clear_dialog_history(777)
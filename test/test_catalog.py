@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import pytest
+from config import get_service_catalog_path
+from llm.catalog import get_catalog, reload_catalog, validate_catalog_data, watch_catalog
+from llm.prompts import get_base_system_prompt
+from llm.services import find_relevant_services
+
+@pytest.fixture
+def catalog_data():
+    """Данные каталога по умолчанию"""
+    with open(get_service_catalog_path(), encoding="utf-8") as f:
+        return json.load(f)
+
+@pytest.fixture
+def catalog_file(tmp_path, catalog_data):
+    """Копия каталога во временном файле; после теста загружается каталог по умолчанию"""
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(catalog_data, ensure_ascii=False), encoding="utf-8")
+    yield path
+    reload_catalog(get_service_catalog_path())
+
+def test_keyword_index_built():
+    """Тест индекса ключевых слов"""
+    catalog = get_catalog()
+    assert catalog.keyword_index["перевод"] == ("машинный_перевод",)
+    assert set(catalog.keyword_index["жестовый"]) == {"машинный_перевод", "ui_ux_дизайн"}
+
+def test_prompt_rendered_from_catalog():
+    """Тест: разделы промпта строятся из каталога, а не дублируются вручную"""
+    prompt = get_base_system_prompt()
+    for service in get_catalog().services.values():
+        assert service["name"] in prompt
+    assert get_catalog().company_info["website"] in prompt
+
+def test_reload_swaps_snapshot(catalog_file, catalog_data):
+    """Тест атомарной замены снимка при перезагрузке"""
+    old_snapshot = get_catalog()
+    catalog_data["services"]["поисковая_система"]["keywords"].append("сурдо")
+    catalog_file.write_text(json.dumps(catalog_data, ensure_ascii=False), encoding="utf-8")
+
+    assert reload_catalog(str(catalog_file))
+    new_snapshot = get_catalog()
+
+    assert new_snapshot.version == old_snapshot.version + 1
+    assert "сурдо" not in old_snapshot.keyword_index
+    assert new_snapshot.keyword_index["сурдо"] == ("поисковая_система",)
+    assert find_relevant_services("нужен сурдо словарь")[0]["key"] == "поисковая_система"
+
+def test_reload_unchanged_file_keeps_version(catalog_file):
+    """Тест: повторная загрузка того же содержимого не меняет версию"""
+    reload_catalog(str(catalog_file))
+    version = get_catalog().version
+    assert not reload_catalog(str(catalog_file))
+    assert get_catalog().version == version
+
+def test_invalid_catalog_rejected(catalog_file, catalog_data):
+    """Тест: некорректный каталог не заменяет текущий"""
+    snapshot = get_catalog()
+    del catalog_data["services"]["консалтинг"]["keywords"]
+    catalog_file.write_text(json.dumps(catalog_data, ensure_ascii=False), encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        reload_catalog(str(catalog_file))
+    assert get_catalog() is snapshot
+
+def test_validate_catalog_data():
+    """Тест валидации структуры каталога"""
+    with pytest.raises(ValueError):
+        validate_catalog_data([])
+    with pytest.raises(ValueError):
+        validate_catalog_data({"company": {"name": "X"}, "services": {}})
+
+@pytest.mark.asyncio
+async def test_watch_catalog_reloads_on_change(catalog_file, catalog_data):
+    """Тест горячей перезагрузки при изменении файла"""
+    reload_catalog(str(catalog_file))
+    version = get_catalog().version
+
+    task = asyncio.create_task(watch_catalog(interval=0.01))
+    try:
+        catalog_data["company"]["mission"] = "Новая миссия"
+        catalog_file.write_text(json.dumps(catalog_data, ensure_ascii=False), encoding="utf-8")
+        os.utime(catalog_file, ns=(0, 1))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if get_catalog().version > version:
+                break
+    finally:
+        task.cancel()
+
+    assert get_catalog().company_info["mission"] == "Новая миссия"
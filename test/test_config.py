@@ -1,12 +1,14 @@
 import os
 import pytest
-from config import get_log_level, get_telegram_token
+import config
+from config import get_fallback_docs_dir, get_log_level, get_telegram_token, reload_settings, get_settings
 
 def test_get_log_level_default():
     """Тест получения уровня логирования по умолчанию"""
     # Удаляем переменную если она есть
     if "LOG_LEVEL" in os.environ:
         del os.environ["LOG_LEVEL"]
+    reload_settings()
     
     level = get_log_level()
     assert level == "INFO"
@@ -14,11 +16,13 @@ def test_get_log_level_default():
 def test_get_log_level_custom():
     """Тест получения кастомного уровня логирования"""
     os.environ["LOG_LEVEL"] = "DEBUG"
+    reload_settings()
     level = get_log_level()
     assert level == "DEBUG"
     
     # Очищаем после теста
     del os.environ["LOG_LEVEL"]
+    reload_settings()
 
 def test_get_telegram_token_exists():
     """Тест получения токена из переменных окружения"""
@@ -47,4 +51,36 @@ def test_get_telegram_token_from_env():
         if original_token:
             os.environ["TELEGRAM_BOT_TOKEN"] = original_token
         elif "TELEGRAM_BOT_TOKEN" in os.environ:
-            del os.environ["TELEGRAM_BOT_TOKEN"] 
\ No newline at end of file
+            del os.environ["TELEGRAM_BOT_TOKEN"]
+        reload_settings()
+
+def test_settings_parsed_once():
+    """Тест: настройки разбираются один раз и неизменяемы"""
+    settings = get_settings()
+    assert get_settings() is settings
+    
+    with pytest.raises(AttributeError):
+        settings.llm_timeout = 10
+
+def test_invalid_numeric_setting(monkeypatch):
+    """Тест: неверный формат числового значения обнаруживается при загрузке настроек"""
+    monkeypatch.setenv("LLM_TIMEOUT", "thirty")
+    with pytest.raises(ValueError):
+        reload_settings()
+    
+    monkeypatch.undo()
+    reload_settings()
+
+def test_fallback_docs_dir_defaults_to_project_doc(monkeypatch):
+    """Тест: по умолчанию резервные ответы используют doc/ проекта, пустое значение отключает документацию"""
+    monkeypatch.delenv("FALLBACK_DOCS_DIR", raising=False)
+    reload_settings()
+    assert get_fallback_docs_dir() == os.path.join(os.path.dirname(os.path.abspath(config.__file__)), "doc")
+    assert os.path.isdir(get_fallback_docs_dir())
+
+    monkeypatch.setenv("FALLBACK_DOCS_DIR", "")
+    reload_settings()
+    assert get_fallback_docs_dir() == ""
+
+    monkeypatch.undo()
+    reload_settings()
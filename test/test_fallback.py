@@ -0,0 +1,116 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import Mock, patch
+from config import reload_settings
+from llm.catalog import get_catalog
+from llm.client import _circuit, get_llm_response, get_fallback_response, get_circuit_state, reset_circuit_breaker
+from llm.fallback import build_fallback_index, load_doc_snippets, search, FALLBACK_HEADER
+
+def test_fallback_answer_uses_best_matching_service():
+    """Тест: резервный ответ описывает наиболее подходящую услугу"""
+    answer = get_fallback_response("Нужен переводчик с жестового языка на русский")
+    services = get_catalog().services
+
+    assert answer.startswith(FALLBACK_HEADER)
+    assert services["машинный_перевод"]["name"] in answer
+    assert get_catalog().company_info["website"] in answer
+    # Разные словоформы сводятся к одной основе
+    assert services["обучающая_система"]["name"] in get_fallback_response("Хочу изучать язык, есть курсы?")
+
+def test_fallback_answer_without_match():
+    """Тест: без совпадений возвращается описание компании"""
+    answer = get_fallback_response("qwerty")
+
+    assert get_catalog().company_info["name"] in answer
+    assert "/services" in answer
+
+def test_fallback_index_includes_doc_snippets(tmp_path):
+    """Тест: фрагменты документации попадают в индекс и находятся поиском"""
+    (tmp_path / "faq.md").write_text(
+        "# FAQ\n\nДемонстрация продукта проводится онлайн по предварительной записи, "
+        "длительность демонстрации около сорока минут.\n", encoding="utf-8")
+    index = build_fallback_index(get_catalog().services, load_doc_snippets(str(tmp_path)))
+
+    score, document = search(index, "как записаться на демонстрацию")[0]
+    assert document.kind == "doc"
+    assert document.key == "faq.md"
+
+def test_fallback_answer_is_fast():
+    """Тест производительности: ответ собирается значительно быстрее 10 мс"""
+    get_fallback_response("прогрев")
+    iterations = 200
+    start = time.perf_counter()
+    for _ in range(iterations):
+        get_fallback_response("Хочу изучать жестовый язык онлайн, есть ли курсы для детей?")
+    per_call = (time.perf_counter() - start) / iterations
+
+    assert per_call < 0.002
+
+@pytest.fixture
+def circuit(monkeypatch):
+    """Размыкатель цепи с порогом в две ошибки"""
+    monkeypatch.setenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("LLM_CIRCUIT_RESET_TIMEOUT", "60")
+    reload_settings()
+    reset_circuit_breaker()
+    yield
+    monkeypatch.undo()
+    reload_settings()
+    reset_circuit_breaker()
+
+@pytest.mark.asyncio
+async def test_circuit_opens_and_returns_fallback(circuit):
+    """Тест: после серии ошибок LLM не вызывается, пользователь получает резервный ответ"""
+    from llm.client import APITimeoutError
+
+    messages = [{"role": "user", "content": "Нужен переводчик жестового языка"}]
+    with patch("llm.client.OpenAI"), \
+         patch("llm.client.asyncio.to_thread", side_effect=APITimeoutError(request=None)) as mock_to_thread:
+        for _ in range(2):
+            result = await get_llm_response(messages, max_retries=0)
+            assert result.startswith(FALLBACK_HEADER)
+        assert get_circuit_state() == "open"
+
+        calls = mock_to_thread.call_count
+        result = await get_llm_response(messages, max_retries=0)
+
+    assert mock_to_thread.call_count == calls
+    assert get_catalog().services["машинный_перевод"]["name"] in result
+
+@pytest.mark.asyncio
+async def test_rate_limit_returns_fallback(circuit):
+    """Тест: при превышении лимита запросов провайдера пользователь получает резервный ответ"""
+    from llm.client import RateLimitError
+
+    error = RateLimitError("rate limited", response=Mock(status_code=429, headers={}), body=None)
+    stats = {}
+    with patch("llm.client.OpenAI"), patch("llm.client.asyncio.to_thread", side_effect=error):
+        result = await get_llm_response([{"role": "user", "content": "Нужен переводчик"}], max_retries=0, stats=stats)
+
+    assert result.startswith(FALLBACK_HEADER)
+    assert (stats["error"], stats["fallback"]) == ("rate_limit", True)
+
+@pytest.mark.asyncio
+async def test_half_open_allows_single_probe(circuit):
+    """Тест: в полуоткрытом состоянии к LLM идет один пробный запрос, остальные получают резервный ответ"""
+    _circuit["failures"] = 2
+    _circuit["opened_at"] = time.monotonic() - 120
+    assert get_circuit_state() == "half_open"
+
+    async def slow_completion(create, **kwargs):
+        await asyncio.sleep(0.05)
+        response = Mock()
+        response.choices = [Mock()]
+        response.choices[0].message.content = "Ответ LLM"
+        return response
+
+    messages = [{"role": "user", "content": "Нужен переводчик"}]
+    with patch("llm.client.OpenAI"), patch("llm.client.asyncio.to_thread", side_effect=slow_completion) as mock_to_thread:
+        results = await asyncio.gather(*(get_llm_response(messages, max_retries=0) for _ in range(3)))
+
+    assert mock_to_thread.call_count == 1
+    assert results.count("Ответ LLM") == 1
+    assert sum(result.startswith(FALLBACK_HEADER) for result in results) == 2
+    assert get_circuit_state() == "closed"
+
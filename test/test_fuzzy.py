@@ -0,0 +1,64 @@
+from unittest.mock import patch
+from llm import fuzzy
+from llm.catalog import get_catalog
+from llm.fallback import build_fallback_answer
+from llm.fuzzy import build_fuzzy_index, lookup, normalize_text, weighted_distance
+from llm.services import find_relevant_services, score_services
+
+def test_homoglyphs_normalized_in_cyrillic_words():
+    """Тест: латинские двойники заменяются только в словах с кириллицей"""
+    assert normalize_text("Обучениe и UX") == "обучение и ux"
+    assert normalize_text("Ёлка") == "елка"
+
+def test_weighted_distance():
+    """Тест: замена похожих по звучанию букв дешевле обычной правки, перестановка — одна правка"""
+    assert weighted_distance("жест", "жэст") == 0.5
+    assert weighted_distance("жест", "тест") == 1.0
+    assert weighted_distance("поиск", "пиоск") == 1.0
+    assert weighted_distance("перевод", "перевод") == 0.0
+
+def test_lookup_bounded_edit_distance():
+    """Тест: поиск по индексу удалений находит слова в пределах допустимого числа правок"""
+    index = build_fuzzy_index([("переводчик", "переводчик"), ("курс", "курс"), ("ux", "ux")], 2)
+
+    match = lookup(index, "перводчик")
+    assert match.term == "переводчик"
+    assert match.confidence == 0.9
+    assert lookup(index, "переводчек").confidence == 0.95
+    # Короткие слова сопоставляются только точно
+    assert lookup(index, "ui") is None
+    assert lookup(index, "ux").confidence == 1.0
+    assert lookup(index, "привет") is None
+
+def test_lookup_does_not_scan_dictionary():
+    """Тест: проверяются только кандидаты из индекса, а не все слова словаря"""
+    index = build_fuzzy_index(((f"слово{i:04d}", str(i)) for i in range(2000)), 2)
+
+    with patch.object(fuzzy, "weighted_distance", wraps=weighted_distance) as distance:
+        assert lookup(index, "жэсты") is None
+        assert lookup(index, "слвао0042").term == "слово0042"
+    assert distance.call_count < 200
+
+def test_typos_find_relevant_services():
+    """Тест: услуги находятся по словам с опечатками и латинскими буквами"""
+    def keys(message):
+        return [service["key"] for service in find_relevant_services(message)]
+
+    assert "машинный_перевод" in keys("нужен перводчик")
+    assert keys("курсы обучениe") == ["обучающая_система"]
+    assert "поисковая_система" in keys("словарь жэстов")
+
+def test_low_confidence_matches_left_out_of_prompt():
+    """Тест: совпадения с низкой уверенностью видны в оценках, но не попадают в промпт"""
+    scores = score_services("тест")
+
+    assert 0 < scores["поисковая_система"] < 0.8
+    assert find_relevant_services("тест") == []
+
+def test_fallback_answer_with_typos():
+    """Тест: резервный ответ подбирается по словам с опечатками"""
+    catalog = get_catalog()
+
+    answer = build_fallback_answer("хочу онлайн обучениe жэстовому языку")
+
+    assert catalog.services["обучающая_система"]["name"] in answer
@@ -0,0 +1,101 @@
+import asyncio
+import socket
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from aiohttp import ClientSession
+from bot import health
+from bot.health import get_liveness, get_readiness, reset_health, run_probes, start_health_server, stop_health_server
+from bot.shutdown import resume_accepting_updates, stop_accepting_updates
+from config import reload_settings
+from llm.client import _circuit, reset_circuit_breaker
+
+@pytest.fixture(autouse=True)
+def health_env(monkeypatch):
+    monkeypatch.setenv("HEALTH_PROBE_TTL", "30")
+    monkeypatch.setenv("HEALTH_MAX_SEND_QUEUE", "5")
+    monkeypatch.setenv("HEALTH_MAX_IN_FLIGHT", "2")
+    reload_settings()
+    reset_health()
+    reset_circuit_breaker()
+    yield
+    reset_health()
+    reset_circuit_breaker()
+    resume_accepting_updates()
+    monkeypatch.undo()
+    reload_settings()
+
+def make_bot(fail=False):
+    bot = Mock()
+    if fail:
+        bot.get_me = AsyncMock(side_effect=OSError("network is unreachable"))
+    else:
+        bot.get_me = AsyncMock(return_value=Mock(username="test_bot"))
+    return bot
+
+@pytest.mark.asyncio
+async def test_ready_when_all_probes_pass():
+    """Тест: бот готов, когда все проверки пройдены"""
+    assert get_readiness()[0] is False  # проверки еще не выполнялись
+
+    await run_probes(make_bot())
+
+    ready, body = get_readiness()
+    assert ready is True
+    assert body["checks"]["telegram"]["detail"] == "@test_bot"
+    assert get_liveness()[0] is True
+
+@pytest.mark.asyncio
+async def test_not_ready_on_failures():
+    """Тест: ошибка Telegram, разомкнутая цепь LLM и насыщение очереди делают бота неготовым"""
+    _circuit["failures"] = 10
+    _circuit["opened_at"] = 10 ** 9
+    with patch("bot.health.get_send_queue_stats", return_value={"queued": 6}):
+        await run_probes(make_bot(fail=True))
+
+    ready, body = get_readiness()
+    assert ready is False
+    assert {name for name, check in body["checks"].items() if not check["ok"]} == {"telegram", "llm", "capacity"}
+    assert "network is unreachable" in body["checks"]["telegram"]["detail"]
+
+@pytest.mark.asyncio
+async def test_stale_probes_and_shutdown():
+    """Тест: устаревшие результаты и остановка бота снимают готовность, устаревание — и живость"""
+    await run_probes(make_bot())
+    now = health._last_cycle + 31
+
+    ready, body = get_readiness(now)
+    assert ready is False
+    assert body["checks"]["telegram"]["detail"].startswith("stale")
+    assert get_liveness(now)[0] is False
+
+    stop_accepting_updates()
+    assert get_readiness()[1]["checks"]["accepting"]["ok"] is False
+
+@pytest.mark.asyncio
+async def test_endpoints_serve_cached_results():
+    """Тест: эндпоинты отвечают по кэшу без обращения к Telegram"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    bot = make_bot()
+    assert await start_health_server(bot, port=port, host="127.0.0.1") == port
+    await asyncio.sleep(0.01)  # первый цикл фоновых проверок
+    try:
+        async with ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/healthz") as response:
+                assert response.status == 200
+            for _ in range(5):
+                async with session.get(f"http://127.0.0.1:{port}/readyz") as response:
+                    assert response.status == 200
+                    assert (await response.json())["status"] == "ready"
+    finally:
+        await stop_health_server()
+
+    # Проверки выполнены фоновой задачей один раз, запросы к эндпоинтам их не запускают
+    assert bot.get_me.await_count == 1
+
+@pytest.mark.asyncio
+async def test_health_server_disabled_without_port():
+    """Тест: без HEALTH_PORT/PORT сервер не запускается"""
+    assert await start_health_server(make_bot(), port=0) is None
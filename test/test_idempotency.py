@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from aiogram.types import Update
+from bot.idempotency import (
+    IdempotencyMiddleware,
+    find_duplicate,
+    get_idempotency_stats,
+    reset_idempotency,
+    _processed,
+)
+from config import reload_settings
+
+@pytest.fixture(autouse=True)
+def idempotency_env(monkeypatch):
+    """Небольшое окно и лимит ключей для тестов"""
+    monkeypatch.setenv("IDEMPOTENCY_WINDOW", "60")
+    monkeypatch.setenv("IDEMPOTENCY_MAX_KEYS", "6")
+    reload_settings()
+    reset_idempotency()
+    yield
+    reset_idempotency()
+    monkeypatch.undo()
+    reload_settings()
+
+def make_update(update_id, message_id=1, chat_id=100):
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": "Привет!",
+        },
+    })
+
+@pytest.mark.asyncio
+async def test_redelivered_update_skipped():
+    """Тест: повторно доставленное обновление не доходит до обработчика"""
+    middleware = IdempotencyMiddleware()
+    calls = []
+
+    async def handler(event, data):
+        calls.append(event.update_id)
+        return "answer"
+
+    assert await middleware(handler, make_update(1), {}) == "answer"
+    assert await middleware(handler, make_update(1), {}) is None
+    # То же сообщение с другим update_id (например, после перезапуска опроса)
+    assert await middleware(handler, make_update(2, message_id=1), {}) is None
+    assert await middleware(handler, make_update(3, message_id=2), {}) == "answer"
+
+    assert calls == [1, 3]
+    stats = get_idempotency_stats()
+    assert stats["processed"] == 2
+    assert stats["duplicates_skipped"] == 2
+
+@pytest.mark.asyncio
+async def test_duplicate_attaches_to_in_flight():
+    """Тест: повтор во время обработки дожидается результата первой обработки"""
+    middleware = IdempotencyMiddleware()
+    calls = []
+
+    async def slow_handler(event, data):
+        calls.append(event.update_id)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    first = asyncio.create_task(middleware(slow_handler, make_update(10), {}))
+    await asyncio.sleep(0)
+    duplicate = asyncio.create_task(middleware(slow_handler, make_update(10), {}))
+
+    assert await asyncio.gather(first, duplicate) == ["answer", "answer"]
+    assert calls == [10]
+    assert get_idempotency_stats()["duplicates_attached"] == 1
+    assert get_idempotency_stats()["in_progress"] == 0
+
+@pytest.mark.asyncio
+async def test_failed_update_processed_again():
+    """Тест: обновление, обработка которого упала, обрабатывается при повторной доставке"""
+    middleware = IdempotencyMiddleware()
+
+    async def failing_handler(event, data):
+        raise RuntimeError("boom")
+
+    async def handler(event, data):
+        return "answer"
+
+    with pytest.raises(RuntimeError):
+        await middleware(failing_handler, make_update(20), {})
+    assert await middleware(handler, make_update(20), {}) == "answer"
+
+def test_keys_bounded_by_window_and_limit():
+    """Тест: ключи вытесняются по времени и по количеству"""
+    for update_id in range(5):
+        _processed[update_id] = float(update_id)
+
+    assert find_duplicate([0], now=10.0) is True
+    # Ключи старше окна (60 с) вытесняются
+    assert find_duplicate([0], now=60.5) is None
+    assert find_duplicate([1], now=60.5) is True
+
+    for update_id in range(5, 20):
+        _processed[update_id] = 60.5
+    find_duplicate([], now=60.5)
+    assert len(_processed) == 6
+    assert get_idempotency_stats()["evicted"] == 14
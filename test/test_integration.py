@@ -220,6 +220,31 @@ class TestIntegration:
             error_message = mock_message.answer.call_args[0][0]
             assert "ошибка" in error_message.lower()
     
+    @pytest.mark.asyncio
+    async def test_too_long_message_not_sent_to_llm(self, mock_message):
+        """Тест: слишком длинное сообщение отклоняется до обращения к LLM"""
+        mock_message.text = "а" * 5000
+        
+        with patch('bot.handlers.get_llm_response') as mock_llm:
+            await handle_message(mock_message)
+            mock_llm.assert_not_called()
+        
+        assert "слишком длинное" in mock_message.answer.call_args[0][0]
+        assert get_dialog_history(mock_message.chat.id) == []
+    
+    @pytest.mark.asyncio
+    async def test_long_assistant_reply_does_not_break_dialog(self, mock_message):
+        """Тест: длинный ответ LLM в истории не блокирует следующие запросы"""
+        add_message_to_dialog(mock_message.chat.id, "user", "Расскажите подробно")
+        add_message_to_dialog(mock_message.chat.id, "assistant", "о" * 5000)
+        mock_message.text = "Спасибо, а сроки?"
+        
+        with patch('bot.handlers.get_llm_response', new_callable=AsyncMock, return_value="Две недели") as mock_llm:
+            await handle_message(mock_message)
+        
+        mock_llm.assert_called_once()
+        assert mock_message.answer.call_args[0][0] == "Две недели"
+    
     @pytest.mark.asyncio
     async def test_service_suggestion_integration(self, mock_message):
         """Тест интеграции предложения услуг"""
@@ -240,6 +265,22 @@ class TestIntegration:
                 # Просто проверим что поиск работает, не обязательно точное совпадение
                 assert len(service_keys) > 0
     
+    @pytest.mark.asyncio
+    async def test_service_context_sticks_across_turns(self, mock_message):
+        """Тест: услуга из первого вопроса остается в промпте на уточняющих ходах и затухает"""
+        service_name = get_all_services()["машинный_перевод"]["name"]
+        prompts = []
+        
+        with patch('bot.handlers.get_llm_response') as mock_llm:
+            mock_llm.return_value = "Ответ"
+            for text in ("Нужен переводчик с жестового языка", "Понятно", "А сколько стоит?", "Спасибо"):
+                mock_message.text = text
+                await handle_message(mock_message)
+                prompts.append(mock_llm.call_args[0][0][0]["content"])
+        
+        assert all(service_name in prompt for prompt in prompts[:3])
+        assert "Релевантные услуги" not in prompts[3]
+    
     def test_configuration_integration(self):
         """Тест интеграции конфигурации"""
         from config import get_telegram_token, get_openrouter_api_key, get_llm_model
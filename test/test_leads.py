@@ -0,0 +1,203 @@
+import asyncio
+import csv
+import sqlite3
+import time
+import pytest
+from unittest.mock import Mock, AsyncMock, patch
+from aiogram.types import Message, Chat, User
+from bot.handlers import handle_message
+from config import reload_settings
+from llm.leads import (
+    export_leads_csv,
+    extract_lead,
+    get_lead_stats,
+    merge_leads,
+    read_leads,
+    reset_leads,
+    stop_lead_capture,
+    submit_lead,
+    write_leads,
+)
+from llm.memory import clear_dialog_history
+
+@pytest.fixture
+def leads_db(tmp_path, monkeypatch):
+    """Включенный сбор заявок с быстрой записью"""
+    path = str(tmp_path / "leads.db")
+    monkeypatch.setenv("LEADS_DB_PATH", path)
+    monkeypatch.setenv("LEADS_FLUSH_INTERVAL", "0.05")
+    monkeypatch.setenv("LEADS_BATCH_SIZE", "100")
+    reload_settings()
+    reset_leads()
+    yield path
+    reset_leads()
+    monkeypatch.undo()
+    reload_settings()
+
+def test_extract_lead_finds_budget_and_contacts():
+    """Тест выделения бюджета и контактов; телефон не принимается за сумму"""
+    lead = extract_lead(1, "2", "Бюджет около 2 млн, звоните +7 (999) 123-45-67 или a.b@mail.ru",
+                        services=["машинный_перевод"], now=100.0)
+
+    assert lead.services == ("машинный_перевод",)
+    assert lead.budget == "Бюджет около 2 млн"
+    assert lead.phone == "+7 (999) 123-45-67"
+    assert lead.email == "a.b@mail.ru"
+
+    assert extract_lead(1, "2", "Готовы заплатить 500 тыс. руб").budget == "500 тыс. руб"
+    assert extract_lead(1, "2", "Позвоните: 8 999 123 45 67").budget is None
+    assert extract_lead(1, "2", "Здравствуйте, у нас 3 оператора") is None
+
+def test_large_budget_with_spaces_is_not_a_phone():
+    """Тест: крупная сумма, записанная группами цифр, — бюджет, а не телефон"""
+    lead = extract_lead(1, "u", "бюджет 500 000 000 руб")
+    assert (lead.budget, lead.phone) == ("бюджет 500 000 000 руб", None)
+
+    lead = extract_lead(1, "u", "Готовы выделить 1 500 000 ₽, звоните 8 (916) 123-45-67")
+    assert (lead.budget, lead.phone) == ("1 500 000 ₽", "8 (916) 123-45-67")
+
+def test_budget_prefers_amount_with_currency_or_scale():
+    """Тест: число после слова "бюджет" (год, срок) не принимается за сумму, если есть сумма с валютой"""
+    assert extract_lead(1, "u", "бюджет на 2025 год около 500 тыс руб").budget == "500 тыс руб"
+    assert extract_lead(1, "u", "Бюджет на 3 месяца", services=["a"]).budget is None
+    # Число без валюты и масштаба принимается, только если других сумм нет
+    assert extract_lead(1, "u", "Бюджет 300000, срок — месяц").budget == "Бюджет 300000"
+
+    old = extract_lead(1, "u", "Бюджет 300000 ₽", services=["a"], now=100.0)
+    new = extract_lead(1, "u", "Бюджет на 3 месяца", services=["a"], now=200.0)
+    assert merge_leads(old, new).budget == "Бюджет 300000 ₽"
+
+def test_merge_keeps_earlier_data():
+    """Тест: услуги накапливаются, отсутствующие в новой записи данные сохраняются"""
+    old = extract_lead(1, "2", "Бюджет 300000 ₽", services=["a"], now=100.0)
+    new = extract_lead(1, "2", "Мой телефон +7 999 123-45-67", services=["b"], now=200.0)
+
+    merged = merge_leads(old, new)
+
+    assert merged.services == ("a", "b")
+    assert merged.budget == "Бюджет 300000 ₽"
+    assert merged.phone == "+7 999 123-45-67"
+    assert (merged.messages, merged.first_seen, merged.last_seen) == (2, 100.0, 200.0)
+
+def test_write_leads_upserts_per_chat(tmp_path):
+    """Тест: повторная запись чата дополняет его строку, а не добавляет новую"""
+    path = str(tmp_path / "leads.db")
+    assert write_leads(path, [extract_lead(1, "2", "$5000", services=["a"], now=100.0),
+                              extract_lead(3, "4", "a@b.ru", now=150.0)]) == 2
+    assert write_leads(path, [extract_lead(1, "2", "x@y.ru", services=["b"], now=200.0)]) == 1
+
+    leads = {lead.chat_id: lead for lead in read_leads(path)}
+    assert len(leads) == 2
+    assert leads[1].services == ("a", "b")
+    assert (leads[1].budget, leads[1].email, leads[1].messages) == ("$5000", "x@y.ru", 2)
+
+    csv_path = tmp_path / "leads.csv"
+    assert export_leads_csv(path, str(csv_path)) == 2
+    with open(csv_path, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert rows[0]["chat_id"] == "1"
+    assert rows[0]["services"] == "a,b"
+    assert rows[0]["last_seen"] == "1970-01-01T00:03:20+00:00"
+
+@pytest.mark.asyncio
+async def test_pipeline_batches_and_deduplicates(leads_db):
+    """Тест: сообщения чата объединяются в одну заявку, запись выполняется в фоне"""
+    assert submit_lead(10, 11, "Интересует перевод", ["машинный_перевод"])
+    assert submit_lead(10, 11, "Бюджет 100 тыс. руб")
+    assert submit_lead(20, 21, "Просто привет")
+    assert submit_lead(10, 11, "Почта lead@example.com")
+    assert read_leads(leads_db) == []
+
+    await asyncio.sleep(0.2)
+    leads = read_leads(leads_db)
+    assert len(leads) == 1
+    assert leads[0].services == ("машинный_перевод",)
+    assert (leads[0].budget, leads[0].email, leads[0].messages) == ("Бюджет 100 тыс. руб", "lead@example.com", 3)
+
+    assert submit_lead(30, 31, "Телефон +7 999 000-11-22")
+    await stop_lead_capture()
+    assert [lead.chat_id for lead in read_leads(leads_db)] == [30, 10]
+    stats = get_lead_stats()
+    assert (stats["submitted"], stats["extracted"], stats["skipped"], stats["written"]) == (5, 4, 1, 2)
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_messages(leads_db, monkeypatch):
+    """Тест: при переполненной очереди сообщение отбрасывается, обработчик не ждет"""
+    monkeypatch.setenv("LEADS_QUEUE_SIZE", "2")
+    reload_settings()
+
+    results = [submit_lead(1, 2, f"$ {i}000") for i in range(5)]
+
+    assert results == [True, True, False, False, False]
+    assert get_lead_stats()["dropped"] == 3
+    await stop_lead_capture()
+    assert read_leads(leads_db)[0].messages == 2
+
+@pytest.mark.asyncio
+async def test_failed_write_keeps_leads(leads_db):
+    """Тест: заявки, которые не удалось записать, записываются при следующей попытке"""
+    real_write = write_leads
+    calls = []
+
+    def flaky_write(path, records):
+        calls.append(len(records))
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return real_write(path, records)
+
+    with patch("llm.leads.write_leads", side_effect=flaky_write):
+        submit_lead(1, 2, "Бюджет 50 тыс")
+        await asyncio.sleep(0.1)
+        submit_lead(1, 2, "a@b.ru")
+        await stop_lead_capture()
+
+    assert get_lead_stats()["failed"] == 1
+    lead = read_leads(leads_db)[0]
+    assert (lead.budget, lead.email, lead.messages) == ("Бюджет 50 тыс", "a@b.ru", 2)
+
+@pytest.mark.asyncio
+async def test_submit_does_not_wait_for_slow_writes(leads_db, monkeypatch):
+    """Тест: постановка в очередь занимает микросекунды, даже когда запись в базу медленная"""
+    monkeypatch.setenv("LEADS_BATCH_SIZE", "1000")
+    reload_settings()
+
+    def slow_write(path, records):
+        time.sleep(0.2)
+        return len(records)
+
+    with patch("llm.leads.write_leads", side_effect=slow_write):
+        submit_lead(0, 0, "$1000")
+        await asyncio.sleep(0.1)
+
+        start = time.perf_counter()
+        for i in range(500):
+            submit_lead(i, i, "Бюджет 100 тыс, телефон +7 999 123-45-67", ["машинный_перевод"])
+        assert (time.perf_counter() - start) / 500 < 50e-6
+        await stop_lead_capture()
+
+    assert get_lead_stats()["written"] == 501
+
+def make_message(text):
+    message = Mock(spec=Message)
+    message.chat = Mock(spec=Chat)
+    message.chat.id = 555
+    message.from_user = Mock(spec=User)
+    message.from_user.id = 556
+    message.from_user.full_name = "Test"
+    message.text = text
+    message.answer = AsyncMock()
+    return message
+
+@pytest.mark.asyncio
+async def test_handler_submits_lead_after_reply(leads_db):
+    """Тест: обработчик ставит заявку в очередь после ответа, с найденными услугами"""
+    clear_dialog_history(555)
+
+    with patch("bot.handlers.get_llm_response", new_callable=AsyncMock, return_value="Ответ"):
+        await handle_message(make_message("Нужен перевод жестового языка, бюджет 200 тыс. руб"))
+    await stop_lead_capture()
+
+    lead = read_leads(leads_db)[0]
+    assert (lead.chat_id, lead.user_id, lead.budget) == (555, "556", "бюджет 200 тыс. руб")
+    assert lead.services
+    clear_dialog_history(555)
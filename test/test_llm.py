@@ -1,7 +1,9 @@
+import timeit
 import pytest
 from unittest.mock import patch, AsyncMock, Mock
-from llm.client import get_llm_response
-from llm.prompts import get_system_prompt
+from llm.client import fit_messages_to_budget, get_llm_in_flight, get_llm_response, validate_messages, warm_up_llm
+from config import reload_settings
+from llm.prompts import get_base_system_prompt, get_system_prompt
 
 @pytest.mark.asyncio
 async def test_llm_response_success():
@@ -47,9 +49,135 @@ async def test_llm_response_general_error():
         
         assert "неожиданная ошибка" in result.lower()
 
+@pytest.mark.asyncio
+async def test_llm_response_reports_usage():
+    """Тест: сведения о запросе и расходе токенов передаются в stats"""
+    with patch('llm.client.OpenAI'), \
+         patch('llm.client.asyncio.to_thread') as mock_to_thread:
+        mock_response = Mock()
+        mock_response.choices = [Mock()]
+        mock_response.choices[0].message.content = "Test response"
+        mock_response.usage.prompt_tokens = 120
+        mock_response.usage.completion_tokens = 15
+        mock_to_thread.return_value = mock_response
+        
+        stats = {}
+        await get_llm_response([{"role": "user", "content": "Test message"}], stats=stats)
+        
+        assert stats["success"] is True
+        assert stats["attempts"] == 1
+        assert stats["prompt_tokens"] == 120
+        assert stats["completion_tokens"] == 15
+        assert stats["model"]
+
 def test_system_prompt():
     """Тест системного промпта"""
     prompt = get_system_prompt()
     assert "консультант" in prompt.lower()
     assert "Sign Language Interface" in prompt
-    assert "жестовых технологий" in prompt 
\ No newline at end of file
+    assert "жестовых технологий" in prompt
+
+@pytest.mark.asyncio
+async def test_warm_up_is_not_tracked_and_uses_short_timeout():
+    """Тест: прогрев не учитывается в выполняющихся запросах, использует свой таймаут и сообщает расход"""
+    seen = {}
+
+    async def fake_to_thread(create, **kwargs):
+        seen.update(in_flight=get_llm_in_flight(), timeout=kwargs["timeout"])
+        response = Mock()
+        response.usage = Mock(prompt_tokens=120, completion_tokens=1)
+        return response
+
+    stats = {}
+    with patch('llm.client.OpenAI'), patch('llm.client.asyncio.to_thread', side_effect=fake_to_thread):
+        assert await warm_up_llm([{"role": "system", "content": "s"}], stats=stats) is True
+
+    assert seen == {"in_flight": 0, "timeout": 5.0}
+    assert (stats["prompt_tokens"], stats["completion_tokens"]) == (120, 1)
+
+@pytest.mark.asyncio
+async def test_warm_up_and_request_share_cached_prefix(monkeypatch):
+    """Тест: для моделей с явным кэшированием базовый промпт размечается cache_control одинаково в прогреве и запросе"""
+    monkeypatch.setenv("LLM_MODEL", "anthropic/claude-3-haiku")
+    reload_settings()
+    sent = []
+
+    async def fake_to_thread(create, **kwargs):
+        sent.append(kwargs["messages"])
+        response = Mock()
+        response.choices = [Mock(message=Mock(content="Ответ"))]
+        return response
+
+    base_prompt = get_base_system_prompt()
+    with patch('llm.client.OpenAI'), patch('llm.client.asyncio.to_thread', side_effect=fake_to_thread):
+        await warm_up_llm([{"role": "system", "content": base_prompt}])
+        await get_llm_response([{"role": "system", "content": base_prompt + "\n\nУслуги"},
+                                {"role": "user", "content": "Привет"}])
+    monkeypatch.undo()
+    reload_settings()
+
+    cached_block = {"type": "text", "text": base_prompt, "cache_control": {"type": "ephemeral"}}
+    assert sent[0][0]["content"] == [cached_block]
+    assert sent[1][0]["content"] == [cached_block, {"type": "text", "text": "\n\nУслуги"}]
+
+def test_validate_messages_valid():
+    """Тест валидации корректного запроса"""
+    messages = [
+        {"role": "system", "content": "Системный промпт"},
+        {"role": "user", "content": "Привет"},
+        {"role": "assistant", "content": "Здравствуйте!"},
+    ]
+    assert validate_messages(messages) is True
+
+def test_validate_messages_invalid():
+    """Тест отклонения некорректных запросов"""
+    assert validate_messages([]) is False
+    assert validate_messages(["text"]) is False
+    assert validate_messages([{"role": "user"}]) is False
+    assert validate_messages([{"role": "tool", "content": "x"}]) is False
+    assert validate_messages([{"role": "user", "content": "   \n\t"}]) is False
+    assert validate_messages([{"role": "user", "content": None}]) is False
+
+def test_validate_messages_size_limits():
+    """Тест ограничений размера сообщения и запроса"""
+    messages = [
+        {"role": "system", "content": "s" * 50},
+        {"role": "user", "content": "u" * 20},
+    ]
+    assert validate_messages(messages, max_message_chars=20, max_total_chars=100) is True
+    assert validate_messages(messages, max_message_chars=19, max_total_chars=100) is False
+    assert validate_messages(messages, max_message_chars=20, max_total_chars=69) is False
+
+def test_validate_messages_limits_only_incoming_user_message():
+    """Тест: ограничение длины применяется к последнему сообщению пользователя, а не к истории"""
+    messages = [
+        {"role": "system", "content": "s"},
+        {"role": "assistant", "content": "a" * 30},
+        {"role": "user", "content": "u" * 10},
+    ]
+    assert validate_messages(messages, max_message_chars=20, max_total_chars=100) is True
+
+def test_fit_messages_to_budget_drops_oldest_history():
+    """Тест: старые сообщения истории убираются, системный промпт и запрос пользователя остаются"""
+    messages = [
+        {"role": "system", "content": "s" * 10},
+        {"role": "user", "content": "1" * 10},
+        {"role": "assistant", "content": "2" * 50},
+        {"role": "user", "content": "3" * 10},
+        {"role": "assistant", "content": "4" * 10},
+        {"role": "user", "content": "5" * 10},
+    ]
+    assert fit_messages_to_budget(messages, max_total_chars=100) is messages
+    
+    trimmed = fit_messages_to_budget(messages, max_total_chars=40)
+    assert [message["content"][0] for message in trimmed] == ["s", "3", "4", "5"]
+    assert validate_messages(trimmed, max_message_chars=20, max_total_chars=40) is True
+
+def test_validate_messages_benchmark():
+    """Микробенчмарк: валидация типичного запроса (system + 10 сообщений истории)"""
+    messages = [{"role": "system", "content": get_system_prompt("перевод")}]
+    messages += [{"role": "user" if i % 2 == 0 else "assistant", "content": "Сообщение " * 50} for i in range(10)]
+    
+    runs = 2000
+    per_call = timeit.timeit(lambda: validate_messages(messages), number=runs) / runs
+    assert per_call < 1e-3
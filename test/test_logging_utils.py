@@ -0,0 +1,177 @@
+import json
+import logging
+import time
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from bot.handlers import handle_message
+from config import reload_settings
+from llm.analyze_events import analyze_events, read_events, main as analyze_main
+from llm.logging_utils import (
+    EventSink,
+    emit_event,
+    metrics_logger,
+    start_event_sink,
+    stop_event_sink,
+    log_content,
+    redact_pii,
+)
+
+def test_event_sink_writes_ndjson(tmp_path):
+    """Тест: события метрик записываются в журнал по одному на строку"""
+    path = tmp_path / "events.ndjson"
+    start_event_sink(str(path))
+    try:
+        metrics_logger.log_command_usage("start", "42", 1)
+        metrics_logger.log_llm_request("42", 1, 3, "test-model", 0.0, 1.5, True,
+                                       response_length=10, prompt_tokens=100, completion_tokens=20)
+    finally:
+        stop_event_sink()
+
+    events = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [event["event_type"] for event in events] == ["command_usage", "llm_request"]
+    assert events[1]["prompt_tokens"] == 100
+
+def test_event_sink_rotates_by_size(tmp_path):
+    """Тест ротации журнала по размеру"""
+    path = tmp_path / "events.ndjson"
+    sink = EventSink(str(path), max_bytes=200, backups=2)
+    sink.start()
+    for i in range(5):
+        sink.put({"event_type": "test", "payload": "x" * 100, "n": i})
+        # Ждем записи, чтобы каждое событие попало в отдельную пачку
+        while sink.written <= i:
+            time.sleep(0.001)
+    sink.close()
+
+    assert path.exists()
+    assert (tmp_path / "events.ndjson.1").exists()
+    assert (tmp_path / "events.ndjson.2").exists()
+    assert not (tmp_path / "events.ndjson.3").exists()
+    assert all(path.stat().st_size <= 200 for path in tmp_path.iterdir())
+
+def test_event_sink_survives_bad_record(tmp_path):
+    """Тест: ошибка сериализации события не останавливает поток записи"""
+    class Broken:
+        def __str__(self):
+            raise ValueError("boom")
+
+    path = tmp_path / "events.ndjson"
+    sink = EventSink(str(path), max_bytes=10_000, backups=1)
+    sink.start()
+    sink.put({"event_type": "bad", "value": Broken()})
+    sink.put({"event_type": "good"})
+    sink.close()
+
+    events = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [event["event_type"] for event in events] == ["good"]
+
+def test_emit_event_without_sink_logs_info(caplog):
+    """Тест: без журнала событий метрики пишутся в лог на уровне INFO"""
+    stop_event_sink()
+    with caplog.at_level(logging.INFO, logger="llm.logging_utils"):
+        emit_event({"event_type": "test"}, "TEST_METRICS")
+
+    assert [record.levelno for record in caplog.records] == [logging.INFO]
+    assert "TEST_METRICS" in caplog.text
+
+def test_analyze_events(tmp_path, capsys):
+    """Тест анализа журнала: перцентили, доля ошибок, токены по моделям и чатам"""
+    path = tmp_path / "events.ndjson"
+    lines = [
+        {"event_type": "llm_request", "chat_id": 1, "model": "a", "elapsed_time": 1.0, "success": True,
+         "prompt_tokens": 100, "completion_tokens": 10},
+        {"event_type": "llm_request", "chat_id": 2, "model": "a", "elapsed_time": 2.0, "success": True,
+         "prompt_tokens": 300, "completion_tokens": 30},
+        {"event_type": "llm_request", "chat_id": 2, "model": "b", "elapsed_time": 10.0, "success": False,
+         "error": "timeout"},
+        {"event_type": "command_usage", "command": "start"},
+    ]
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\nповрежденная строка\n", encoding="utf-8")
+
+    report = analyze_events(read_events([str(path)]))
+
+    assert report["llm_requests"] == 3
+    assert report["llm_error_rate"] == round(1 / 3, 4)
+    assert report["llm_errors"] == {"timeout": 1}
+    assert abs(report["latency"]["p50"] - 2.0) <= 2.0 * 0.05
+    assert report["latency"]["max"] == 10.0
+    assert report["tokens_by_model"]["a"] == {"requests": 2, "prompt_tokens": 400, "completion_tokens": 40}
+    assert report["top_chats_by_tokens"][0]["chat_id"] == 2
+    assert report["events"]["command_usage"] == 1
+
+    assert analyze_main([str(path)]) == 0
+    assert "LLM requests: 3" in capsys.readouterr().out
+
+def test_redact_pii():
+    """Тест маскирования телефонов и почты"""
+    text = "Звоните +7 (916) 123-45-67 или пишите ivan.petrov@example.com, заказ №12345"
+    assert redact_pii(text) == "Звоните [phone] или пишите [email], заказ №12345"
+
+def test_redact_pii_keeps_amounts_and_ids():
+    """Тест: суммы и идентификаторы из групп цифр не принимаются за телефон"""
+    text = "Бюджет 500 000 000 руб, договор 1234567890, сумма 80 000 000 000"
+    assert redact_pii(text) == text
+    assert redact_pii("Позвоните: 8 999 123 45 67") == "Позвоните: [phone]"
+
+def test_log_content_truncates_at_info(caplog):
+    """Тест: на уровне INFO содержимое обрезается до лимита поля"""
+    log = logging.getLogger("test.content")
+    with caplog.at_level(logging.INFO, logger="test.content"):
+        log_content(log, "user_message", "📝 Content", "а" * 1000)
+
+    assert caplog.records[0].getMessage() == "📝 Content: " + "а" * 200 + "… (+800 chars)"
+
+def test_log_content_full_at_debug(caplog):
+    """Тест: полный текст пишется только на уровне DEBUG"""
+    log = logging.getLogger("test.content")
+    with caplog.at_level(logging.DEBUG, logger="test.content"):
+        log_content(log, "llm_response", "🎯 LLM Content", "б" * 1000)
+
+    assert caplog.records[0].levelno == logging.DEBUG
+    assert caplog.records[0].getMessage().endswith("б" * 1000)
+
+def test_log_content_policy_override(monkeypatch, caplog):
+    """Тест: политика поля переопределяется через LOG_CONTENT_POLICY"""
+    monkeypatch.setenv("LOG_CONTENT_POLICY", "user_message=0:1.0, llm_response=10:1")
+    reload_settings()
+    log = logging.getLogger("test.content")
+    try:
+        with caplog.at_level(logging.INFO, logger="test.content"):
+            log_content(log, "user_message", "📝 Content", "текст")
+            log_content(log, "llm_response", "🎯 LLM Content", "в" * 50)
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+
+    assert [record.getMessage() for record in caplog.records] == ["🎯 LLM Content: " + "в" * 10 + "… (+40 chars)"]
+
+@pytest.mark.asyncio
+async def test_log_bytes_per_request(caplog, tmp_path):
+    """Тест: объем логов на запрос меньше длины переписки, персональные данные не попадают в лог"""
+    # Метрики уходят в журнал событий, в логе остается только содержимое переписки
+    start_event_sink(str(tmp_path / "events.ndjson"))
+    message = Mock()
+    message.chat.id = 9001
+    message.from_user.id = 1
+    message.from_user.full_name = "Test User"
+    message.text = ("Меня зовут Иван, телефон +7 916 123-45-67, почта ivan@example.com. "
+                    + "Нужен перевод жестового языка для колл-центра. " * 8)
+    message.answer = AsyncMock()
+    reply = "Наша система машинного перевода подходит для вашей задачи. " * 40
+    response = Mock()
+    response.choices = [Mock()]
+    response.choices[0].message.content = reply
+
+    with patch("llm.client.OpenAI"), \
+         patch("llm.client.asyncio.to_thread", AsyncMock(return_value=response)), \
+         caplog.at_level(logging.INFO):
+        try:
+            await handle_message(message)
+        finally:
+            stop_event_sink()
+
+    logged = "\n".join(record.getMessage() for record in caplog.records)
+    # Раньше сообщение пользователя и ответ попадали в лог целиком по два раза
+    assert len(logged.encode("utf-8")) < (len(message.text) + len(reply)) // 2
+    assert "916 123-45-67" not in logged
+    assert "ivan@example.com" not in logged
@@ -1,10 +1,18 @@
 import pytest
+from config import reload_settings
 from llm.memory import (
     add_message_to_dialog, 
     get_dialog_history, 
     clear_dialog_history,
     get_dialog_stats,
-    _dialogs
+    save_dialogs_snapshot,
+    load_dialogs_snapshot,
+    get_history_length_histogram,
+    reset_dialogs,
+    update_service_relevance,
+    get_top_services,
+    _dialogs,
+    _blobs
 )
 
 def test_add_message_to_dialog():
@@ -102,7 +110,7 @@ def test_clear_dialog_history():
 def test_get_dialog_stats():
     """Тест получения статистики диалогов"""
     # Очищаем все диалоги
-    _dialogs.clear()
+    reset_dialogs()
     
     # Добавляем сообщения в разные чаты
     add_message_to_dialog(1, "user", "Привет!")
@@ -114,4 +122,149 @@ def test_get_dialog_stats():
     
     # Проверяем статистику
     assert stats["total_dialogs"] == 2
-    assert stats["total_messages"] == 3 
\ No newline at end of file
+    assert stats["total_messages"] == 3
+
+def test_dialog_counters_are_incremental():
+    """Тест инкрементальных счетчиков: сообщения, байты, роли, гистограмма"""
+    reset_dialogs()
+    add_message_to_dialog(1, "user", "Привет!")
+    add_message_to_dialog(1, "assistant", "Здравствуйте!")
+    add_message_to_dialog(2, "user", "Да")
+    
+    stats = get_dialog_stats()
+    assert stats["total_messages"] == 3
+    assert stats["total_bytes"] == len("Привет!Здравствуйте!Да".encode("utf-8"))
+    assert stats["messages_by_role"] == {"user": 2, "assistant": 1}
+    assert stats["active_chats"] == 2
+    assert get_history_length_histogram()["<=1"] == 1
+    assert get_history_length_histogram()["<=5"] == 1
+    
+    clear_dialog_history(1)
+    stats = get_dialog_stats()
+    assert stats["total_dialogs"] == 1
+    assert stats["total_messages"] == 1
+    assert stats["total_bytes"] == len("Да".encode("utf-8"))
+    assert stats["messages_by_role"] == {"user": 1}
+    assert stats["active_chats"] == 1
+    assert sum(get_history_length_histogram().values()) == 1
+
+def test_history_cap_evicts_old_messages(monkeypatch):
+    """Тест: сообщения сверх DIALOG_MAX_MESSAGES вытесняются и учитываются"""
+    monkeypatch.setenv("DIALOG_MAX_MESSAGES", "4")
+    reload_settings()
+    try:
+        reset_dialogs()
+        for i in range(6):
+            add_message_to_dialog(1, "user", f"Сообщение {i}")
+        
+        assert [msg["content"] for msg in get_dialog_history(1)] == [f"Сообщение {i}" for i in range(2, 6)]
+        stats = get_dialog_stats()
+        assert stats["total_messages"] == 4
+        assert stats["evicted_messages"] == 2
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+
+def test_active_chats_window(monkeypatch):
+    """Тест: чаты без сообщений дольше окна активности не считаются активными"""
+    monkeypatch.setenv("DIALOG_ACTIVE_WINDOW", "0")
+    reload_settings()
+    try:
+        reset_dialogs()
+        add_message_to_dialog(1, "user", "Привет!")
+        
+        stats = get_dialog_stats()
+        assert stats["active_chats"] == 0
+        assert stats["total_dialogs"] == 1
+    finally:
+        monkeypatch.undo()
+        reload_settings()
+
+def test_identical_assistant_messages_stored_once():
+    """Тест: одинаковые длинные ответы в разных чатах хранятся в одном экземпляре"""
+    welcome = "Добро пожаловать! " * 20
+    for chat_id in (501, 502, 503):
+        clear_dialog_history(chat_id)
+        # Каждый чат получает свою копию строки, как при рендеринге ответа
+        add_message_to_dialog(chat_id, "assistant", "".join(list(welcome)))
+    
+    contents = [_dialogs[chat_id][0]["content"] for chat_id in (501, 502, 503)]
+    assert contents[0] is contents[1] is contents[2]
+    assert get_dialog_history(502) == [{"role": "assistant", "content": welcome}]
+    assert _blobs[welcome][1] == 3
+    assert get_dialog_stats()["dedup_ratio"] > 1
+    
+    for chat_id in (501, 502, 503):
+        clear_dialog_history(chat_id)
+    assert welcome not in _blobs
+
+def test_dialogs_snapshot_roundtrip(tmp_path):
+    """Тест сохранения и восстановления снимка диалогов"""
+    reset_dialogs()
+    add_message_to_dialog(1, "user", "Привет!")
+    add_message_to_dialog(1, "assistant", "Здравствуйте!")
+    add_message_to_dialog(2, "user", "Нужен переводчик")
+    
+    path = str(tmp_path / "dialogs.snapshot")
+    assert save_dialogs_snapshot(path) == 2
+    
+    reset_dialogs()
+    assert load_dialogs_snapshot(path) == 2
+    
+    assert get_dialog_history(1) == [
+        {"role": "user", "content": "Привет!"},
+        {"role": "assistant", "content": "Здравствуйте!"},
+    ]
+    assert get_dialog_history(2)[0]["content"] == "Нужен переводчик"
+    assert get_dialog_stats()["total_messages"] == 3
+
+def test_dialogs_snapshot_invalid_file_ignored(tmp_path):
+    """Тест: поврежденный или отсутствующий снимок не ломает запуск"""
+    reset_dialogs()
+    path = tmp_path / "dialogs.snapshot"
+    
+    assert load_dialogs_snapshot(str(path)) == 0
+    
+    path.write_bytes(b"garbage")
+    assert load_dialogs_snapshot(str(path)) == 0
+    assert _dialogs == {}
+
+def test_service_relevance_decays_across_turns():
+    """Тест: упомянутая услуга остается в топе несколько ходов и затухает без упоминаний"""
+    chat_id = 12400
+    clear_dialog_history(chat_id)
+
+    update_service_relevance(chat_id, {"машинный_перевод": 1.0}, now=0.0)
+    update_service_relevance(chat_id, {}, now=1.0)
+    assert get_top_services(chat_id) == [("машинный_перевод", 0.6)]
+
+    update_service_relevance(chat_id, {"обучающая_система": 0.9}, now=2.0)
+    assert get_top_services(chat_id) == [("обучающая_система", 0.9), ("машинный_перевод", 0.36)]
+
+    # Ниже SERVICE_RELEVANCE_MIN_SCORE услуга убирается
+    update_service_relevance(chat_id, {}, now=3.0)
+    assert get_top_services(chat_id) == [("обучающая_система", 0.54)]
+
+    # Повторное упоминание складывается с затухшей оценкой
+    update_service_relevance(chat_id, {"обучающая_система": 1.0}, now=4.0)
+    assert get_top_services(chat_id, limit=1) == [("обучающая_система", 1.324)]
+
+    clear_dialog_history(chat_id)
+    assert get_top_services(chat_id) == []
+
+def test_service_relevance_expires_for_idle_chats(monkeypatch):
+    """Тест: релевантность неактивных чатов удаляется по SERVICE_RELEVANCE_TTL"""
+    monkeypatch.setenv("SERVICE_RELEVANCE_TTL", "60")
+    reload_settings()
+    try:
+        reset_dialogs()
+        update_service_relevance(1, {"машинный_перевод": 1.0}, now=0.0)
+        update_service_relevance(2, {"машинный_перевод": 1.0}, now=30.0)
+        update_service_relevance(2, {}, now=61.0)
+
+        assert get_top_services(1) == []
+        assert get_top_services(2) == [("машинный_перевод", 0.6)]
+    finally:
+        reset_dialogs()
+        monkeypatch.undo()
+        reload_settings()
@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+from bot.handlers import handle_message
+from bot.prefetch import schedule_llm_warmup, cancel_llm_warmup, get_warmup_stats, _warmups
+from bot.responses import get_history_entry
+from config import reload_settings
+from llm.budget import get_budget_usage, record_usage, reset_budgets
+from llm.prompts import get_base_system_prompt
+
+@pytest.fixture
+def warmup_enabled(monkeypatch):
+    """Включить прогрев LLM"""
+    monkeypatch.setenv("LLM_WARMUP_ENABLED", "true")
+    reload_settings()
+    yield
+    monkeypatch.undo()
+    reload_settings()
+
+def test_warmup_disabled_by_default():
+    """Тест: по умолчанию прогрев не запускается"""
+    assert schedule_llm_warmup(1) is False
+    assert 1 not in _warmups
+
+@pytest.mark.asyncio
+async def test_warmup_uses_start_prefix(warmup_enabled):
+    """Тест: прогрев отправляет префикс запроса после /start"""
+    calls = []
+
+    async def fake_warm_up(messages, stats=None):
+        calls.append(messages)
+        return True
+
+    with patch("bot.prefetch.warm_up_llm", fake_warm_up):
+        assert schedule_llm_warmup(1) is True
+        await _warmups[1]
+
+    assert calls == [[
+        {"role": "system", "content": get_base_system_prompt()},
+        {"role": "assistant", "content": get_history_entry("start")},
+    ]]
+    assert 1 not in _warmups
+
+@pytest.mark.asyncio
+async def test_warmup_cancelled_by_user_message(warmup_enabled):
+    """Тест: незавершенный прогрев отменяется, когда приходит сообщение пользователя"""
+    async def slow_warm_up(messages, stats=None):
+        await asyncio.sleep(10)
+        return True
+
+    message = Mock()
+    message.chat.id = 2
+    message.text = ""
+    cancelled_before = get_warmup_stats()["cancelled"]
+    with patch("bot.prefetch.warm_up_llm", slow_warm_up), \
+         patch("bot.handlers.send_text", AsyncMock()):
+        schedule_llm_warmup(2)
+        task = _warmups[2]
+        await asyncio.sleep(0)
+        await handle_message(message)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert get_warmup_stats()["cancelled"] == cancelled_before + 1
+    assert get_warmup_stats()["active"] == 0
+
+@pytest.mark.asyncio
+async def test_repeated_start_replaces_warmup(warmup_enabled):
+    """Тест: повторный /start отменяет предыдущий прогрев чата"""
+    async def slow_warm_up(messages, stats=None):
+        await asyncio.sleep(10)
+        return True
+
+    with patch("bot.prefetch.warm_up_llm", slow_warm_up):
+        schedule_llm_warmup(3)
+        first = _warmups[3]
+        schedule_llm_warmup(3)
+        second = _warmups[3]
+        await asyncio.sleep(0)
+
+        assert first.cancelled()
+        assert second is not first
+        cancel_llm_warmup(3)
+
+@pytest.mark.asyncio
+async def test_warmup_usage_counts_toward_budget(warmup_enabled, monkeypatch):
+    """Тест: расход прогрева учитывается в бюджете; пользователю сверх бюджета прогрев не выполняется"""
+    monkeypatch.setenv("BUDGET_USER_DAILY_TOKENS", "1000")
+    reload_settings()
+    reset_budgets()
+
+    async def fake_warm_up(messages, stats=None):
+        stats.update(model="main/model", prompt_tokens=300, completion_tokens=1)
+        return True
+
+    with patch("bot.prefetch.warm_up_llm", fake_warm_up):
+        assert schedule_llm_warmup(4, user_id=44) is True
+        await _warmups[4]
+        assert get_budget_usage("44")["prompt_tokens"] == 300
+
+        record_usage("44", "main/model", 1000, 0)
+        assert schedule_llm_warmup(4, user_id=44) is False
+    reset_budgets()
+
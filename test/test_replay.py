@@ -0,0 +1,105 @@
+import json
+import pytest
+from aiogram.types import Update
+from bot.recorder import UpdateRecorderMiddleware, anonymize_message
+from bot.replay import ReplaySession, StubLLMServer, diff_reports, replay, main as replay_main
+from llm.logging_utils import EventSink
+
+def make_records(chats=2, turns=3):
+    records = []
+    for chat in range(chats):
+        chat_id = 5000 + chat
+        records.append({"chat": chat_id, "chat_type": "private", "user": chat_id,
+                        "message_id": 1, "t": 100.0 + chat, "text": "/start"})
+        for turn in range(turns):
+            records.append({"chat": chat_id, "chat_type": "private", "user": chat_id,
+                            "message_id": turn + 2, "t": 101.0 + chat + turn,
+                            "text": f"Расскажите про перевод жестового языка, вопрос {turn}"})
+    return records
+
+@pytest.mark.asyncio
+async def test_recorder_anonymizes_messages(tmp_path):
+    """Тест: ID заменяются псевдонимами, имена не сохраняются, персональные данные маскируются"""
+    update = Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 7,
+            "date": 1700000000,
+            "chat": {"id": 123456, "type": "private", "first_name": "Иван"},
+            "from": {"id": 123456, "is_bot": False, "first_name": "Иван", "username": "ivan"},
+            "text": "Мой телефон +7 916 123-45-67",
+        },
+    })
+    path = tmp_path / "updates.ndjson"
+    sink = EventSink(str(path), 10 ** 6, 1)
+    sink.start()
+    middleware = UpdateRecorderMiddleware(sink)
+
+    async def handler(event, data):
+        return "ok"
+
+    assert await middleware(handler, update, {}) == "ok"
+    sink.close()
+
+    record = json.loads(path.read_text(encoding="utf-8"))
+    assert record == anonymize_message(update.message, middleware.salt)
+    assert record["chat"] == record["user"] != 123456
+    assert record["text"] == "Мой телефон [phone]"
+    assert "Иван" not in path.read_text(encoding="utf-8")
+
+@pytest.mark.asyncio
+async def test_replay_reports_metrics():
+    """Тест: воспроизведение считает запросы к LLM, токены по ходам и память на чат"""
+    report = await replay(make_records(), speed=0)
+
+    assert report["updates"] == 8
+    assert report["chats"] == 2
+    assert report["llm_calls"] == 6
+    assert report["llm_requests"] == 6
+    assert report["llm_failed"] == 0
+    # История растет, поэтому промпт каждого следующего хода длиннее
+    by_turn = report["prompt_tokens_by_turn"]
+    assert list(by_turn) == ["1", "2", "3"]
+    assert by_turn["1"] < by_turn["2"] < by_turn["3"]
+    assert report["memory"]["dialog_bytes_per_chat"] > 0
+    assert report["telegram_requests"]["SendMessage"] == 8
+
+@pytest.mark.asyncio
+async def test_replay_counts_retries():
+    """Тест: ошибки LLM видны как дополнительные вызовы сервера-заглушки"""
+    report = await replay(make_records(chats=1, turns=4), speed=0,
+                          llm=StubLLMServer(error_rate=0.5, seed=1))
+
+    assert report["llm_calls"] > report["llm_requests"] == 4
+
+@pytest.mark.asyncio
+async def test_replay_session_streams_no_content():
+    """Тест: сессия воспроизведения не загружает файлы и возвращает пустой поток"""
+    assert [chunk async for chunk in ReplaySession().stream_content("https://example.com/file")] == []
+
+def test_diff_reports():
+    """Тест сравнения отчета с базовым"""
+    baseline = {"llm_calls": 10, "latency": {"p50": 0.5}, "prompt_tokens_by_turn": {"1": 100.0}}
+    current = {"llm_calls": 12, "latency": {"p50": 0.5}, "prompt_tokens_by_turn": {"1": 80.0, "2": 90.0}}
+
+    rows = {row["metric"]: row for row in diff_reports(baseline, current)}
+
+    assert rows["llm_calls"]["delta"] == 2
+    assert rows["llm_calls"]["change"] == 0.2
+    assert rows["latency.p50"]["delta"] == 0
+    assert rows["prompt_tokens_by_turn.1"]["change"] == -0.2
+    assert rows["prompt_tokens_by_turn.2"]["baseline"] is None
+
+def test_replay_cli_with_baseline(tmp_path, capsys):
+    """Тест командной строки: сохранение базового отчета и сравнение с ним"""
+    recording = tmp_path / "updates.ndjson"
+    recording.write_text("\n".join(json.dumps(record, ensure_ascii=False) for record in make_records(1, 2)),
+                         encoding="utf-8")
+    baseline = tmp_path / "baseline.json"
+
+    assert replay_main([str(recording), "--speed", "0", "--save-baseline", str(baseline)]) == 0
+    assert json.loads(baseline.read_text(encoding="utf-8"))["llm_calls"] == 2
+
+    assert replay_main([str(recording), "--speed", "0", "--reply-chars", "1000", "--baseline", str(baseline)]) == 0
+    output = capsys.readouterr().out
+    assert "prompt_tokens_by_turn.2" in output
@@ -0,0 +1,50 @@
+import json
+import pytest
+from bot.responses import get_command_response, get_history_entry
+from llm.catalog import get_catalog, reload_catalog
+from config import get_service_catalog_path, reload_settings
+
+def test_command_responses_cached():
+    """Тест: ответы команд отрисовываются один раз и переиспользуются"""
+    first = get_command_response("services")
+    second = get_command_response("services")
+    assert first is second
+    assert "Поисковая система" in first
+
+def test_responses_rerendered_on_catalog_reload(tmp_path):
+    """Тест перерисовки ответов после перезагрузки каталога"""
+    default_path = get_service_catalog_path()
+    with open(default_path, encoding="utf-8") as f:
+        data = json.load(f)
+    data["company"]["website"] = "https://example.org/sli"
+    catalog_path = tmp_path / "catalog.json"
+    catalog_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    try:
+        assert reload_catalog(str(catalog_path))
+        assert "https://example.org/sli" in get_command_response("contact")
+        assert "https://example.org/sli" in get_command_response("services")
+    finally:
+        reload_catalog(default_path)
+
+    assert "https://example.org/sli" not in get_command_response("contact")
+
+def test_response_table_is_immutable():
+    """Тест неизменяемости таблицы ответов"""
+    table = get_catalog().derived["command_responses"]
+    with pytest.raises(TypeError):
+        table["help"] = "changed"
+
+def test_compact_history_entry(monkeypatch):
+    """Тест краткой ссылки в истории вместо полного каталога"""
+    assert get_history_entry("services") == get_command_response("services")
+
+    monkeypatch.setenv("COMPACT_COMMAND_HISTORY", "true")
+    reload_settings()
+    try:
+        entry = get_history_entry("services")
+        assert len(entry) < len(get_command_response("services"))
+        assert "Поисковая система для жестового языка" in entry
+    finally:
+        monkeypatch.undo()
+        reload_settings()
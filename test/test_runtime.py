@@ -0,0 +1,88 @@
+import asyncio
+import sys
+import types
+import pytest
+from bot import runtime
+from bot.runtime import get_runtime_info, resolve_runtime, run
+from bot.runtime_benchmark import format_results, measure_mode, synthetic_records
+
+@pytest.fixture(autouse=True)
+def restore_runtime():
+    yield
+    runtime._runtime = None
+
+@pytest.fixture
+def no_uvloop(monkeypatch):
+    """uvloop не установлен"""
+    monkeypatch.setitem(sys.modules, "uvloop", None)
+
+@pytest.fixture
+def fake_uvloop(monkeypatch):
+    """uvloop установлен: фабрика создает стандартный цикл и считает вызовы"""
+    module = types.ModuleType("uvloop")
+    module.created = 0
+
+    def new_event_loop():
+        module.created += 1
+        return asyncio.new_event_loop()
+
+    module.new_event_loop = new_event_loop
+    monkeypatch.setitem(sys.modules, "uvloop", module)
+    return module
+
+def test_uvloop_fallback_when_not_installed(no_uvloop):
+    """Тест: без uvloop используется стандартный цикл, причина сохраняется"""
+    factory, info = resolve_runtime("uvloop", False)
+
+    assert factory is None
+    assert info.loop == "asyncio"
+    assert info.fallback == "uvloop is not installed"
+
+    # В режиме auto отсутствие uvloop не считается откатом
+    assert resolve_runtime("auto", False)[1].fallback is None
+
+def test_run_uses_uvloop_factory(fake_uvloop):
+    """Тест: в режиме uvloop цикл создается фабрикой uvloop, режим виден в сведениях"""
+    async def main():
+        return get_runtime_info()["loop"]
+
+    assert run(main, "uvloop", False) == "uvloop"
+    assert fake_uvloop.created == 1
+    assert get_runtime_info()["fallback"] is None
+
+def test_eager_task_factory(monkeypatch, no_uvloop):
+    """Тест: жадная фабрика задач устанавливается, если доступна, иначе — откат"""
+    monkeypatch.delattr(asyncio, "eager_task_factory", raising=False)
+    assert resolve_runtime("asyncio", True)[1].eager_tasks is False
+
+    def eager_task_factory(loop, coro, **kwargs):
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    monkeypatch.setattr(asyncio, "eager_task_factory", eager_task_factory, raising=False)
+
+    async def main():
+        return asyncio.get_running_loop().get_task_factory()
+
+    assert run(main, "asyncio", True) is eager_task_factory
+    assert get_runtime_info()["eager_tasks"] is True
+
+def test_unknown_mode_rejected():
+    """Тест: неизвестный режим — ошибка конфигурации"""
+    with pytest.raises(ValueError):
+        resolve_runtime("trio", False)
+
+def test_benchmark_measures_mode(no_uvloop):
+    """Тест: сравнение режимов измеряет доступные и отмечает недоступные"""
+    results = [
+        measure_mode(synthetic_records(2, 1), "asyncio", False),
+        measure_mode(synthetic_records(2, 1), "uvloop", False),
+    ]
+
+    assert results[0]["loop"] == "asyncio"
+    assert results[0]["updates"] == 4
+    assert results[0]["updates_per_sec"] > 0
+    assert results[1]["unavailable"] == "uvloop is not installed"
+
+    table = format_results(results)
+    assert "+0.0%" in table
+    assert "unavailable: uvloop is not installed" in table
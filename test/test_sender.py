@@ -0,0 +1,162 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from aiogram.exceptions import TelegramRetryAfter
+from bot.sender import (
+    split_message,
+    submit_send,
+    send_text,
+    get_send_queue_stats,
+    stop_send_queue,
+    TELEGRAM_MESSAGE_LIMIT,
+)
+from config import reload_settings
+
+def test_short_message_not_split():
+    """Тест: короткое сообщение отправляется целиком"""
+    assert split_message("Привет!") == ["Привет!"]
+
+def test_split_on_paragraphs():
+    """Тест разбиения по абзацам"""
+    paragraphs = ["Абзац номер {}. ".format(i) + " ".join(["слово"] * 150) for i in range(10)]
+    text = "\n\n".join(paragraphs)
+
+    chunks = split_message(text)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= TELEGRAM_MESSAGE_LIMIT for chunk in chunks)
+    # Каждая часть начинается с начала абзаца
+    assert all(chunk.startswith("Абзац номер") for chunk in chunks)
+    assert "\n\n".join(chunks) == text
+
+def test_split_does_not_break_bold_entity():
+    """Тест: разрез не попадает внутрь **жирного** текста"""
+    text = "a" * 50 + " **очень длинный жирный текст без переносов** " + "b" * 30
+    chunks = split_message(text, limit=70)
+
+    for chunk in chunks:
+        assert chunk.count("**") % 2 == 0
+
+def test_split_counts_utf16_units():
+    """Тест: эмодзи учитываются как две единицы UTF-16"""
+    text = "😀" * 3000
+    chunks = split_message(text)
+
+    assert "".join(chunks) == text
+    assert all(len(chunk.encode("utf-16-le")) // 2 <= TELEGRAM_MESSAGE_LIMIT for chunk in chunks)
+
+def test_split_without_boundaries():
+    """Тест жесткого разреза строки без пробелов"""
+    chunks = split_message("x" * 10000)
+    assert [len(chunk) for chunk in chunks] == [4096, 4096, 1808]
+
+@pytest.fixture
+def fast_limits(monkeypatch):
+    """Лимиты отправки для тестов очереди"""
+    monkeypatch.setenv("SEND_GLOBAL_RATE", "1000")
+    monkeypatch.setenv("SEND_CHAT_RATE", "50")
+    monkeypatch.setenv("SEND_CHAT_BURST", "2")
+    monkeypatch.setenv("SEND_SHORT_REPLY_CHARS", "100")
+    reload_settings()
+    yield
+    monkeypatch.undo()
+    reload_settings()
+
+@pytest.mark.asyncio
+async def test_send_retry_after(fast_limits):
+    """Тест повторной отправки после TelegramRetryAfter"""
+    send = AsyncMock(side_effect=[TelegramRetryAfter(method=Mock(), message="Flood", retry_after=0), "ok"])
+
+    assert await submit_send(1, send) == "ok"
+    assert send.call_count == 2
+    assert get_send_queue_stats()["retry_after"] >= 1
+    await stop_send_queue()
+
+@pytest.mark.asyncio
+async def test_send_error_propagates(fast_limits):
+    """Тест: ошибка Bot API возвращается отправителю"""
+    send = AsyncMock(side_effect=RuntimeError("Bad Request"))
+
+    with pytest.raises(RuntimeError):
+        await submit_send(1, send)
+    await stop_send_queue()
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_deferred_messages(fast_limits):
+    """Тест: остановка дожидается отложенных сообщений, а не отправленные за timeout завершаются ошибкой"""
+    flood = TelegramRetryAfter(method=Mock(), message="Flood", retry_after=0.2)
+    send = AsyncMock(side_effect=[flood, "ok"])
+    delivered = asyncio.ensure_future(submit_send(1, send))
+    await asyncio.sleep(0.05)
+    assert get_send_queue_stats()["deferred_waiting"] == 1
+
+    await stop_send_queue()
+    assert await delivered == "ok"
+
+    stuck = AsyncMock(side_effect=[TelegramRetryAfter(method=Mock(), message="Flood", retry_after=60)])
+    pending = asyncio.ensure_future(submit_send(1, stuck))
+    await asyncio.sleep(0.05)
+    await stop_send_queue(timeout=0.1)
+
+    with pytest.raises(RuntimeError):
+        await pending
+    assert get_send_queue_stats()["deferred_waiting"] == 0
+
+@pytest.mark.asyncio
+async def test_per_chat_limit_does_not_block_other_chats(fast_limits):
+    """Тест: исчерпанный лимит одного чата не задерживает другие чаты"""
+    sent = []
+
+    def sender(chat_id, n):
+        async def send():
+            sent.append((chat_id, n))
+        return send
+
+    busy_chat = [asyncio.create_task(submit_send(1, sender(1, n))) for n in range(5)]
+    await asyncio.sleep(0)
+    await submit_send(2, sender(2, 0))
+
+    # Сообщение второго чата отправлено раньше, чем очередь первого чата исчерпана
+    assert (2, 0) in sent
+    assert len([item for item in sent if item[0] == 1]) < 5
+
+    await asyncio.gather(*busy_chat)
+    assert [n for chat_id, n in sent if chat_id == 1] == [0, 1, 2, 3, 4]
+    assert get_send_queue_stats()["deferred"] > 0
+    await stop_send_queue()
+
+@pytest.mark.asyncio
+async def test_short_replies_have_priority(fast_limits):
+    """Тест: короткие ответы отправляются раньше длинных текстов"""
+    message_bulk = Mock()
+    message_bulk.chat.id = 10
+    message_short = Mock()
+    message_short.chat.id = 11
+    order = []
+    message_bulk.answer = AsyncMock(side_effect=lambda text: order.append("bulk"))
+    message_short.answer = AsyncMock(side_effect=lambda text: order.append("short"))
+
+    # Оба сообщения попадают в очередь до того, как обработчик очереди успеет их выбрать
+    bulk = asyncio.create_task(send_text(message_bulk, "длинный текст " * 20))
+    short = asyncio.create_task(send_text(message_short, "Да"))
+    await asyncio.gather(bulk, short)
+
+    assert order == ["short", "bulk"]
+    stats = get_send_queue_stats()
+    assert stats["latency_max"] >= stats["latency_p50"] >= 0
+    await stop_send_queue()
+
+@pytest.mark.asyncio
+async def test_send_text_chunks_in_order(fast_limits):
+    """Тест отправки частей длинного ответа по порядку"""
+    message = Mock()
+    message.chat.id = 1
+    message.answer = AsyncMock()
+    text = "\n\n".join("Часть {}: ".format(i) + "текст " * 600 for i in range(3))
+
+    await send_text(message, text)
+
+    sent = [call.args[0] for call in message.answer.call_args_list]
+    assert len(sent) == 3
+    assert [chunk[:7] for chunk in sent] == ["Часть 0", "Часть 1", "Часть 2"]
+    await stop_send_queue()
@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from bot.shutdown import (
+    InFlightMiddleware,
+    drain_in_flight,
+    get_in_flight_count,
+    resume_accepting_updates,
+    stop_accepting_updates,
+)
+
+@pytest.fixture(autouse=True)
+def accepting_updates():
+    """Каждый тест начинается с приема обновлений"""
+    resume_accepting_updates()
+    yield
+    resume_accepting_updates()
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_in_flight_handlers():
+    """Тест: остановка дожидается обрабатываемых запросов"""
+    middleware = InFlightMiddleware()
+    finished = []
+
+    async def slow_handler(event, data):
+        await asyncio.sleep(0.05)
+        finished.append(event)
+        return "answer"
+
+    tasks = [asyncio.create_task(middleware(slow_handler, i, {})) for i in range(3)]
+    await asyncio.sleep(0)
+    assert get_in_flight_count() == 3
+
+    stop_accepting_updates()
+    assert await drain_in_flight(timeout=1.0) == 0
+    assert sorted(finished) == [0, 1, 2]
+    assert [task.result() for task in tasks] == ["answer"] * 3
+    assert get_in_flight_count() == 0
+
+@pytest.mark.asyncio
+async def test_drain_deadline():
+    """Тест: ожидание ограничено дедлайном"""
+    middleware = InFlightMiddleware()
+
+    async def stuck_handler(event, data):
+        await asyncio.sleep(10)
+
+    task = asyncio.create_task(middleware(stuck_handler, "update", {}))
+    await asyncio.sleep(0)
+
+    assert await drain_in_flight(timeout=0.01) == 1
+    task.cancel()
+
+@pytest.mark.asyncio
+async def test_new_updates_rejected_after_stop():
+    """Тест: после начала остановки новые обновления не обрабатываются"""
+    middleware = InFlightMiddleware()
+    handler = AsyncMock()
+
+    stop_accepting_updates()
+    assert await middleware(handler, "update", {}) is None
+    handler.assert_not_called()
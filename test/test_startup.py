@@ -0,0 +1,56 @@
+"""
+Проверки холодного старта: отдельный процесс python с импортом модулей проекта
+"""
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_importtime(statement: str) -> dict:
+    """
+    Выполнить импорт в отдельном процессе и разобрать вывод -X importtime
+
+    Returns:
+        Словарь {модуль: суммарное время импорта в микросекундах}
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        cumulative = cumulative.strip()
+        if cumulative.isdigit():
+            timings[module.strip()] = int(cumulative)
+    return timings
+
+def test_startup_does_not_import_llm_sdk():
+    """Тест: SDK openai и dotenv не импортируются при старте"""
+    timings = run_importtime("import main")
+    assert "openai" not in timings
+    assert "dotenv" not in timings
+    assert "main" in timings
+
+def test_handlers_import_is_lazy_and_settings_parsed_once():
+    """Тест: импорт обработчиков не загружает SDK openai, настройки разбираются один раз"""
+    statement = (
+        "import sys, config\n"
+        "calls = []\n"
+        "load = config.load_settings\n"
+        "config.load_settings = lambda: calls.append(1) or load()\n"
+        "import bot.handlers, llm.client\n"
+        "assert 'openai' not in sys.modules, 'openai imported at startup'\n"
+        "config.get_llm_model(); config.get_llm_timeout(); config.get_log_level()\n"
+        "assert config.get_settings() is config.get_settings()\n"
+        "assert len(calls) == 1, f'settings parsed {len(calls)} times'\n"
+    )
+    result = subprocess.run([sys.executable, "-c", statement], cwd=PROJECT_ROOT,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
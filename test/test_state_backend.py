@@ -0,0 +1,470 @@
+import asyncio
+import shutil
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from aiogram.types import Update
+from bot.idempotency import IdempotencyMiddleware, get_idempotency_stats, reset_idempotency
+from bot.throttling import check_rate_limit_async, get_throttle_stats, reset_throttling, should_notify_throttled
+from config import reload_settings
+from llm.memory import (
+    add_message_to_dialog_async,
+    add_message_and_get_history_async,
+    clear_dialog_history_async,
+    get_dialog_history_async,
+    get_shared_dialog_stats,
+    reset_dialogs,
+    _dialogs,
+)
+from llm.state_backend import (
+    RedisStateBackend,
+    RespClient,
+    RespConnection,
+    RespError,
+)
+
+class FakeRespServer(socketserver.ThreadingTCPServer):
+    """
+    Сервер RESP в процессе теста: подмножество команд Redis, нужное хранилищу состояния.
+    Lua-скрипты не поддерживаются — корзины токенов проверяются на настоящем redis-server
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    # Реплики в тестах открывают соединения одновременно
+    request_queue_size = 64
+
+    def __init__(self, password=None):
+        super().__init__(("127.0.0.1", 0), FakeRespHandler)
+        self.password = password
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires = {}
+        self.connections = 0
+        self.delay = 0.0
+        self.commands = []
+        self.selected_dbs = []
+
+    @property
+    def url(self):
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{self.server_address[1]}/0"
+
+    def execute(self, args):
+        command = args[0].upper().decode()
+        self.commands.append(command)
+        if command == "PING":
+            return "+PONG"
+        if command == "AUTH":
+            return "+OK" if args[1].decode() == self.password else RespError("WRONGPASS invalid password")
+        if command == "SELECT":
+            self.selected_dbs.append(int(args[1]))
+            return "+OK"
+        if command == "SET":
+            options = [arg.upper() for arg in args[3:]]
+            if b"NX" in options and args[1] in self.data:
+                return None
+            self.data[args[1]] = args[2]
+            if b"EX" in options:
+                self.expires[args[1]] = int(args[3 + options.index(b"EX") + 1])
+            return "+OK"
+        if command == "RPUSH":
+            items = self.data.setdefault(args[1], [])
+            items.extend(args[2:])
+            return len(items)
+        if command == "LTRIM":
+            items = self.data.get(args[1], [])
+            start, stop = int(args[2]), int(args[3])
+            start = max(len(items) + start, 0) if start < 0 else start
+            stop = len(items) + stop if stop < 0 else stop
+            self.data[args[1]] = items[start:stop + 1]
+            return "+OK"
+        if command == "LRANGE":
+            items = self.data.get(args[1], [])
+            start, stop = int(args[2]), int(args[3])
+            start = max(len(items) + start, 0) if start < 0 else start
+            stop = len(items) + stop if stop < 0 else stop
+            return items[start:stop + 1]
+        if command == "EXPIRE":
+            self.expires[args[1]] = int(args[2])
+            return 1
+        if command == "DEL":
+            return sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+        if command == "HINCRBY":
+            fields = self.data.setdefault(args[1], {})
+            fields[args[2]] = str(int(fields.get(args[2], b"0")) + int(args[3])).encode()
+            return int(fields[args[2]])
+        if command == "HGETALL":
+            return [item for pair in self.data.get(args[1], {}).items() for item in pair]
+        return RespError(f"ERR unknown command '{command}'")
+
+class FakeredisRespServer(FakeRespServer):
+    """
+    Сервер RESP в процессе теста, выполняющий команды (включая Lua-скрипты) в fakeredis.
+    Собственный TCP-сервер fakeredis закрывает соединение после ответа с ошибкой, поэтому не подходит
+    """
+
+    def __init__(self, redis):
+        super().__init__()
+        self.redis = redis
+        self.redis.response_callbacks.clear()
+
+    def execute(self, args):
+        try:
+            reply = self.redis.execute_command(*args)
+        except Exception as e:
+            prefix = "NOSCRIPT" if type(e).__name__ == "NoScriptError" else "ERR"
+            return RespError(f"{prefix} {e}")
+        if isinstance(reply, dict):
+            return [item for pair in reply.items() for item in pair]
+        return reply
+
+class FakeRespHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def encode(self, reply):
+        if isinstance(reply, RespError):
+            return b"-%s\r\n" % str(reply).encode()
+        if isinstance(reply, str):
+            return reply.encode() + b"\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        return b"*%d\r\n" % len(reply) + b"".join(self.encode(item) for item in reply)
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            time.sleep(self.server.delay)
+            with self.server.lock:
+                reply = self.server.execute(args)
+            self.wfile.write(self.encode(reply))
+
+@pytest.fixture
+def resp_server(monkeypatch):
+    """Хранилище состояния на локальном сервере RESP"""
+    server = FakeRespServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("REDIS_URL", server.url)
+    monkeypatch.setenv("REDIS_KEY_PREFIX", "test:")
+    monkeypatch.setenv("DIALOG_MAX_MESSAGES", "4")
+    reload_settings()
+    reset_dialogs()
+    reset_throttling()
+    yield server
+    reset_throttling()
+    monkeypatch.undo()
+    reload_settings()
+    server.shutdown()
+    server.server_close()
+
+def _start_redis_server(binary, data_dir):
+    """Запустить redis-server на свободном порту; None, если сервер не запустился"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [binary, "--port", str(port), "--bind", "127.0.0.1", "--save", "", "--appendonly", "no",
+         "--dir", str(data_dir)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 5
+    while process.poll() is None and time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process, f"redis://127.0.0.1:{port}/0"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    process.wait()
+    return None, None
+
+@pytest.fixture(scope="module")
+def redis_server_url(tmp_path_factory):
+    """
+    Сервер с поддержкой Lua для проверки скрипта корзин токенов: redis-server,
+    если установлен, иначе fakeredis с lupa; пропуск, если нет ни того, ни другого
+    """
+    binary = shutil.which("redis-server")
+    if binary is not None:
+        process, url = _start_redis_server(binary, tmp_path_factory.mktemp("redis"))
+        if process is None:
+            pytest.skip("redis-server did not start")
+        yield url
+        process.terminate()
+        process.wait()
+        return
+
+    fakeredis = pytest.importorskip("fakeredis", reason="neither redis-server nor fakeredis is installed")
+    pytest.importorskip("lupa", reason="fakeredis needs lupa to run Lua scripts")
+    server = FakeredisRespServer(fakeredis.FakeRedis())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.url
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def redis_backend(redis_server_url, monkeypatch, request):
+    """Хранилище состояния на настоящем redis-server; у каждого теста свой префикс ключей"""
+    prefix = f"test:{request.node.name}:"
+    monkeypatch.setenv("REDIS_URL", redis_server_url)
+    monkeypatch.setenv("REDIS_KEY_PREFIX", prefix)
+    reload_settings()
+    reset_throttling()
+    yield prefix
+    reset_throttling()
+    monkeypatch.undo()
+    reload_settings()
+
+@pytest.fixture
+def round_trips(monkeypatch):
+    """Счетчик сетевых обменов (пакетов команд, отправленных клиентом)"""
+    sent = []
+    original = RespConnection.send
+
+    async def send(self, commands):
+        sent.append(len(commands))
+        return await original(self, commands)
+
+    monkeypatch.setattr(RespConnection, "send", send)
+    return sent
+
+@pytest.mark.asyncio
+async def test_history_capped_in_shared_store(resp_server):
+    """Тест: история хранится в общем хранилище и ограничена DIALOG_MAX_MESSAGES"""
+    for i in range(6):
+        await add_message_to_dialog_async(1, "user", f"Сообщение {i}")
+
+    assert [msg["content"] for msg in await get_dialog_history_async(1)] == [f"Сообщение {i}" for i in range(2, 6)]
+    assert (await get_dialog_history_async(1, max_messages=2))[0] == {"role": "user", "content": "Сообщение 4"}
+    assert len(resp_server.data[b"test:dialog:1"]) == 4
+    assert resp_server.expires[b"test:dialog:1"] == 7 * 24 * 3600
+    # В памяти процесса диалоги не хранятся
+    assert 1 not in _dialogs
+
+    await clear_dialog_history_async(1)
+    assert await get_dialog_history_async(1) == []
+
+@pytest.mark.asyncio
+async def test_replicas_share_history(resp_server):
+    """Тест: другая реплика видит тот же диалог"""
+    await add_message_to_dialog_async(2, "user", "Привет!")
+    await add_message_to_dialog_async(2, "assistant", "Здравствуйте!")
+
+    replica = RedisStateBackend(RespClient(resp_server.url, 2, 1.0), "test:", 0)
+    assert await replica.get_history(2, 10) == [
+        {"role": "user", "content": "Привет!"},
+        {"role": "assistant", "content": "Здравствуйте!"},
+    ]
+
+    shared = await get_shared_dialog_stats()
+    assert shared["messages_added"] == 2
+    assert shared["role:assistant"] == 1
+
+@pytest.mark.asyncio
+async def test_one_round_trip_per_turn(resp_server, round_trips):
+    """Тест: сообщение добавляется и история читается за один сетевой обмен"""
+    await add_message_and_get_history_async(3, "user", "Первый вопрос")
+    round_trips.clear()
+
+    history = await add_message_and_get_history_async(3, "user", "Второй вопрос", max_messages=10)
+
+    assert [msg["content"] for msg in history] == ["Первый вопрос", "Второй вопрос"]
+    assert len(round_trips) == 1
+    assert round_trips[0] > 1
+
+@pytest.mark.asyncio
+async def test_backend_calls_do_not_block_event_loop(resp_server):
+    """Тест: пока хранилище отвечает медленно, цикл событий продолжает обрабатывать другие задачи"""
+    resp_server.delay = 0.05
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        await add_message_and_get_history_async(4, "user", "Привет!")
+    finally:
+        task.cancel()
+
+    assert ticks >= 10
+
+@pytest.mark.asyncio
+async def test_backend_calls_do_not_use_thread_pool(resp_server):
+    """Тест: обмен с хранилищем не ждет освобождения потоков, занятых запросами к LLM"""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop.set_default_executor(executor)
+    # Единственный поток пула занят «долгим запросом к LLM»
+    llm_call = asyncio.ensure_future(asyncio.to_thread(time.sleep, 1.0))
+    await asyncio.sleep(0)
+
+    start = time.monotonic()
+    await add_message_and_get_history_async(5, "user", "Привет!")
+    await get_dialog_history_async(5)
+    elapsed = time.monotonic() - start
+
+    await llm_call
+    assert elapsed < 0.5
+
+@pytest.mark.asyncio
+async def test_interrupted_request_does_not_reuse_connection(resp_server):
+    """Тест: после прерванного обмена соединение закрывается, следующий запрос не читает чужой ответ"""
+    client = RespClient(resp_server.url, 1, 1.0)
+    resp_server.delay = 0.2
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(client.execute("HGETALL", "missing"), 0.05)
+
+    resp_server.delay = 0.0
+    assert await client.execute("PING") == "PONG"
+    assert resp_server.connections == 2
+    client.close()
+
+@pytest.mark.asyncio
+async def test_shared_token_bucket_is_atomic(redis_backend, redis_server_url):
+    """Тест: параллельные проверки с разных реплик не превышают общий лимит (Lua-скрипт на redis-server)"""
+    replicas = [RedisStateBackend(RespClient(redis_server_url, 4, 1.0), redis_backend, 0) for _ in range(4)]
+
+    results = await asyncio.gather(*(
+        backend.check_rate_limit(7, 70, 5, 0.001, 100, 1.0, 60, now=1000.0)
+        for backend in replicas for _ in range(5)
+    ))
+
+    assert results.count(None) == 5
+    assert results.count("user") == 15
+    for backend in replicas:
+        backend.client.close()
+
+@pytest.mark.asyncio
+async def test_rate_limit_through_shared_store(redis_backend, monkeypatch):
+    """Тест: check_rate_limit_async использует общие корзины, восполняет их со временем и уведомляет один раз"""
+    monkeypatch.setenv("THROTTLE_USER_BURST", "2")
+    monkeypatch.setenv("THROTTLE_USER_RATE", "1.0")
+    monkeypatch.setenv("THROTTLE_CHAT_BURST", "10")
+    reload_settings()
+
+    assert await check_rate_limit_async(8, 80, now=500.0) is None
+    assert await check_rate_limit_async(8, 80, now=500.0) is None
+    assert await check_rate_limit_async(8, 80, now=500.0) == "user"
+    assert should_notify_throttled(8) is True
+    assert should_notify_throttled(8) is False
+    # Через секунду восполняется один токен
+    assert await check_rate_limit_async(8, 80, now=501.0) is None
+    # Лимит чата действует для всех его участников
+    monkeypatch.setenv("THROTTLE_CHAT_BURST", "1")
+    reload_settings()
+    assert await check_rate_limit_async(9, 90, now=500.0) is None
+    assert await check_rate_limit_async(10, 90, now=500.0) == "chat"
+
+    stats = get_throttle_stats()
+    assert stats["allowed"] == 4
+    assert stats["throttled_user"] == 1
+    assert stats["throttled_chat"] == 1
+
+@pytest.mark.asyncio
+async def test_update_processed_once_across_replicas(resp_server):
+    """Тест: обновление, доставленное двум репликам, обрабатывается один раз; после ошибки — снова"""
+    update = Update.model_validate({
+        "update_id": 11,
+        "message": {"message_id": 5, "date": 0, "chat": {"id": 110, "type": "private"},
+                    "from": {"id": 1, "is_bot": False, "first_name": "Test"}, "text": "Привет!"},
+    })
+    calls = []
+
+    async def failing(event, data):
+        calls.append("failed")
+        raise RuntimeError("handler failed")
+
+    async def handler(event, data):
+        calls.append("handled")
+        return "answer"
+
+    reset_idempotency()
+    with pytest.raises(RuntimeError):
+        await IdempotencyMiddleware()(failing, update, {})
+    assert await IdempotencyMiddleware()(handler, update, {}) == "answer"
+    # Другая реплика: локальное окно в памяти пустое
+    reset_idempotency()
+    assert await IdempotencyMiddleware()(handler, update, {}) is None
+
+    assert calls == ["failed", "handled"]
+    assert get_idempotency_stats()["duplicates_skipped"] == 1
+    assert resp_server.expires[b"test:update:11"] == 600
+    assert b"test:update:message:110:5" in resp_server.data
+    reset_idempotency()
+
+@pytest.mark.asyncio
+async def test_script_reloaded_after_noscript(redis_backend, redis_server_url):
+    """Тест: скрипт загружается при первом вызове и после сброса кэша скриптов сервера"""
+    backend = RedisStateBackend(RespClient(redis_server_url, 1, 1.0), redis_backend, 0)
+    assert await backend.check_rate_limit(9, 90, 2, 1.0, 2, 1.0, 60, now=0.0) is None
+
+    await backend.client.execute("SCRIPT", "FLUSH")
+    assert await backend.check_rate_limit(9, 90, 2, 1.0, 2, 1.0, 60, now=0.0) is None
+    assert await backend.check_rate_limit(9, 90, 2, 1.0, 2, 1.0, 60, now=0.0) == "user"
+    backend.client.close()
+
+@pytest.mark.asyncio
+async def test_pool_bounds_connections(resp_server):
+    """Тест: число соединений не превышает размер пула"""
+    client = RespClient(resp_server.url, 2, 1.0)
+
+    async def worker():
+        for _ in range(20):
+            assert await client.execute("PING") == "PONG"
+
+    await asyncio.gather(*(worker() for _ in range(8)))
+
+    assert resp_server.connections <= 2
+    client.close()
+
+@pytest.mark.asyncio
+async def test_auth_and_select_from_url():
+    """Тест: пароль и номер базы берутся из адреса хранилища"""
+    server = FakeRespServer(password="secret")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        port = server.server_address[1]
+        client = RespClient(f"redis://:secret@127.0.0.1:{port}/3", 1, 1.0)
+        assert await client.execute("PING") == "PONG"
+        assert server.selected_dbs == [3]
+        client.close()
+
+        with pytest.raises(RespError):
+            await RespClient(f"redis://:wrong@127.0.0.1:{port}/0", 1, 1.0).execute("PING")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@pytest.mark.asyncio
+async def test_memory_backend_by_default():
+    """Тест: без REDIS_URL диалоги хранятся в памяти процесса"""
+    reset_dialogs()
+    history = await add_message_and_get_history_async(10, "user", "Привет!")
+
+    assert history == [{"role": "user", "content": "Привет!"}]
+    assert 10 in _dialogs
+    assert await get_shared_dialog_stats() is None
+    reset_dialogs()
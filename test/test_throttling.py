@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import Mock, AsyncMock
+from aiogram.types import Message, Chat, User
+from bot.throttling import (
+    ThrottlingMiddleware,
+    check_rate_limit,
+    get_throttle_stats,
+    reset_throttling,
+    THROTTLED_MESSAGE,
+    _user_buckets,
+)
+from config import reload_settings
+
+@pytest.fixture(autouse=True)
+def throttle_env(monkeypatch):
+    """Фиксированные лимиты для тестов"""
+    monkeypatch.setenv("THROTTLE_USER_BURST", "2")
+    monkeypatch.setenv("THROTTLE_USER_RATE", "1.0")
+    monkeypatch.setenv("THROTTLE_CHAT_BURST", "3")
+    monkeypatch.setenv("THROTTLE_CHAT_RATE", "1.0")
+    monkeypatch.setenv("THROTTLE_IDLE_TTL", "60")
+    reload_settings()
+    reset_throttling()
+    yield
+    reset_throttling()
+    monkeypatch.undo()
+    reload_settings()
+
+def test_user_burst_and_refill():
+    """Тест исчерпания и восполнения лимита пользователя"""
+    assert check_rate_limit(1, 100, now=0.0) is None
+    assert check_rate_limit(1, 100, now=0.0) is None
+    assert check_rate_limit(1, 100, now=0.0) == "user"
+
+    # Через секунду восполняется один токен
+    assert check_rate_limit(1, 100, now=1.0) is None
+    assert check_rate_limit(1, 100, now=1.0) == "user"
+
+    stats = get_throttle_stats()
+    assert stats["allowed"] == 3
+    assert stats["throttled_user"] == 2
+
+def test_chat_limit_shared_by_users():
+    """Тест общего лимита чата для разных пользователей"""
+    assert check_rate_limit(1, 100, now=0.0) is None
+    assert check_rate_limit(2, 100, now=0.0) is None
+    assert check_rate_limit(3, 100, now=0.0) is None
+    assert check_rate_limit(4, 100, now=0.0) == "chat"
+    assert get_throttle_stats()["throttled_chat"] == 1
+
+def test_idle_buckets_evicted():
+    """Тест вытеснения простаивающих корзин"""
+    check_rate_limit(1, 100, now=0.0)
+    check_rate_limit(2, 200, now=30.0)
+    check_rate_limit(3, 300, now=70.0)
+
+    assert 1 not in _user_buckets
+    assert 2 in _user_buckets
+    assert get_throttle_stats()["evicted"] == 2  # корзины пользователя и чата
+
+@pytest.mark.asyncio
+async def test_middleware_blocks_without_calling_handler():
+    """Тест: заблокированное сообщение не доходит до обработчика, уведомление отправляется один раз"""
+    message = Mock(spec=Message)
+    message.chat = Mock(spec=Chat)
+    message.chat.id = 100
+    message.from_user = Mock(spec=User)
+    message.from_user.id = 1
+    message.answer = AsyncMock()
+    handler = AsyncMock(return_value="ok")
+    middleware = ThrottlingMiddleware()
+
+    for _ in range(4):
+        await middleware(handler, message, {})
+
+    assert handler.call_count == 2
+    message.answer.assert_called_once_with(THROTTLED_MESSAGE)
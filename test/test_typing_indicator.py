@@ -0,0 +1,97 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from aiogram.enums import ChatAction
+from bot.sender import stop_send_queue, MAX_CONCURRENT_SENDS
+from bot.typing_indicator import typing_indicator, get_typing_stats, _active
+from config import reload_settings
+
+@pytest.fixture
+def fast_typing(monkeypatch):
+    """Частое обновление статуса и быстрые лимиты отправки"""
+    monkeypatch.setenv("TYPING_INTERVAL", "0.02")
+    monkeypatch.setenv("SEND_GLOBAL_RATE", "1000")
+    monkeypatch.setenv("SEND_CHAT_RATE", "1000")
+    monkeypatch.setenv("SEND_CHAT_BURST", "100")
+    reload_settings()
+    yield
+    monkeypatch.undo()
+    reload_settings()
+
+def make_message(chat_id):
+    message = Mock()
+    message.chat.id = chat_id
+    message.bot.send_chat_action = AsyncMock()
+    return message
+
+@pytest.mark.asyncio
+async def test_typing_refreshed_during_generation(fast_typing):
+    """Тест: статус отправляется сразу и обновляется, пока идет генерация"""
+    message = make_message(701)
+
+    async with typing_indicator(message):
+        await asyncio.sleep(0.1)
+    calls = message.bot.send_chat_action.await_count
+
+    assert calls >= 3
+    message.bot.send_chat_action.assert_awaited_with(chat_id=701, action=ChatAction.TYPING)
+
+    # После ответа статус больше не отправляется
+    await asyncio.sleep(0.06)
+    assert message.bot.send_chat_action.await_count == calls
+    assert 701 not in _active
+    await stop_send_queue()
+
+@pytest.mark.asyncio
+async def test_many_chats_share_one_ticker(fast_typing):
+    """Тест: много чатов обслуживаются одной задачей, а не таймером на чат"""
+    sent = set()
+
+    async def send_chat_action(chat_id, action):
+        sent.add(chat_id)
+
+    messages = [make_message(800 + i) for i in range(200)]
+    for message in messages:
+        message.bot.send_chat_action = send_chat_action
+    tasks_before = len(asyncio.all_tasks())
+
+    async def generate(message):
+        async with typing_indicator(message):
+            await asyncio.sleep(0.3)
+
+    generations = [asyncio.create_task(generate(message)) for message in messages]
+    await asyncio.sleep(0.01)
+    # Задачи генераций + общая задача статуса + обработчик очереди и ее отправки в процессе
+    assert len(asyncio.all_tasks()) - tasks_before <= len(messages) + 2 + MAX_CONCURRENT_SENDS
+
+    await asyncio.gather(*generations)
+    assert sent == {message.chat.id for message in messages}
+    await stop_send_queue()
+
+@pytest.mark.asyncio
+async def test_resend_during_generation_counted(fast_typing):
+    """Тест: сообщение в чат во время генерации учитывается как повторная отправка"""
+    message = make_message(901)
+    resends_before = get_typing_stats()["resends"]
+
+    async with typing_indicator(message):
+        async with typing_indicator(message):
+            pass
+        assert 901 in _active
+
+    assert get_typing_stats()["resends"] == resends_before + 1
+    assert 901 not in _active
+    await stop_send_queue()
+
+@pytest.mark.asyncio
+async def test_typing_disabled(fast_typing, monkeypatch):
+    """Тест: при отключенном статусе действия не отправляются, а повторы учитываются"""
+    monkeypatch.setenv("TYPING_INDICATOR_ENABLED", "false")
+    reload_settings()
+    message = make_message(902)
+
+    async with typing_indicator(message):
+        await asyncio.sleep(0.05)
+
+    message.bot.send_chat_action.assert_not_awaited()
+    await stop_send_queue()